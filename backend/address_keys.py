@@ -0,0 +1,28 @@
+# Address normalisation shared by app.py and build_gazetteer.py. Standard library only and no side
+# effects on import, so the offline builder doesn't start the Flask app.
+import re
+import unicodedata
+
+_ADDRESS_NOISE_TOKENS = {"רחוב", "רח", "ישראל", "israel", "street", "st"}
+_HEBREW_POINTING_RE = re.compile(r'[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]')
+
+# The .npy tables build_gazetteer.py writes and the Gazetteer memory-maps.
+GAZETTEER_FILES = ("keys", "key_offsets", "key_coords", "key_streets", "street_offsets", "numbers", "number_coords",
+                   "prefixes", "prefix_offsets", "labels", "label_offsets", "prefix_weights")
+
+def normalize_address(address: str) -> str:
+    # Order-insensitive key: "רחוב דיזנגוף 100, תל אביב" and "תל אביב, דיזנגוף 100" map to the same entry.
+    text = unicodedata.normalize('NFKC', address or '').lower()
+    text = _HEBREW_POINTING_RE.sub('', text.replace('\u05BE', ' '))
+    text = re.sub(r'[^\w\s]|_', ' ', text)
+    tokens = [t for t in text.split() if t not in _ADDRESS_NOISE_TOKENS]
+    words = sorted(t for t in tokens if not t.isdigit())
+    numbers = [t for t in tokens if t.isdigit()]
+    return f"{' '.join(words)}#{' '.join(numbers)}"
+
+def gazetteer_prefix_key(text: str) -> str:
+    # normalize_address without the reordering, for prefix matching what a user is typing.
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _HEBREW_POINTING_RE.sub('', text.replace('\u05BE', ' '))
+    text = re.sub(r'[^\w\s]|_', ' ', text)
+    return ' '.join(t for t in text.split() if t not in _ADDRESS_NOISE_TOKENS)
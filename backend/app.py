@@ -1,17 +1,42 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Optional, Dict
 import urllib.parse
 import logging
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 import math
+import bisect
+import itertools
 from datetime import datetime, timedelta
 import re 
 import polyline
+import numpy as np
+import sqlite3
+import threading
+import time
+import uuid
+import json
+import csv
+import io
+import queue
+import multiprocessing
+import asyncio
+import contextvars
+import random
+try:
+    import fcntl
+except ImportError:  # Windows: the precompute lock is per-process only
+    fcntl = None
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from address_keys import GAZETTEER_FILES, gazetteer_prefix_key, normalize_address
 
 # --- Configuration & Initialization ---
 
@@ -31,6 +56,55 @@ if not ORS_API_KEY:
     logger.error("OPENROUTESERVICE_API_KEY environment variable not found. Please set it in backend/.env")
     raise ValueError("OPENROUTESERVICE_API_KEY not found in environment variables")
 
+CACHE_DIR = os.getenv('BACKEND_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', os.path.join(CACHE_DIR, 'geocode_cache.sqlite3'))
+GEOCODE_NEGATIVE_TTL_SECONDS = int(os.getenv('GEOCODE_NEGATIVE_TTL_SECONDS', '600'))
+GAZETTEER_DIR = os.getenv('GAZETTEER_DIR', os.path.join(CACHE_DIR, 'gazetteer'))
+ORS_MAX_WORKERS = int(os.getenv('ORS_MAX_WORKERS', '8'))
+MATRIX_PAIR_CACHE_SIZE = int(os.getenv('MATRIX_PAIR_CACHE_SIZE', '500000'))
+ORS_MATRIX_MAX_ELEMENTS = int(os.getenv('ORS_MATRIX_MAX_ELEMENTS', '3500'))
+ORS_MATRIX_REQUESTS_PER_MINUTE = float(os.getenv('ORS_MATRIX_REQUESTS_PER_MINUTE', '40'))
+ORS_GEOCODE_REQUESTS_PER_MINUTE = float(os.getenv('ORS_GEOCODE_REQUESTS_PER_MINUTE', '100'))
+ORS_DIRECTIONS_REQUESTS_PER_MINUTE = float(os.getenv('ORS_DIRECTIONS_REQUESTS_PER_MINUTE', '40'))
+ORS_RETRIES = int(os.getenv('ORS_RETRIES', '2'))
+ORS_RETRY_BASE_SECONDS = float(os.getenv('ORS_RETRY_BASE_SECONDS', '0.5'))
+ORS_RETRY_AFTER_MAX_SECONDS = float(os.getenv('ORS_RETRY_AFTER_MAX_SECONDS', '30'))
+ORS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('ORS_CIRCUIT_FAILURE_THRESHOLD', '5'))
+ORS_CIRCUIT_RESET_SECONDS = float(os.getenv('ORS_CIRCUIT_RESET_SECONDS', '30'))
+ORS_REQUEST_DEADLINE_SECONDS = float(os.getenv('ORS_REQUEST_DEADLINE_SECONDS', '20'))
+ORS_BATCH_DEADLINE_SECONDS = float(os.getenv('ORS_BATCH_DEADLINE_SECONDS', '180'))
+ORS_ASYNC_MAX_CONNECTIONS = int(os.getenv('ORS_ASYNC_MAX_CONNECTIONS', '64'))
+ASGI_FLASK_WORKERS = int(os.getenv('ASGI_FLASK_WORKERS', '16'))
+ORS_DIRECTIONS_MAX_WAYPOINTS = int(os.getenv('ORS_DIRECTIONS_MAX_WAYPOINTS', '50'))
+ROUTE_LEG_CACHE_SIZE = int(os.getenv('ROUTE_LEG_CACHE_SIZE', '20000'))
+ROUTE_GEOMETRY_CACHE_SIZE = int(os.getenv('ROUTE_GEOMETRY_CACHE_SIZE', '2000'))
+ROUTE_GEOMETRY_MAX_HANDLES = int(os.getenv('ROUTE_GEOMETRY_MAX_HANDLES', '50'))
+ROUTE_GEOMETRY_MAX_WAYPOINTS = int(os.getenv('ROUTE_GEOMETRY_MAX_WAYPOINTS', '200'))
+DIRECTIONS_CACHE_SIZE = int(os.getenv('DIRECTIONS_CACHE_SIZE', '5000'))
+SOLVER_PROCESSES = int(os.getenv('SOLVER_PROCESSES', str(os.cpu_count() or 2)))
+OPTIMIZATION_JOB_WORKERS = int(os.getenv('OPTIMIZATION_JOB_WORKERS', '4'))
+OPTIMIZATION_JOB_TTL_SECONDS = int(os.getenv('OPTIMIZATION_JOB_TTL_SECONDS', '3600'))
+SOLVER_TIME_LIMIT_MIN_SECONDS = float(os.getenv('SOLVER_TIME_LIMIT_MIN_SECONDS', '1'))
+SOLVER_TIME_LIMIT_MAX_SECONDS = float(os.getenv('SOLVER_TIME_LIMIT_MAX_SECONDS', '60'))
+SOLVER_TIME_LIMIT_SECONDS_PER_NODE = float(os.getenv('SOLVER_TIME_LIMIT_SECONDS_PER_NODE', '0.05'))
+SOLVER_PLATEAU_SECONDS = float(os.getenv('SOLVER_PLATEAU_SECONDS', '2'))
+DECOMPOSITION_AUTO_MIN_TASKS = int(os.getenv('DECOMPOSITION_AUTO_MIN_TASKS', '300'))
+DECOMPOSITION_TASKS_PER_CLUSTER = int(os.getenv('DECOMPOSITION_TASKS_PER_CLUSTER', '60'))
+DECOMPOSITION_BOUNDARY_RATIO = float(os.getenv('DECOMPOSITION_BOUNDARY_RATIO', '0.8'))
+DRIVER_CANDIDATE_POOL = int(os.getenv('DRIVER_CANDIDATE_POOL', '25'))
+BULK_ASSIGN_EARLY_ARRIVAL_MINUTES = float(os.getenv('BULK_ASSIGN_EARLY_ARRIVAL_MINUTES', '15'))
+DEFAULT_VEHICLE_CAPACITY = int(os.getenv('DEFAULT_VEHICLE_CAPACITY', '4'))
+RIDE_IMPORT_BATCH_SIZE = int(os.getenv('RIDE_IMPORT_BATCH_SIZE', '100'))
+LOCATION_MERGE_METERS = float(os.getenv('LOCATION_MERGE_METERS', '25'))
+LOCATION_REGISTRY_PATH = os.getenv('LOCATION_REGISTRY_PATH', os.path.join(CACHE_DIR, 'location_registry.sqlite3'))
+LOCATION_REGISTRY_MIN_USES = int(os.getenv('LOCATION_REGISTRY_MIN_USES', '3'))
+LOCATION_REGISTRY_MAX_LOCATIONS = int(os.getenv('LOCATION_REGISTRY_MAX_LOCATIONS', '2000'))
+PRECOMPUTED_MATRIX_PATH = os.getenv('PRECOMPUTED_MATRIX_PATH', os.path.join(CACHE_DIR, 'precomputed_matrix.npy'))
+PRECOMPUTED_MATRIX_REFRESH_SECONDS = int(os.getenv('PRECOMPUTED_MATRIX_REFRESH_SECONDS', '300'))
+ROAD_DISTANCE_FACTOR = float(os.getenv('ROAD_DISTANCE_FACTOR', '1.3'))
+APPROXIMATE_SPEED_KMH = float(os.getenv('APPROXIMATE_SPEED_KMH', '48'))
+APPROXIMATE_MATRIX_FALLBACK = os.getenv('APPROXIMATE_MATRIX_FALLBACK', 'true').lower() == 'true'
+
 # --- In-memory Mock Data Store (for demo purposes) ---
 mock_drivers_data = {
     "driver1": {
@@ -206,29 +280,915 @@ mock_drivers_data = {
 
 mock_rides_data = {}
 
+# --- Geocoding Cache ---
+
+class GeocodeCache:
+    def __init__(self, path: str, negative_ttl_seconds: int):
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "address_key TEXT PRIMARY KEY, latitude REAL, longitude REAL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        # Returns (found, coords); a found entry with coords None is a remembered negative result.
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, created_at FROM geocode_cache WHERE address_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, None
+            latitude, longitude, created_at = row
+            if latitude is None or longitude is None:
+                if time.time() - created_at > self.negative_ttl_seconds:
+                    self.misses += 1
+                    return False, None
+                self.negative_hits += 1
+                return True, None
+            self.hits += 1
+            return True, (latitude, longitude)
+
+    def put(self, key: str, coords: Optional[Tuple[float, float]]):
+        latitude, longitude = coords if coords else (None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (address_key, latitude, longitude, created_at) VALUES (?, ?, ?, ?)",
+                (key, latitude, longitude, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, negative_entries = self._conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(latitude) FROM geocode_cache"
+            ).fetchone()
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "negative_entries": negative_entries
+            }
+
+geocode_cache = GeocodeCache(GEOCODE_CACHE_PATH, GEOCODE_NEGATIVE_TTL_SECONDS)
+
+# --- Offline Gazetteer ---
+
+class MappedStrings:
+    # Strings in one memory-mapped UTF-8 blob with an offsets array, sorted by their UTF-8 bytes, so
+    # lookups bisect without decoding the table.
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode('utf-8')
+
+    def bisect_left(self, key: bytes) -> int:
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, key: str) -> Optional[int]:
+        encoded = key.encode('utf-8')
+        i = self.bisect_left(encoded)
+        return i if i < len(self) and self.raw(i) == encoded else None
+
+class Gazetteer:
+    # Israeli addresses from an OSM extract, built offline by build_gazetteer.py into GAZETTEER_DIR and
+    # memory-mapped read-only. Address keys are normalize_address() keys for every Hebrew/Latin
+    # street x city name combination; street keys (no house number) carry the street's numbered points,
+    # so a missing number is interpolated between its neighbours on the same side of the street. Numbers
+    # outside the street's known range are misses, left to ORS.
+    # Autocomplete bisects a sorted table of street-and-city prefixes. Missing directory: disabled.
+    FILES = GAZETTEER_FILES
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._tables = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> Optional[Dict]:
+        if self._loaded:
+            return self._tables
+        with self._lock:
+            if not self._loaded:
+                try:
+                    arrays = {name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r') for name in self.FILES}
+                    self._tables = {
+                        **arrays,
+                        "keys": MappedStrings(arrays["keys"], arrays["key_offsets"]),
+                        "prefixes": MappedStrings(arrays["prefixes"], arrays["prefix_offsets"]),
+                        "labels": MappedStrings(arrays["labels"], arrays["label_offsets"])
+                    }
+                    logger.info(f"GAZETTEER: Loaded {len(self._tables['keys'])} keys from {self.path}.")
+                except FileNotFoundError:
+                    logger.info(f"GAZETTEER: No gazetteer at {self.path}, geocoding through ORS only.")
+                except Exception as e:
+                    logger.error(f"GAZETTEER: Could not load {self.path}, geocoding through ORS only: {e!r}")
+                    self._tables = None
+                self._loaded = True
+        return self._tables
+
+    def geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        tables = self._load()
+        if tables is None:
+            return None
+        key = normalize_address(address)
+        i = tables["keys"].find(key)
+        if i is not None and tables["key_streets"][i] < 0:
+            self.hits += 1
+            return tuple(float(v) for v in tables["key_coords"][i])
+        words, numbers = key.split('#')
+        street = tables["keys"].find(f"{words}#")
+        coords = None
+        if street is not None:
+            if not numbers:
+                coords = tuple(float(v) for v in tables["key_coords"][street])
+            else:
+                # The house number comes first; later numbers are postcodes and the like
+                coords = self._interpolate(tables, int(tables["key_streets"][street]), int(numbers.split()[0]))
+        if coords is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return coords
+
+    @staticmethod
+    def _interpolate(tables: Dict, street: int, number: int) -> Optional[Tuple[float, float]]:
+        start, end = tables["street_offsets"][street], tables["street_offsets"][street + 1]
+        numbers = np.asarray(tables["numbers"][start:end])
+        coords = np.asarray(tables["number_coords"][start:end], dtype=float)
+        same_side = numbers % 2 == number % 2
+        if same_side.any() and numbers[same_side][0] <= number <= numbers[same_side][-1]:
+            numbers, coords = numbers[same_side], coords[same_side]
+        if not len(numbers) or not numbers[0] <= number <= numbers[-1]:
+            return None
+        position = int(np.searchsorted(numbers, number))
+        if numbers[position] == number:
+            return tuple(coords[position].tolist())
+        low, high = numbers[position - 1], numbers[position]
+        fraction = (number - low) / (high - low)
+        return tuple((coords[position - 1] + fraction * (coords[position] - coords[position - 1])).tolist())
+
+    def autocomplete(self, query: str, limit: int = 10, scan: int = 200) -> List[str]:
+        # "street [number], city" suggestions for the typed prefix, busiest streets first. A trailing house
+        # number is kept out of the prefix and put back into the labels.
+        tables = self._load()
+        if tables is None:
+            return []
+        prefix = gazetteer_prefix_key(query)
+        tokens = prefix.split()
+        number = tokens.pop() if len(tokens) > 1 and tokens[-1].isdigit() else None
+        prefix = ' '.join(tokens)
+        if not prefix:
+            return []
+        encoded = prefix.encode('utf-8')
+        first = tables["prefixes"].bisect_left(encoded)
+        matches = []
+        for i in range(first, min(first + scan, len(tables["prefixes"]))):
+            if not tables["prefixes"].raw(i).startswith(encoded):
+                break
+            matches.append(i)
+        matches.sort(key=lambda i: -int(tables["prefix_weights"][i]))
+        suggestions = []
+        for i in matches:
+            street, city = tables["labels"][i].split('\t')
+            suggestions.append(f"{street} {number}, {city}" if number else f"{street}, {city}")
+        return list(dict.fromkeys(suggestions))[:limit]
+
+    def stats(self) -> Dict:
+        tables = self._load()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": tables is not None,
+            "keys": len(tables["keys"]) if tables else 0,
+            "streets": len(tables["street_offsets"]) - 1 if tables else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+gazetteer = Gazetteer(GAZETTEER_DIR)
+
+# --- Approximate Distances ---
+
+def haversine_matrix_km(source_coords, destination_coords) -> np.ndarray:
+    # Great-circle km between every source and every destination ((lat, lon) sequences or N x 2 arrays).
+    sources = np.radians(np.asarray(source_coords, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destination_coords, dtype=float).reshape(-1, 2))
+    lat1, lon1 = sources[:, 0:1], sources[:, 1:2]
+    lat2, lon2 = destinations[:, 0], destinations[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def haversine_km(origin: Tuple[float, float], coords: np.ndarray) -> np.ndarray:
+    return haversine_matrix_km([origin], coords)[0]
+
+def approximate_matrix(source_coords, destination_coords) -> Dict:
+    # Same shape and units as build_matrix (seconds, meters): great-circle distance stretched by
+    # ROAD_DISTANCE_FACTOR, driven at APPROXIMATE_SPEED_KMH.
+    road_km = haversine_matrix_km(source_coords, destination_coords) * ROAD_DISTANCE_FACTOR
+    return {"durations": road_km / APPROXIMATE_SPEED_KMH * 3600, "distances": road_km * 1000}
+
+def approximate_travel(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Tuple[float, float]:
+    # (distance_km, minutes) for one pair, for when ORS has no answer.
+    estimate = approximate_matrix([start_coords], [end_coords])
+    return round(float(estimate["distances"][0, 0]) / 1000, 2), round(float(estimate["durations"][0, 0]) / 60, 2)
+
+# --- Distance Matrix Pair Cache ---
+
+def coord_key(coords: Tuple[float, float]) -> Tuple[float, float]:
+    # 5 decimal places is ~1 m, well below geocoding precision.
+    return round(float(coords[0]), 5), round(float(coords[1]), 5)
+
+class MatrixPairCache:
+    # Pairs are kept by source row: each row holds its destinations' ids (sorted) next to their durations
+    # and distances, so a lookup or store costs one vectorised searchsorted per source instead of one dict
+    # operation per pair. Whole rows are evicted least recently used once max_entries pairs are held.
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._ids = {}
+        self._rows = OrderedDict()
+        self._entries = 0
+        self._lock = threading.Lock()
+
+    def _key_ids(self, keys: List[Tuple]) -> np.ndarray:
+        ids = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            ids[i] = self._ids.setdefault(key, len(self._ids))
+        return ids
+
+    def lookup(self, source_keys: List[Tuple], destination_keys: List[Tuple]) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns (durations, distances) arrays with NaN for every pair that is not cached.
+        durations = np.full((len(source_keys), len(destination_keys)), np.nan)
+        distances = np.full((len(source_keys), len(destination_keys)), np.nan)
+        with self._lock:
+            source_ids, destination_ids = self._key_ids(source_keys), self._key_ids(destination_keys)
+            for i, source_id in enumerate(source_ids.tolist()):
+                row = self._rows.get(source_id)
+                if row is None:
+                    continue
+                self._rows.move_to_end(source_id)
+                row_ids, row_durations, row_distances = row
+                positions = np.minimum(np.searchsorted(row_ids, destination_ids), len(row_ids) - 1)
+                found = row_ids[positions] == destination_ids
+                durations[i, found] = row_durations[positions[found]]
+                distances[i, found] = row_distances[positions[found]]
+            same = source_ids[:, None] == destination_ids[None, :]
+            durations[same] = distances[same] = 0.0
+            cached = int((~np.isnan(durations)).sum() - same.sum())
+            self.hits += cached
+            self.misses += int(same.size - same.sum()) - cached
+        return durations, distances
+
+    def store(self, source_keys: List[Tuple], destination_keys: List[Tuple], durations: np.ndarray, distances: np.ndarray):
+        durations, distances = np.asarray(durations, dtype=float), np.asarray(distances, dtype=float)
+        with self._lock:
+            source_ids, destination_ids = self._key_ids(source_keys), self._key_ids(destination_keys)
+            for i, source_id in enumerate(source_ids.tolist()):
+                keep = (destination_ids != source_id) & ~np.isnan(durations[i]) & ~np.isnan(distances[i])
+                if not keep.any():
+                    continue
+                row_ids, row_durations, row_distances = destination_ids[keep], durations[i, keep], distances[i, keep]
+                previous = self._rows.pop(source_id, None)
+                if previous is not None:
+                    self._entries -= len(previous[0])
+                    stale = ~np.isin(previous[0], row_ids)
+                    row_ids = np.concatenate([row_ids, previous[0][stale]])
+                    row_durations = np.concatenate([row_durations, previous[1][stale]])
+                    row_distances = np.concatenate([row_distances, previous[2][stale]])
+                row_ids, first = np.unique(row_ids, return_index=True)
+                self._rows[source_id] = (row_ids, row_durations[first], row_distances[first])
+                self._entries += len(row_ids)
+            while self._entries > self.max_entries and self._rows:
+                _, (row_ids, _, _) = self._rows.popitem(last=False)
+                self._entries -= len(row_ids)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": self._entries
+            }
+
+matrix_pair_cache = MatrixPairCache(MATRIX_PAIR_CACHE_SIZE)
+
+# --- Location Registry & Precomputed Matrix ---
+
+class LocationRegistry:
+    # Stable 0-based ids, in registration order, for known locations: driver bases, plus any location that
+    # appears in LOCATION_REGISTRY_MIN_USES matrix requests. Kept in SQLite so every process agrees on them;
+    # ids are never reused or removed.
+    def __init__(self, path: str, min_uses: int, max_locations: int):
+        self.min_uses = min_uses
+        self.max_locations = max_locations
+        self._ids = {}
+        self._uses = {}
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS locations ("
+            "location_id INTEGER PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL, label TEXT, "
+            "created_at REAL NOT NULL, UNIQUE (latitude, longitude))"
+        )
+        self._conn.commit()
+        self.reload()
+
+    def reload(self):
+        # Picks up locations registered by other processes.
+        with self._lock:
+            rows = self._conn.execute("SELECT location_id, latitude, longitude FROM locations").fetchall()
+            self._ids = {(latitude, longitude): location_id for location_id, latitude, longitude in rows}
+
+    def location_id(self, key: Tuple[float, float]) -> Optional[int]:
+        return self._ids.get(key)
+
+    def size(self) -> int:
+        return len(self._ids)
+
+    def keys(self) -> List[Tuple[float, float]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT latitude, longitude FROM locations ORDER BY location_id").fetchall()
+        return [(latitude, longitude) for latitude, longitude in rows]
+
+    def register(self, coords_list: List[Tuple[float, float]], label: Optional[str] = None) -> int:
+        added = 0
+        with self._lock:
+            for key in dict.fromkeys(coord_key(c) for c in coords_list):
+                if key in self._ids:
+                    continue
+                if len(self._ids) >= self.max_locations:
+                    logger.warning(f"LOCATION_REGISTRY: Full ({self.max_locations} locations), not registering more.")
+                    break
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO locations (location_id, latitude, longitude, label, created_at) "
+                    "VALUES ((SELECT COALESCE(MAX(location_id) + 1, 0) FROM locations), ?, ?, ?, ?)",
+                    (key[0], key[1], label, time.time())
+                )
+                added += 1
+            self._conn.commit()
+            if added:
+                rows = self._conn.execute("SELECT location_id, latitude, longitude FROM locations").fetchall()
+                self._ids = {(latitude, longitude): location_id for location_id, latitude, longitude in rows}
+        if added:
+            logger.info(f"LOCATION_REGISTRY: Registered {added} {label or ''} locations ({len(self._ids)} total).")
+            precomputed_matrix.request_refresh()
+        return added
+
+    def note_use(self, keys: List[Tuple[float, float]]):
+        # Counts matrix requests per unregistered location and registers the ones reaching min_uses.
+        if self.min_uses <= 0:
+            return
+        promoted = []
+        with self._lock:
+            for key in set(keys):
+                if key in self._ids:
+                    continue
+                uses = self._uses.get(key, 0) + 1
+                if uses >= self.min_uses:
+                    promoted.append(key)
+                    self._uses.pop(key, None)
+                else:
+                    self._uses[key] = uses
+            if len(self._uses) > 100_000:
+                self._uses.clear()
+        if promoted:
+            self.register(promoted, label="frequent")
+
+class PrecomputedMatrix:
+    # Durations and distances between all registered locations, indexed by location id, as one float32
+    # (2, n, n) .npy file that every process memory-maps read-only. A background thread extends it when
+    # locations are registered: it writes a new file (old block from the current file, only new rows and
+    # columns from ORS) and swaps it in with os.replace; readers re-map when the file changes.
+    def __init__(self, path: str, registry: LocationRegistry, refresh_seconds: int):
+        self.path = path
+        self.registry = registry
+        self.refresh_seconds = refresh_seconds
+        self.hits = 0
+        self._matrix = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._refresh_event = threading.Event()
+        self._worker = None
+
+    def _current(self) -> Optional[np.ndarray]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self._matrix = np.load(self.path, mmap_mode='r')
+                self._mtime = mtime
+                reload_registry = True
+            else:
+                reload_registry = False
+            matrix = self._matrix
+        if reload_registry:
+            self.registry.reload()
+        return matrix
+
+    def size(self) -> int:
+        matrix = self._current()
+        return matrix.shape[1] if matrix is not None else 0
+
+    def fill(self, source_keys: List[Tuple], destination_keys: List[Tuple], durations: np.ndarray, distances: np.ndarray):
+        # Copies every precomputed pair into durations/distances in place.
+        matrix = self._current()
+        size = matrix.shape[1] if matrix is not None else 0
+        if self._worker is None and self.registry.size() > size:
+            self.request_refresh()
+        if not size:
+            return
+        source_ids = np.array([self.registry.location_id(k) if self.registry.location_id(k) is not None else -1 for k in source_keys])
+        destination_ids = np.array([self.registry.location_id(k) if self.registry.location_id(k) is not None else -1 for k in destination_keys])
+        rows = np.flatnonzero((source_ids >= 0) & (source_ids < size))
+        cols = np.flatnonzero((destination_ids >= 0) & (destination_ids < size))
+        if not rows.size or not cols.size:
+            return
+        ids = np.ix_(source_ids[rows], destination_ids[cols])
+        durations[np.ix_(rows, cols)] = matrix[0][ids]
+        distances[np.ix_(rows, cols)] = matrix[1][ids]
+        self.hits += rows.size * cols.size
+
+    def request_refresh(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="matrix-precompute", daemon=True)
+                self._worker.start()
+        self._refresh_event.set()
+
+    def _run(self):
+        while True:
+            self._refresh_event.wait(timeout=self.refresh_seconds)
+            self._refresh_event.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"PRECOMPUTED_MATRIX: Refresh failed: {e}", exc_info=True)
+
+    def refresh(self) -> bool:
+        # One process at a time extends the file; the others skip this round.
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return False
+            keys = self.registry.keys()
+            current_size = self.size()
+            if len(keys) <= current_size:
+                return False
+            logger.info(f"PRECOMPUTED_MATRIX: Extending from {current_size} to {len(keys)} locations.")
+            result = build_matrix(keys, keys, use_pair_cache=False)
+            if result is None:
+                logger.warning("PRECOMPUTED_MATRIX: Matrix request failed, keeping the current file.")
+                return False
+            temp_path = self.path + '.tmp'
+            out = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=(2, len(keys), len(keys)))
+            out[0] = result["durations"]
+            out[1] = result["distances"]
+            out.flush()
+            del out
+            os.replace(temp_path, self.path)
+            logger.info(f"PRECOMPUTED_MATRIX: {len(keys)} locations precomputed.")
+            return True
+
+    def stats(self) -> Dict:
+        return {"locations": self.size(), "registered": self.registry.size(), "pair_hits": self.hits}
+
+location_registry = LocationRegistry(LOCATION_REGISTRY_PATH, LOCATION_REGISTRY_MIN_USES, LOCATION_REGISTRY_MAX_LOCATIONS)
+precomputed_matrix = PrecomputedMatrix(PRECOMPUTED_MATRIX_PATH, location_registry, PRECOMPUTED_MATRIX_REFRESH_SECONDS)
+
+# --- Route Geometry Cache ---
+
+class LruCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries)
+            }
+
+# (start coord_key, end coord_key) -> polyline coords of the driven leg
+route_leg_cache = LruCache(ROUTE_LEG_CACHE_SIZE)
+# (geometry handle, simplify level) -> stitched route polyline
+route_geometry_cache = LruCache(ROUTE_GEOMETRY_CACHE_SIZE)
+# Full directions results (polyline, duration, distance) by waypoint list
+directions_cache = LruCache(DIRECTIONS_CACHE_SIZE)
+
+# Douglas-Peucker tolerance in degrees for each simplify level (level 3 is ~10 m)
+ROUTE_SIMPLIFY_TOLERANCES = [0.0, 0.00001, 0.00005, 0.0001, 0.0005, 0.001]
+
+# --- Shared Openrouteservice HTTP Client ---
+
+# One keep-alive connection pool for every ORS call, plus a bounded pool for fanning out independent calls.
+ORS_GEOCODE_URL = "https://api.openrouteservice.org/geocode/search"
+ORS_AUTOCOMPLETE_URL = "https://api.openrouteservice.org/geocode/autocomplete"
+ORS_MATRIX_URL = "https://api.openrouteservice.org/v2/matrix/driving-car"
+ORS_DIRECTIONS_URL = "https://api.openrouteservice.org/v2/directions/driving-car"
+
+def ors_headers() -> Dict:
+    return {
+        "Authorization": f"Bearer {ORS_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+ors_session = requests.Session()
+ors_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=ORS_MAX_WORKERS))
+ors_executor = ThreadPoolExecutor(max_workers=ORS_MAX_WORKERS, thread_name_prefix="ors-worker")
+
+def ors_map(func, items) -> List:
+    # Runs func over items concurrently and returns results in input order, under the caller's deadline.
+    items = list(items)
+    if len(items) <= 1 or threading.current_thread().name.startswith("ors-worker"):
+        # Nested fan-out from inside a worker would wait on its own pool, so run it inline instead.
+        return [func(item) for item in items]
+    deadline = ors_deadline.get()
+
+    def run(item):
+        token = ors_deadline.set(deadline)
+        try:
+            return func(item)
+        finally:
+            ors_deadline.reset(token)
+    return list(ors_executor.map(run, items))
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        # Takes a token and returns 0, or returns the seconds until one is available.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_second
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        # False if no token frees up within timeout seconds.
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_seconds = self.try_acquire()
+            if not wait_seconds:
+                return True
+            if give_up_at is not None and time.monotonic() + wait_seconds > give_up_at:
+                return False
+            time.sleep(wait_seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"rate_per_minute": self.rate_per_second * 60, "tokens": round(self._tokens, 2)}
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution: the first caller runs fn and the others
+    # wait for its result (or exception). Nothing is kept after the call returns; caching stays with the
+    # callers. Only wrap leaf upstream requests, so a waiting worker never blocks the call it waits on.
+    # Waiters give up at their own ORS deadline, which may be sooner than the leader's. do_async is the
+    # same for coroutines on an event loop, and shares the in-flight calls with do, so a Flask worker and
+    # the ASGI prefetch asking for the same thing make one request between them.
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key) -> Tuple[Dict, bool]:
+        # (the in-flight call for key, whether this caller leads it)
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None, "task": None}
+                return call, True
+            self.coalesced += 1
+            return call, False
+
+    def _finish(self, key, call: Dict):
+        with self._lock:
+            self._calls.pop(key, None)
+            self.executed += 1
+        call["done"].set()
+
+    @staticmethod
+    def _outcome(call: Dict):
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    def do(self, key, fn):
+        call, leader = self._join(key)
+        if not leader:
+            remaining = ors_deadline_remaining()
+            if not call["done"].wait(None if remaining is None else max(0.0, remaining)):
+                raise OrsDeadlineExceeded("Request deadline reached waiting for a shared ORS call")
+            return self._outcome(call)
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def do_async(self, key, make_coroutine):
+        # A waiter that is cancelled, or past its own deadline, does not cancel the shared call.
+        call, leader = self._join(key)
+        if leader:
+            call["task"] = asyncio.ensure_future(make_coroutine())
+
+            def finished(task):
+                if task.cancelled():
+                    call["error"] = OrsUnavailable("Shared ORS call was cancelled")
+                elif task.exception() is not None:
+                    call["error"] = task.exception()
+                else:
+                    call["result"] = task.result()
+                self._finish(key, call)
+            call["task"].add_done_callback(finished)
+        remaining = ors_deadline_remaining()
+        timeout = None if remaining is None else max(0.0, remaining)
+        task = call["task"]
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                if task.done():
+                    raise
+                raise OrsDeadlineExceeded("Request deadline reached waiting for a shared ORS call")
+        # Led by a Flask worker thread (or another loop): wait for it off this loop
+        if not await asyncio.to_thread(call["done"].wait, timeout):
+            raise OrsDeadlineExceeded("Request deadline reached waiting for a shared ORS call")
+        return self._outcome(call)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+geocode_flight = SingleFlight()
+matrix_flight = SingleFlight()
+directions_flight = SingleFlight()
+autocomplete_flight = SingleFlight()
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive failures (timeouts, connection errors, 5xx) and then fails
+    # fast for reset_seconds. After that one probe request is let through; success closes the circuit,
+    # failure re-opens it. A call let through by allow() must end in record_success, record_failure or
+    # abandon, or a probe would hold the circuit open.
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.rejected = 0
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+                self.rejected += 1
+                return False
+            self._probing = True
+            return True
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("ORS_CIRCUIT: Closed, ORS is answering again.")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"ORS_CIRCUIT: Open after {self._failures} consecutive failures, failing fast for {self.reset_seconds}s.")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def abandon(self):
+        # The allowed call ended without an answer from ORS (cancelled, deadline, local error).
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"open": self._opened_at is not None, "consecutive_failures": self._failures, "rejected": self.rejected}
+
+class OrsUnavailable(requests.exceptions.ConnectionError):
+    # Circuit open; the helpers' ConnectionError handling turns it into their usual None.
+    pass
+
+class OrsDeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+# Absolute time.monotonic() by which the current request must be done with ORS; None for no deadline.
+ors_deadline = contextvars.ContextVar('ors_deadline', default=None)
+
+def ors_deadline_after(budget_seconds: float) -> Optional[float]:
+    # A budget of 0 or less means no deadline.
+    return time.monotonic() + budget_seconds if budget_seconds > 0 else None
+
+def ors_deadline_remaining() -> Optional[float]:
+    deadline = ors_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+matrix_rate_limiter = TokenBucket(ORS_MATRIX_REQUESTS_PER_MINUTE / 60, max(1.0, ORS_MATRIX_REQUESTS_PER_MINUTE / 6))
+ors_rate_limiters = {
+    "matrix": matrix_rate_limiter,
+    "geocode": TokenBucket(ORS_GEOCODE_REQUESTS_PER_MINUTE / 60, max(1.0, ORS_GEOCODE_REQUESTS_PER_MINUTE / 6)),
+    "directions": TokenBucket(ORS_DIRECTIONS_REQUESTS_PER_MINUTE / 60, max(1.0, ORS_DIRECTIONS_REQUESTS_PER_MINUTE / 6))
+}
+ors_circuit = CircuitBreaker(ORS_CIRCUIT_FAILURE_THRESHOLD, ORS_CIRCUIT_RESET_SECONDS)
+
+def ors_retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    # Retry-After when ORS sends one (capped), otherwise exponential backoff with jitter in its upper half.
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), ORS_RETRY_AFTER_MAX_SECONDS)
+    backoff = ORS_RETRY_BASE_SECONDS * 2 ** attempt
+    return random.uniform(backoff / 2, backoff)
+
+class OrsCall:
+    # The breaker, deadline and retry decisions for one logical ORS call, shared by ors_request and
+    # AsyncOrsClient.request, which only differ in how they wait and send. Per attempt: quota_timeout(),
+    # take a token, start(), send, then retry_delay() with the response or transient error (or abandon()
+    # if the send failed any other way).
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.attempt = 0
+
+    def quota_timeout(self) -> Optional[float]:
+        # How long the token wait may take; raises once the deadline has passed.
+        remaining = ors_deadline_remaining()
+        if remaining is not None and remaining <= 0:
+            raise OrsDeadlineExceeded(f"Request deadline reached before {self.kind} call")
+        return remaining
+
+    def quota_exceeded(self) -> OrsDeadlineExceeded:
+        return OrsDeadlineExceeded(f"Request deadline reached waiting for {self.kind} quota")
+
+    def start(self, timeout: float) -> float:
+        # Asks the breaker last, so nothing between allow() and the send can leave a half-open probe
+        # unresolved. Returns the socket timeout, capped by the deadline.
+        if not ors_circuit.allow():
+            raise OrsUnavailable(f"ORS circuit open, not calling {self.kind}")
+        remaining = ors_deadline_remaining()
+        return timeout if remaining is None else max(0.1, min(timeout, remaining))
+
+    def abandon(self):
+        ors_circuit.abandon()
+
+    def retry_delay(self, response, error: Optional[Exception] = None) -> Optional[float]:
+        # Records the response (requests or httpx) or transient error with the breaker. Seconds to wait
+        # before the next attempt, or None to return the response (raise the error) as it is.
+        if error is not None or response.status_code >= 500:
+            ors_circuit.record_failure()
+        else:
+            ors_circuit.record_success()
+            if response.status_code != 429:
+                return None
+        if self.attempt == ORS_RETRIES:
+            return None
+        retry_after = response.headers.get('Retry-After') if error is None and response.status_code == 429 else None
+        delay = ors_retry_delay(self.attempt, retry_after)
+        remaining = ors_deadline_remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        self.attempt += 1
+        reason = repr(error) if error is not None else f"HTTP {response.status_code}"
+        logger.warning(f"ORS {self.kind}: {reason}, retrying in {delay:.2f}s (attempt {self.attempt}).")
+        return delay
+
+def ors_request(kind: str, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+    # Every ORS call goes through here: circuit breaker, the endpoint's token bucket, the request deadline
+    # (which also caps the socket timeout) and retries of timeouts, connection errors, 429 and 5xx with
+    # jittered exponential backoff (or Retry-After). Raises the requests exceptions the helpers already
+    # handle; a response still failing after the retries is returned for raise_for_status().
+    call = OrsCall(kind)
+    while True:
+        if not ors_rate_limiters[kind].acquire(timeout=call.quota_timeout()):
+            raise call.quota_exceeded()
+        socket_timeout = call.start(timeout)
+        error, response = None, None
+        try:
+            response = ors_session.request(method, url, timeout=socket_timeout, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = e
+        except BaseException:
+            call.abandon()
+            raise
+        delay = call.retry_delay(response, error)
+        if delay is None:
+            if error is not None:
+                raise error
+            return response
+        time.sleep(delay)
+
 # --- Utility Functions for Openrouteservice API ---
 
+def local_coordinates(address: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+    # (found, coords) from the offline gazetteer or the geocode cache, without calling ORS.
+    local_coords = gazetteer.geocode(address)
+    if local_coords:
+        return True, local_coords
+    found, cached_coords = geocode_cache.get(normalize_address(address))
+    if found:
+        logger.info(f"Geocoding cache HIT for '{address}': {cached_coords}")
+    return found, cached_coords
+
 def get_coordinates(address: str) -> Optional[Tuple[float, float]]:
-    url = "https://api.openrouteservice.org/geocode/search"
-    params = {
-        "api_key": ORS_API_KEY,
-        "text": address,
-        "boundary.country": "IL",
-        "lang": "he"
-    }
+    found, coords = local_coordinates(address)
+    if found:
+        return coords
+    cache_key = normalize_address(address)
+    return geocode_flight.do(cache_key, lambda: _ors_geocode_request(address, cache_key))
+
+def _ors_geocode_request(address: str, cache_key: str) -> Optional[Tuple[float, float]]:
+    url = ORS_GEOCODE_URL
     try:
         logger.info(f"--- Geocoding Attempt ---")
-        response = requests.get(url, params=params, timeout=15)
+        response = ors_request("geocode", "GET", url, timeout=15, params=geocode_params(address))
         response.raise_for_status()
-        data = response.json()
-        if data.get('features') and len(data['features']) > 0:
-            coords = data['features'][0]['geometry']['coordinates']
-            latitude, longitude = coords[1], coords[0]
-            logger.info(f"Geocoding SUCCESS for '{address}': Lat={latitude}, Lon={longitude}")
-            return latitude, longitude
-        else:
-            logger.warning(f"Geocoding FAILED for '{address}': No features found in response. Response: {response.text}")
-            return None
+        return geocode_result(address, cache_key, response.json())
     except requests.exceptions.Timeout:
         logger.error(f"Geocoding FAILED for '{address}': Request timed out after 15 seconds.")
         return None
@@ -244,37 +1204,225 @@ def get_coordinates(address: str) -> Optional[Tuple[float, float]]:
         logger.error(f"An unexpected error occurred during geocoding for '{address}': {e}", exc_info=True)
         return None
 
-def get_distance_matrix(coordinates: List[Tuple[float, float]]) -> Optional[Dict]:
+def geocode_params(address: str) -> Dict:
+    return {
+        "api_key": ORS_API_KEY,
+        "text": address,
+        "boundary.country": "IL",
+        "lang": "he"
+    }
+
+def geocode_result(address: str, cache_key: str, data: Dict) -> Optional[Tuple[float, float]]:
+    # Parses a geocode response and caches the answer, including "not found".
+    if data.get('features') and len(data['features']) > 0:
+        coords = data['features'][0]['geometry']['coordinates']
+        latitude, longitude = coords[1], coords[0]
+        logger.info(f"Geocoding SUCCESS for '{address}': Lat={latitude}, Lon={longitude}")
+        geocode_cache.put(cache_key, (latitude, longitude))
+        return latitude, longitude
+    logger.warning(f"Geocoding FAILED for '{address}': No features found in response. Response: {str(data)[:500]}")
+    geocode_cache.put(cache_key, None)
+    return None
+
+def _ors_autocomplete_request(query: str) -> Dict:
+    response = ors_request("geocode", "GET", ORS_AUTOCOMPLETE_URL, timeout=10, params=autocomplete_params(query))
+    response.raise_for_status()
+    return response.json()
+
+def autocomplete_params(query: str) -> Dict:
+    params = geocode_params(query)
+    params["point.lat"] = 31.771959
+    params["point.lon"] = 35.217018
+    params["sources"] = "osm"
+    return params
+
+def autocomplete_suggestions(data: Dict) -> List[str]:
+    # "street, city" labels from an autocomplete response, deduplicated, at most 10.
+    suggestions = []
+    if data.get('features'):
+        for feature in data['features']:
+            if feature.get('properties') and feature['properties'].get('label'):
+                full_label = feature['properties']['label']
+                match = re.match(r'^(.*?),\s*(.*?),\s*([^,]+),\s*Israel', full_label)
+                if match:
+                    street_address = match.group(1)
+                    city = match.group(2)
+                    suggestions.append(f"{street_address}, {city}")
+                else:
+                    parts = full_label.split(', ')
+                    if len(parts) >= 2:
+                        suggestions.append(f"{parts[0]}, {parts[1]}")
+                    else:
+                        suggestions.append(full_label)
+
+    return list(dict.fromkeys(suggestions))[:10]
+
+def get_distance_matrix(coordinates: List[Tuple[float, float]], approximate_fallback: bool = False) -> Optional[Dict]:
+    # Dense N x N matrix; only pairs missing from the pair cache are requested from ORS.
     if not coordinates:
         logger.warning("No coordinates provided for Distance Matrix calculation.")
         return None
-    url = "https://api.openrouteservice.org/v2/matrix/driving-car"
-    headers = {
-        "Authorization": f"Bearer {ORS_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    ors_locations = [[coord[1], coord[0]] for coord in coordinates] 
-    payload = {
-        "locations": ors_locations,
-        "metrics": ["duration", "distance"],
-        "units": "m"
-    }
+    return build_matrix(coordinates, coordinates, approximate_fallback=approximate_fallback)
+
+def cached_matrix_pairs(source_keys: List[Tuple], destination_keys: List[Tuple], use_pair_cache: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    # Durations and distances known without calling ORS; NaN where neither cache has the pair.
+    durations = np.full((len(source_keys), len(destination_keys)), np.nan)
+    distances = np.full((len(source_keys), len(destination_keys)), np.nan)
+    precomputed_matrix.fill(source_keys, destination_keys, durations, distances)
+    if use_pair_cache and np.isnan(durations).any():
+        cached_durations, cached_distances = matrix_pair_cache.lookup(source_keys, destination_keys)
+        gaps = np.isnan(durations)
+        durations[gaps] = cached_durations[gaps]
+        distances[gaps] = cached_distances[gaps]
+    return durations, distances
+
+def build_matrix(source_coords: List[Tuple[float, float]], destination_coords: List[Tuple[float, float]],
+                 use_pair_cache: bool = True, approximate_fallback: bool = False) -> Optional[Dict]:
+    # Pairs come from the precomputed matrix, then the pair cache, then ORS. The precompute job itself
+    # skips the pair cache so it doesn't flush it. With approximate_fallback, pairs from requests that keep
+    # failing get approximate_matrix estimates instead of failing the whole matrix; "approximate_pairs"
+    # counts them. Estimates are never cached, and pairs ORS reports as unroutable stay NaN.
+    source_keys = [coord_key(c) for c in source_coords]
+    destination_keys = [coord_key(c) for c in destination_coords]
+    if use_pair_cache:
+        location_registry.note_use(source_keys + destination_keys)
+    durations, distances = cached_matrix_pairs(source_keys, destination_keys, use_pair_cache)
+    missing = np.isnan(durations)
+    if not missing.any():
+        logger.info(f"Distance Matrix cache HIT for all {missing.size} pairs.")
+        return {"durations": durations, "distances": distances}
+
+    logger.info(f"Distance Matrix cache: {int(missing.sum())} of {missing.size} pairs missing.")
+    failed = np.zeros_like(missing)
+    for source_idx, destination_idx in _cover_missing_pairs(missing):
+        block = _fetch_matrix_block(
+            [source_coords[i] for i in source_idx],
+            [destination_coords[j] for j in destination_idx]
+        )
+        if block is None:
+            if approximate_fallback:
+                failed[np.ix_(source_idx, destination_idx)] = missing[np.ix_(source_idx, destination_idx)]
+                continue
+            return None
+        durations[np.ix_(source_idx, destination_idx)] = block["durations"]
+        distances[np.ix_(source_idx, destination_idx)] = block["distances"]
+        if use_pair_cache:
+            matrix_pair_cache.store(
+                [source_keys[i] for i in source_idx], [destination_keys[j] for j in destination_idx],
+                block["durations"], block["distances"]
+            )
+    if failed.any():
+        return fill_approximate_pairs(source_coords, destination_coords, durations, distances, failed)
+    return {"durations": durations, "distances": distances}
+
+def fill_approximate_pairs(source_coords, destination_coords, durations: np.ndarray, distances: np.ndarray,
+                           gaps: np.ndarray) -> Dict:
+    # Overwrites the cells selected by gaps with approximate_matrix estimates, in place.
+    if not gaps.any():
+        return {"durations": durations, "distances": distances}
+    rows, cols = np.flatnonzero(gaps.any(axis=1)), np.flatnonzero(gaps.any(axis=0))
+    estimate = approximate_matrix([source_coords[i] for i in rows], [destination_coords[j] for j in cols])
+    block = np.ix_(rows, cols)
+    block_gaps = gaps[block]
+    durations[block] = np.where(block_gaps, estimate["durations"], durations[block])
+    distances[block] = np.where(block_gaps, estimate["distances"], distances[block])
+    logger.warning(f"Distance Matrix: {int(gaps.sum())} of {gaps.size} pairs approximated without ORS.")
+    return {"durations": durations, "distances": distances, "approximate_pairs": int(gaps.sum())}
+
+def _cover_missing_pairs(missing: np.ndarray) -> List[Tuple[List[int], List[int]]]:
+    # Greedily covers the missing cells with whole rows and columns, so adding one location to a
+    # cached set costs one row block plus one column block instead of a full N x N request.
+    remaining = missing.copy()
+    rows, cols = [], []
+    while remaining.any():
+        row_counts = remaining.sum(axis=1)
+        col_counts = remaining.sum(axis=0)
+        if row_counts.max() >= col_counts.max():
+            picked = np.flatnonzero(row_counts == row_counts.max())
+            rows.extend(picked.tolist())
+            remaining[picked, :] = False
+        else:
+            picked = np.flatnonzero(col_counts == col_counts.max())
+            cols.extend(picked.tolist())
+            remaining[:, picked] = False
+
+    blocks = []
+    if rows:
+        rows.sort()
+        row_destinations = np.flatnonzero(missing[rows, :].any(axis=0)).tolist()
+        blocks.append((rows, row_destinations))
+    if cols:
+        cols.sort()
+        col_mask = missing[:, cols].any(axis=1)
+        col_mask[rows] = False
+        col_sources = np.flatnonzero(col_mask).tolist()
+        if col_sources:
+            blocks.append((col_sources, cols))
+    return blocks
+
+def matrix_tiles(source_coords: List[Tuple[float, float]], destination_coords: List[Tuple[float, float]]) -> List[Tuple]:
+    # (row, col, tile sources, tile destinations) tiles of at most ORS_MATRIX_MAX_ELEMENTS pairs.
+    num_sources, num_destinations = len(source_coords), len(destination_coords)
+    if num_sources * num_destinations <= ORS_MATRIX_MAX_ELEMENTS:
+        tile_cols, tile_rows = num_destinations, num_sources
+    else:
+        tile_cols = min(num_destinations, max(math.isqrt(ORS_MATRIX_MAX_ELEMENTS), ORS_MATRIX_MAX_ELEMENTS // num_sources))
+        tile_rows = max(1, ORS_MATRIX_MAX_ELEMENTS // tile_cols)
+    return [
+        (row, col, source_coords[row:row + tile_rows], destination_coords[col:col + tile_cols])
+        for row in range(0, num_sources, tile_rows)
+        for col in range(0, num_destinations, tile_cols)
+    ]
+
+def _fetch_matrix_block(source_coords: List[Tuple[float, float]], destination_coords: List[Tuple[float, float]]) -> Optional[Dict]:
+    # Splits the block into source x destination tiles under ORS_MATRIX_MAX_ELEMENTS, fetches them
+    # concurrently and stitches everything into one array. Each tile request is retried by ors_request.
+    num_sources, num_destinations = len(source_coords), len(destination_coords)
+    tiles = matrix_tiles(source_coords, destination_coords)
+    if len(tiles) > 1:
+        logger.info(f"Distance Matrix: splitting {num_sources}x{num_destinations} block into {len(tiles)} tiles.")
+
+    durations = np.empty((num_sources, num_destinations))
+    distances = np.empty((num_sources, num_destinations))
+
+    def fetch_tile(tile):
+        _, _, tile_sources, tile_destinations = tile
+        key = (tuple(coord_key(c) for c in tile_sources), tuple(coord_key(c) for c in tile_destinations))
+        return matrix_flight.do(key, lambda: _matrix_tile_request(tile_sources, tile_destinations))
+
+    failed = 0
+    for tile, result in zip(tiles, ors_map(fetch_tile, tiles)):
+        if result is None:
+            failed += 1
+            continue
+        row, col, tile_sources, tile_destinations = tile
+        durations[row:row + len(tile_sources), col:col + len(tile_destinations)] = result["durations"]
+        distances[row:row + len(tile_sources), col:col + len(tile_destinations)] = result["distances"]
+    if failed:
+        logger.error(f"Distance Matrix FAILED: {failed} of {len(tiles)} tiles failed.")
+        return None
+    return {"durations": durations, "distances": distances}
+
+def _matrix_tile_request(source_coords: List[Tuple[float, float]],
+                         destination_coords: List[Tuple[float, float]]) -> Optional[Dict]:
+    return _ors_matrix_request(*matrix_tile_locations(source_coords, destination_coords))
+
+def matrix_tile_locations(source_coords: List[Tuple[float, float]], destination_coords: List[Tuple[float, float]]) -> Tuple:
+    # (locations, sources, destinations) for one matrix request.
+    if source_coords == destination_coords:
+        return list(source_coords), None, None
+    locations = list(source_coords) + list(destination_coords)
+    return locations, list(range(len(source_coords))), list(range(len(source_coords), len(locations)))
+
+def _ors_matrix_request(coordinates: List[Tuple[float, float]], sources: Optional[List[int]] = None,
+                        destinations: Optional[List[int]] = None) -> Optional[Dict]:
+    url = ORS_MATRIX_URL
     try:
         logger.info(f"--- Distance Matrix Attempt ---")
-        response = requests.post(url, headers=headers, json=payload, timeout=20)
+        response = ors_request("matrix", "POST", url, timeout=20, headers=ors_headers(),
+                               json=matrix_payload(coordinates, sources, destinations))
         response.raise_for_status()
-        data = response.json()
-        durations = data.get("durations")
-        distances = data.get("distances")
-        if durations is not None and distances is not None:
-            logger.info(f"Distance Matrix SUCCESS. Returned durations and distances.")
-            return {
-                "durations": durations,
-                "distances": distances
-            }
-        else:
-            logger.warning(f"Distance Matrix FAILED: Missing 'durations' or 'distances' in response. Body: {response.text}")
-            return None
+        return matrix_result(response.json())
     except requests.exceptions.Timeout:
         logger.error(f"Distance Matrix FAILED: Request timed out after 20 seconds.")
         return None
@@ -290,15 +1438,115 @@ def get_distance_matrix(coordinates: List[Tuple[float, float]]) -> Optional[Dict
         logger.error(f"An unexpected error occurred during Distance Matrix call: {e}", exc_info=True)
         return None
 
-def get_directions_polyline(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Optional[Dict]:
-    url = "https://api.openrouteservice.org/v2/directions/driving-car"
-    headers = {
-        "Authorization": f"Bearer {ORS_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    locations = [[start_coords[1], start_coords[0]], [end_coords[1], end_coords[0]]]
+def matrix_payload(coordinates: List[Tuple[float, float]], sources: Optional[List[int]] = None,
+                   destinations: Optional[List[int]] = None) -> Dict:
     payload = {
-        "coordinates": locations,
+        "locations": [[coord[1], coord[0]] for coord in coordinates],
+        "metrics": ["duration", "distance"],
+        "units": "m"
+    }
+    if sources is not None:
+        payload["sources"] = sources
+    if destinations is not None:
+        payload["destinations"] = destinations
+    return payload
+
+def matrix_result(data: Dict) -> Optional[Dict]:
+    durations = data.get("durations")
+    distances = data.get("distances")
+    if durations is not None and distances is not None:
+        logger.info(f"Distance Matrix SUCCESS. Returned durations and distances.")
+        # Unroutable pairs come back as null and become NaN
+        return {
+            "durations": np.array(durations, dtype=float),
+            "distances": np.array(distances, dtype=float)
+        }
+    logger.warning(f"Distance Matrix FAILED: Missing 'durations' or 'distances' in response. Body: {str(data)[:500]}")
+    return None
+
+def get_directions_polyline(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Optional[Dict]:
+    return _ors_directions_request([start_coords, end_coords])
+
+def get_route_polyline(waypoints: List[Tuple[float, float]]) -> Tuple[List, bool]:
+    # Full route geometry through all waypoints: cached legs are reused, the rest is fetched with one
+    # multi-waypoint directions call per run of uncached legs (chunked at ORS_DIRECTIONS_MAX_WAYPOINTS).
+    # The flag is False when any leg fell back to a straight line.
+    waypoints = [list(w) for i, w in enumerate(waypoints) if i == 0 or coord_key(w) != coord_key(waypoints[i - 1])]
+    if len(waypoints) < 2:
+        return waypoints, True
+
+    legs = [route_leg_cache.get((coord_key(waypoints[i]), coord_key(waypoints[i + 1]))) for i in range(len(waypoints) - 1)]
+    chunks = []
+    chunk_start = None
+    for i in range(len(legs) + 1):
+        if i < len(legs) and legs[i] is None:
+            if chunk_start is None:
+                chunk_start = i
+            if i - chunk_start + 2 < ORS_DIRECTIONS_MAX_WAYPOINTS:
+                continue
+            chunks.append((chunk_start, i + 1))
+            chunk_start = None
+        elif chunk_start is not None:
+            chunks.append((chunk_start, i))
+            chunk_start = None
+
+    complete = True
+    for first_leg, end_leg in chunks:
+        chunk_waypoints = waypoints[first_leg:end_leg + 1]
+        directions_info = _ors_directions_request(chunk_waypoints)
+        way_points = directions_info.get('way_points') if directions_info else None
+        if not way_points or len(way_points) != len(chunk_waypoints):
+            logger.warning(f"Route Polyline: falling back to straight lines for legs {first_leg}-{end_leg - 1}.")
+            complete = False
+            for leg in range(first_leg, end_leg):
+                legs[leg] = [waypoints[leg], waypoints[leg + 1]]
+            continue
+        for offset in range(len(chunk_waypoints) - 1):
+            leg_coords = [list(c) for c in directions_info['polyline_coords'][way_points[offset]:way_points[offset + 1] + 1]]
+            legs[first_leg + offset] = leg_coords
+            route_leg_cache.put((coord_key(chunk_waypoints[offset]), coord_key(chunk_waypoints[offset + 1])), leg_coords)
+
+    route_polyline_coords = []
+    for leg_coords in legs:
+        route_polyline_coords.extend(leg_coords[:-1])
+    route_polyline_coords.append(legs[-1][-1])
+    return route_polyline_coords, complete
+
+def _ors_directions_request(coordinates: List[Tuple[float, float]]) -> Optional[Dict]:
+    key = tuple(coord_key(c) for c in coordinates)
+    cached = directions_cache.get(key)
+    if cached is not None:
+        return cached
+    return directions_flight.do(key, lambda: _fetch_directions(coordinates))
+
+def _fetch_directions(coordinates: List[Tuple[float, float]]) -> Optional[Dict]:
+    url = ORS_DIRECTIONS_URL
+    try:
+        logger.info(f"--- Directions Polyline & Info Attempt ---")
+        response = ors_request("directions", "POST", url, timeout=15, headers=ors_headers(), json=directions_payload(coordinates))
+        response.raise_for_status()
+        return directions_result(coordinates, response.json())
+
+    except requests.exceptions.Timeout:
+        logger.error("Directions Polyline FAILED: Request timed out.")
+        return None
+    except requests.exceptions.ConnectionError as e:
+        logger.error(f"Directions Polyline FAILED: Connection error - {e}")
+        return None
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"Directions Polyline FAILED: HTTP Error {e.response.status_code}. Response Body: {e.response.text}")
+        if e.response.status_code == 401:
+            logger.error("Directions Polyline FAILED: Unauthorized (401). Check your Openrouteservice API key.")
+        elif e.response.status_code == 404:
+            logger.error("Directions Polyline FAILED: Route not found (404). Check if addresses are routable.")
+        return None
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during Directions Polyline call: {e}", exc_info=True)
+        return None
+
+def directions_payload(coordinates: List[Tuple[float, float]]) -> Dict:
+    return {
+        "coordinates": [[coord[1], coord[0]] for coord in coordinates],
         "instructions": False,
         "geometry": True,
         "preference": "fastest",
@@ -306,215 +1554,1975 @@ def get_directions_polyline(start_coords: Tuple[float, float], end_coords: Tuple
         "language": "he"
     }
 
-    try:
-        logger.info(f"--- Directions Polyline & Info Attempt ---")
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
-        response.raise_for_status()
+def directions_result(coordinates: List[Tuple[float, float]], data: Dict) -> Optional[Dict]:
+    # Parses a directions response and caches successful results by waypoint list.
+    if data.get('routes') and len(data['routes']) > 0:
+        route_info = data['routes'][0]
+
+        if 'geometry' in route_info:
+            if isinstance(route_info['geometry'], str):
+                try:
+                    polyline_leaflet_coords = polyline.decode(route_info['geometry'])
+                    logger.info("Directions Polyline SUCCESS (decoded from string).")
+                except Exception as e:
+                    logger.error(f"Failed to decode polyline string: {e}", exc_info=True)
+                    return None
+            elif isinstance(route_info['geometry'], dict) and 'coordinates' in route_info['geometry']:
+                polyline_ors_coords = route_info['geometry']['coordinates']
+                polyline_leaflet_coords = [[c[1], c[0]] for c in polyline_ors_coords]
+                logger.info("Directions Polyline SUCCESS (from GeoJSON).")
+            else:
+                logger.warning(f"Directions Polyline FAILED: Unexpected geometry type/structure. Body: {data}")
+                return None
+        else:
+            logger.warning(f"Directions Polyline FAILED: 'geometry' field missing in route info. Body: {data}")
+            return None
+
+        duration_seconds = route_info.get('summary', {}).get('duration', 0)
+        distance_meters = route_info.get('summary', {}).get('distance', 0)
+
+        result = {
+            "polyline_coords": polyline_leaflet_coords,
+            "duration_seconds": duration_seconds,
+            "distance_meters": distance_meters,
+            "way_points": route_info.get('way_points')
+        }
+        directions_cache.put(tuple(coord_key(c) for c in coordinates), result)
+        return result
+    else:
+        logger.warning(f"Directions Polyline FAILED: No routes found in response. Body: {data}")
+        return None
+
+def matrix_to_json(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    return [[None if np.isnan(value) else value for value in row] for row in matrix.tolist()]
+
+# --- VRP Optimization Logic (Google OR-Tools) ---
+
+UNROUTABLE_ARC_SECONDS = 1_000_000_000
+
+DEFAULT_SOLVER_CONFIG = {"first_solution_strategy": "PATH_CHEAPEST_ARC", "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH"}
+
+# Raced in parallel in portfolio mode, in this order, up to SOLVER_PROCESSES at a time
+SOLVER_PORTFOLIO = [
+    DEFAULT_SOLVER_CONFIG,
+    {"first_solution_strategy": "PARALLEL_CHEAPEST_INSERTION", "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"first_solution_strategy": "SAVINGS", "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"first_solution_strategy": "PATH_CHEAPEST_ARC", "local_search_metaheuristic": "SIMULATED_ANNEALING"},
+    {"first_solution_strategy": "LOCAL_CHEAPEST_INSERTION", "local_search_metaheuristic": "TABU_SEARCH"},
+    {"first_solution_strategy": "CHRISTOFIDES", "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"first_solution_strategy": "GLOBAL_CHEAPEST_ARC", "local_search_metaheuristic": "GENERIC_TABU_SEARCH"},
+    {"first_solution_strategy": "PATH_MOST_CONSTRAINED_ARC", "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH"},
+]
+
+def solver_time_limit_seconds(num_nodes: int, override: Optional[float] = None) -> float:
+    # Scales with instance size: a handful of stops gets the minimum, hundreds of stops get tens of seconds.
+    if override is not None:
+        return min(SOLVER_TIME_LIMIT_MAX_SECONDS, max(0.1, override))
+    return round(min(SOLVER_TIME_LIMIT_MAX_SECONDS, max(SOLVER_TIME_LIMIT_MIN_SECONDS, num_nodes * SOLVER_TIME_LIMIT_SECONDS_PER_NODE)), 2)
+
+class SolutionMonitor:
+    # Registered as an OR-Tools AtSolutionCallback: counts improvements and reports them. plateau_reached is
+    # registered as a custom search limit, so the search finishes once the objective has not improved for
+    # plateau_seconds even while no new solutions are being accepted.
+    def __init__(self, routing, manager, data: Dict, plateau_seconds: float, on_solution=None):
+        self.routing = routing
+        self.manager = manager
+        self.data = data
+        self.node_task_ids = node_task_ids(data)
+        self.plateau_seconds = plateau_seconds
+        self.on_solution = on_solution
+        self.started_at = time.monotonic()
+        self.last_improvement_at = self.started_at
+        self.solutions_found = 0
+        self.improvements = 0
+        self.best_objective = None
+        self.plateau_deadline = float('inf')
+        self.stopped_on_plateau = False
+
+    def __call__(self):
+        self.solutions_found += 1
+        objective = self.routing.CostVar().Value()
+        now = time.monotonic()
+        if self.best_objective is None or objective < self.best_objective:
+            self.best_objective = objective
+            self.improvements += 1
+            self.last_improvement_at = now
+            if self.plateau_seconds > 0:
+                self.plateau_deadline = now + self.plateau_seconds
+            if self.on_solution:
+                self.on_solution({
+                    "solutions_found": self.solutions_found,
+                    "improvements": self.improvements,
+                    "objective": objective,
+                    "elapsed_seconds": round(now - self.started_at, 3),
+                    "assigned_task_ids_by_driver": self._current_task_ids_by_driver()
+                })
+
+    def plateau_reached(self) -> bool:
+        # The solver calls this on every search branch, so the common case is one clock read.
+        if time.monotonic() <= self.plateau_deadline:
+            return False
+        if not self.stopped_on_plateau:
+            logger.info(f"VRP search plateaued for {self.plateau_seconds}s at objective {self.best_objective}; stopping early.")
+            self.stopped_on_plateau = True
+        return True
+
+    def _current_task_ids_by_driver(self) -> Dict:
+        task_ids_by_driver = {}
+        for vehicle_id in range(self.data['num_vehicles']):
+            sequence = []
+            index = self.routing.NextVar(self.routing.Start(vehicle_id)).Value()
+            while not self.routing.IsEnd(index):
+                task_list_index = self.manager.IndexToNode(index) - 1
+                if 0 <= task_list_index < len(self.node_task_ids):
+                    sequence.extend(self.node_task_ids[task_list_index])
+                index = self.routing.NextVar(index).Value()
+            task_ids_by_driver[self.data['driver_original_ids'][vehicle_id]] = sequence
+        return task_ids_by_driver
+
+    def summary(self) -> Dict:
+        return {
+            "solve_time_seconds": round(time.monotonic() - self.started_at, 3),
+            "solutions_found": self.solutions_found,
+            "improvements": self.improvements,
+            "stopped_early": self.stopped_on_plateau
+        }
+
+def node_task_ids(data: Dict) -> List[List]:
+    # Task ids served at each non-depot node: one per node, unless build_vrp_instance merged co-located tasks.
+    return data.get('node_task_ids') or [[task_id] for task_id in data['task_original_ids']]
+
+def node_service_seconds(data: Dict) -> np.ndarray:
+    num_locations = len(data['locations_coords'])
+    service_seconds = np.zeros(num_locations)
+    service_durations = data['service_durations_seconds'][:num_locations]
+    service_seconds[:len(service_durations)] = service_durations
+    service_seconds[data['depot_index']] = 0
+    return service_seconds
+
+def build_transit_matrix(time_matrix: np.ndarray, service_seconds: np.ndarray) -> np.ndarray:
+    # Transit for arc i->j is the service at i plus the drive to j. Unroutable (NaN) arcs get a cost
+    # no route can afford.
+    return np.where(
+        np.isnan(time_matrix),
+        UNROUTABLE_ARC_SECONDS,
+        np.rint(np.nan_to_num(time_matrix)) + service_seconds[:, None]
+    ).astype(np.int64)
+
+def cheapest_insertion(route: List[int], node: int, transit_matrix: np.ndarray, start: int, end: int) -> Tuple[int, int]:
+    # Best position to insert node into route (stops only, without start/end) and the added transit.
+    path = np.array([start] + list(route) + [end])
+    added = transit_matrix[path[:-1], node] + transit_matrix[node, path[1:]] - transit_matrix[path[:-1], path[1:]]
+    position = int(np.argmin(added))
+    return position, int(added[position])
+
+def route_transit(route: List[int], transit_matrix: np.ndarray, start: int, end: int) -> int:
+    path = [start] + list(route) + [end]
+    return int(transit_matrix[path[:-1], path[1:]].sum())
+
+def warm_start_routes(previous_solution, data: Dict) -> Tuple[List[List[int]], Dict]:
+    # Maps a previous plan (routes by driver id and task id) onto this instance: tasks and drivers that
+    # no longer exist are dropped, and new tasks are placed by cheapest feasible insertion.
+    previous_routes = previous_solution.get('drivers_assigned_routes', []) if isinstance(previous_solution, dict) else previous_solution
+    task_ids_at_node = node_task_ids(data)
+    task_node_index = {task_id: i + 1 for i, task_ids in enumerate(task_ids_at_node) for task_id in task_ids}
+    previous_by_driver = {r.get('driver_id'): r.get('assigned_task_ids_sequence', []) for r in previous_routes or []}
+
+    routes = []
+    placed_nodes = set()
+    dropped_task_ids = []
+    for driver_id in data['driver_original_ids']:
+        route = []
+        for task_id in previous_by_driver.get(driver_id, []):
+            node = task_node_index.get(task_id)
+            if node is None:
+                dropped_task_ids.append(task_id)
+                continue
+            if node in placed_nodes:
+                # Duplicate, or co-located with a task already placed (they share the node)
+                continue
+            route.append(node)
+            placed_nodes.add(node)
+        routes.append(route)
+    for driver_id, task_ids in previous_by_driver.items():
+        if driver_id not in data['driver_original_ids']:
+            dropped_task_ids.extend(task_ids)
+    kept_count = sum(len(task_ids_at_node[node - 1]) for node in placed_nodes)
+
+    depot = data['depot_index']
+    transit_matrix = build_transit_matrix(np.asarray(data['time_matrix_seconds'], dtype=float), node_service_seconds(data))
+    route_durations = [route_transit(route, transit_matrix, depot, depot) for route in routes]
+    inserted_task_ids = []
+    for node in range(1, len(task_ids_at_node) + 1):
+        if node in placed_nodes:
+            continue
+        best = None
+        for vehicle_id, route in enumerate(routes):
+            position, added = cheapest_insertion(route, node, transit_matrix, depot, depot)
+            if route_durations[vehicle_id] + added <= data['max_daily_seconds'] and (best is None or added < best[2]):
+                best = (vehicle_id, position, added)
+        if best is None:
+            continue
+        vehicle_id, position, added = best
+        routes[vehicle_id].insert(position, node)
+        route_durations[vehicle_id] += added
+        placed_nodes.add(node)
+        inserted_task_ids.extend(task_ids_at_node[node - 1])
+
+    return routes, {
+        "kept_task_count": kept_count,
+        "dropped_task_ids": dropped_task_ids,
+        "inserted_task_ids": inserted_task_ids
+    }
+
+def parse_solver_config(config: Dict) -> Dict:
+    # Validates strategy names against OR-Tools; raises ValueError for unknown ones.
+    first_solution_strategy = config.get("first_solution_strategy", DEFAULT_SOLVER_CONFIG["first_solution_strategy"])
+    local_search_metaheuristic = config.get("local_search_metaheuristic", DEFAULT_SOLVER_CONFIG["local_search_metaheuristic"])
+    if not hasattr(routing_enums_pb2.FirstSolutionStrategy, str(first_solution_strategy)):
+        raise ValueError(f"Unknown first_solution_strategy: {first_solution_strategy}")
+    if not hasattr(routing_enums_pb2.LocalSearchMetaheuristic, str(local_search_metaheuristic)):
+        raise ValueError(f"Unknown local_search_metaheuristic: {local_search_metaheuristic}")
+    return {"first_solution_strategy": first_solution_strategy, "local_search_metaheuristic": local_search_metaheuristic}
+
+def solve_vrp(data: Dict, on_solution=None, solver_config: Optional[Dict] = None) -> Optional[Dict]:
+    logger.info("--- Starting VRP Optimization ---")
+    
+    num_locations = len(data['locations_coords'])
+    num_vehicles = data['num_vehicles']
+    depot_index = data['depot_index']
+
+    if num_locations == 0:
+        logger.error("VRP Error: No locations provided.")
+        return None
+    if num_vehicles == 0:
+        logger.error("VRP Error: No vehicles provided.")
+        return None
+    if depot_index >= num_locations:
+        logger.error(f"VRP Error: Depot index {depot_index} out of bounds for {num_locations} locations.")
+        return None
+    
+    time_matrix = np.asarray(data['time_matrix_seconds'], dtype=float)
+    distance_matrix = np.asarray(data['distance_matrix_meters'], dtype=float)
+    if time_matrix.shape != (num_locations, num_locations) or distance_matrix.shape != (num_locations, num_locations):
+        logger.error("VRP Error: time_matrix_seconds or distance_matrix_meters is missing or malformed.")
+        return None
+
+    service_seconds = node_service_seconds(data)
+
+    manager = pywrapcp.RoutingIndexManager(num_locations, num_vehicles, depot_index)
+    routing = pywrapcp.RoutingModel(manager)
+
+    # Registered as a native matrix so the search never calls back into Python
+    transit_matrix = build_transit_matrix(time_matrix, service_seconds)
+    transit_callback_index = routing.RegisterTransitMatrix(transit_matrix.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    time_dimension_name = 'Time'
+    routing.AddDimension(
+        transit_callback_index,
+        0,
+        data['max_daily_seconds'],
+        True,
+        time_dimension_name)
+    time_dimension = routing.GetDimensionOrDie(time_dimension_name)
+
+    for node_index in range(num_locations):
+        if node_index != depot_index:
+            routing.AddDisjunction([manager.NodeToIndex(node_index)], 10_000_000_000)
+
+    solver_config = parse_solver_config(solver_config or DEFAULT_SOLVER_CONFIG)
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, solver_config["first_solution_strategy"])
+    search_parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, solver_config["local_search_metaheuristic"])
+    time_limit_seconds = data.get('time_limit_seconds') or solver_time_limit_seconds(num_locations)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit_seconds * 1000))
+
+    plateau_seconds = data.get('plateau_seconds', SOLVER_PLATEAU_SECONDS)
+    solution_monitor = SolutionMonitor(routing, manager, data, plateau_seconds, on_solution)
+    routing.AddAtSolutionCallback(solution_monitor)
+    if plateau_seconds > 0:
+        routing.AddSearchMonitor(routing.solver().CustomLimit(solution_monitor.plateau_reached))
+
+    solution = None
+    initial_routes = data.get('initial_routes')
+    if initial_routes:
+        # Warm start: seed the search with the previous plan mapped onto this instance
+        routing.CloseModelWithParameters(search_parameters)
+        initial_assignment = routing.ReadAssignmentFromRoutes(initial_routes, True)
+        if initial_assignment:
+            logger.info("VRP warm start: searching from the previous solution.")
+            solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+        else:
+            logger.warning("VRP warm start: previous routes are infeasible for this instance, solving from scratch.")
+    if solution is None:
+        solution = routing.SolveWithParameters(search_parameters)
+    logger.info("VRP Solver completed.")
+
+    output_routes = {
+        "drivers_assigned_routes": [],
+        "unassigned_task_ids": [],
+        "solver_config": solver_config,
+        "objective": None
+    }
+
+    output_routes["time_limit_seconds"] = time_limit_seconds
+    if data.get('warm_start'):
+        output_routes["warm_start"] = data['warm_start']
+    if data.get('location_dedup'):
+        output_routes["location_dedup"] = data['location_dedup']
+    if data.get('approximate_pairs'):
+        output_routes["approximate_pairs"] = data['approximate_pairs']
+    output_routes.update(solution_monitor.summary())
+    logger.info(f"VRP search stats: {solution_monitor.summary()}")
+
+    if solution:
+        logger.info("VRP Solution found. Processing routes...")
+        task_ids_at_node = node_task_ids(data)
+        output_routes["objective"] = solution.ObjectiveValue()
+        for vehicle_id in range(num_vehicles):
+            index = routing.Start(vehicle_id)
+            route_nodes_internal_indices = []
+            route_original_task_ids_sequence = []
+            total_travel_distance = 0
+            total_travel_duration = 0
+            total_service_duration = 0
+            
+            route_nodes_internal_indices.append(index)
+
+            while not routing.IsEnd(index):
+                previous_index = index
+                index = solution.Value(routing.NextVar(index))
+                
+                from_node = manager.IndexToNode(previous_index)
+                to_node = manager.IndexToNode(index)
+
+                total_travel_distance += float(distance_matrix[from_node, to_node])
+                total_travel_duration += float(time_matrix[from_node, to_node])
+                
+                if not routing.IsEnd(index):
+                    route_nodes_internal_indices.append(index)
+                    current_node_data_index = manager.IndexToNode(index)
+                    total_service_duration += float(service_seconds[current_node_data_index])
+                    
+                    original_task_list_index = current_node_data_index - 1
+                    if 0 <= original_task_list_index < len(task_ids_at_node):
+                        route_original_task_ids_sequence.extend(task_ids_at_node[original_task_list_index])
+
+            route_nodes_internal_indices.append(index)
+
+            total_route_duration_minutes = round((total_travel_duration + total_service_duration) / 60, 2)
+            total_route_distance_km = round(total_travel_distance / 1000, 2)
+
+            route_waypoint_coords = [list(data['locations_coords'][manager.IndexToNode(node_idx)]) for node_idx in route_nodes_internal_indices]
+
+            output_routes["drivers_assigned_routes"].append({
+                "driver_id": data['driver_original_ids'][vehicle_id],
+                "driver_name": f"נהג {data['driver_original_ids'][vehicle_id]}",
+                "route_waypoint_coords": route_waypoint_coords,
+                "assigned_task_ids_sequence": route_original_task_ids_sequence,
+                "total_distance_km": total_route_distance_km,
+                "total_duration_minutes": total_route_duration_minutes
+            })
+        
+        all_original_task_ids = set(data['task_original_ids'])
+        assigned_task_ids_flat = set()
+        for route in output_routes["drivers_assigned_routes"]:
+            assigned_task_ids_flat.update(route["assigned_task_ids_sequence"])
+        
+        output_routes["unassigned_task_ids"] = list(all_original_task_ids - assigned_task_ids_flat)
+
+    else:
+        logger.warning("No VRP solution found by OR-Tools.")
+
+    logger.info("--- VRP Optimization Complete ---")
+    return output_routes
+
+
+# --- Route Geometry ---
+
+def encode_geometry_handle(waypoints: List) -> str:
+    # The handle is the route's waypoints as an encoded polyline, so any worker can resolve it statelessly.
+    return polyline.encode([tuple(w) for w in waypoints])
+
+def resolve_route_geometry(handle: str, simplify_level: int = 0) -> List:
+    return _resolve_route_geometry(handle, simplify_level)[0]
+
+def _resolve_route_geometry(handle: str, simplify_level: int) -> Tuple[List, bool]:
+    cached = route_geometry_cache.get((handle, simplify_level))
+    if cached is not None:
+        return cached, True
+    if simplify_level == 0:
+        route_polyline_coords, complete = get_route_polyline(polyline.decode(handle))
+    else:
+        full_coords, complete = _resolve_route_geometry(handle, 0)
+        route_polyline_coords = simplify_polyline(full_coords, ROUTE_SIMPLIFY_TOLERANCES[simplify_level])
+    # Straight-line fallbacks are served but not cached, so the next request retries ORS.
+    if complete:
+        route_geometry_cache.put((handle, simplify_level), route_polyline_coords)
+    return route_polyline_coords, complete
+
+def simplify_polyline(coords: List, tolerance: float) -> List:
+    # Iterative Douglas-Peucker; endpoints are always kept.
+    if tolerance <= 0 or len(coords) < 3:
+        return coords
+    points = np.asarray(coords, dtype=float)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        segment_length = math.hypot(segment[0], segment[1])
+        if segment_length == 0:
+            deviations = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            deviations = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / segment_length
+        farthest = int(np.argmax(deviations))
+        if deviations[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.extend([(start, split), (split, end)])
+    return points[keep].tolist()
+
+def attach_route_geometry(solution: Dict, defer_geometry: bool = False):
+    routes = solution.get("drivers_assigned_routes", [])
+    for route in routes:
+        route["geometry_handle"] = encode_geometry_handle(route["route_waypoint_coords"])
+        route["geometry_deferred"] = defer_geometry
+    if defer_geometry:
+        # Straight lines between stops until the client resolves the handle via /api/route_geometry
+        for route in routes:
+            route["route_polyline_coords"] = route["route_waypoint_coords"]
+        return
+    # One multi-waypoint directions request per vehicle, fetched concurrently
+    for route, route_polyline_coords in zip(routes, ors_map(resolve_route_geometry, [r["geometry_handle"] for r in routes])):
+        route["route_polyline_coords"] = route_polyline_coords
+
+# --- Optimization Pipeline ---
+
+class OptimizationError(Exception):
+    def __init__(self, message: str, status_code: int = 500, details: Optional[str] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+    def to_dict(self) -> Dict:
+        error = {"error": self.message}
+        if self.details:
+            error["details"] = self.details
+        return error
+
+def optimization_tasks_and_drivers(data: Dict) -> Tuple[List[Dict], List[Dict]]:
+    tasks = data.get('tasks', [])
+    drivers = data.get('drivers', [])
+
+    if not tasks or not drivers:
+        logger.warning("OPTIMIZE: Missing tasks or drivers in request. Using mock data.")
+        tasks = [
+            {"id": "task1", "address": "רחוב דיזנגוף 100, תל אביב", "service_duration_minutes": 15},
+            {"id": "task2", "address": "רחוב אלנבי 50, תל אביב", "service_duration_minutes": 20},
+            {"id": "task3", "address": "רחוב יפו 200, ירושלים", "service_duration_minutes": 10},
+            {"id": "task4", "address": "רחוב הרצל 1, חיפה", "service_duration_minutes": 25},
+        ]
+        drivers = [
+            {"id": "driverA", "name": "נהג א'", "start_address": "רחוב דיזנגוף 100, תל אביב", "end_address": "רחוב דיזנגוף 100, תל אביב", "max_daily_hours": 8, "is_available": True, "current_work_hours_today": 0},
+            {"id": "driverB", "name": "נהג ב'", "start_address": "רחוב יפו 200, ירושלים", "end_address": "רחוב יפו 200, ירושלים", "max_daily_hours": 8, "is_available": True, "current_work_hours_today": 0},
+        ]
+        logger.info("OPTIMIZE: Using hardcoded mock data for general optimization demo.")
+    return tasks, drivers
+
+def solver_budget_options(data: Dict) -> Tuple[Optional[float], float]:
+    try:
+        time_limit_override = float(data['time_limit_seconds']) if data.get('time_limit_seconds') is not None else None
+        plateau_seconds = float(data.get('plateau_seconds', SOLVER_PLATEAU_SECONDS))
+    except (TypeError, ValueError):
+        raise OptimizationError("'time_limit_seconds' and 'plateau_seconds' must be numbers", 400)
+    return time_limit_override, plateau_seconds
+
+def dedupe_locations(coords_list: List[Tuple[float, float]], merge_meters: float) -> Tuple[List[Tuple[float, float]], List[int]]:
+    # Distinct locations and, per input point, the index of its location: a point within merge_meters of an
+    # earlier location is mapped onto it.
+    unique_array = np.empty((len(coords_list), 2))
+    locations, location_of = [], []
+    for coords in coords_list:
+        if locations:
+            distances_m = haversine_km(coords, unique_array[:len(locations)]) * 1000
+            nearest = int(np.argmin(distances_m))
+            if distances_m[nearest] <= merge_meters:
+                location_of.append(nearest)
+                continue
+        unique_array[len(locations)] = coords
+        location_of.append(len(locations))
+        locations.append(tuple(coords))
+    return locations, location_of
+
+def vrp_addresses(tasks: List[Dict], drivers: List[Dict]) -> List[str]:
+    # The depot (first driver's start) followed by every task address.
+    depot_address = drivers[0]['start_address'] if drivers else "רחוב ראשי 1, תל אביב"
+    return [depot_address] + [task['address'] for task in tasks]
+
+def addresses_by_key(addresses: List[str]) -> Dict[str, str]:
+    # One address per normalized key, so each distinct address is geocoded once.
+    address_by_key = {}
+    for addr in addresses:
+        address_by_key.setdefault(normalize_address(addr), addr)
+    return address_by_key
+
+def vrp_locations(addresses: List[str], coords_by_key: Dict) -> Tuple[List[Tuple[float, float]], List[int]]:
+    # The instance's matrix locations (see dedupe_locations); the ASGI prefetcher requests the same matrix.
+    return dedupe_locations([coords_by_key[normalize_address(addr)] for addr in addresses], LOCATION_MERGE_METERS)
+
+def build_vrp_instance(data: Dict, on_progress=None) -> Dict:
+    # Geocodes the request and builds the matrices; raises OptimizationError on failure.
+    def report_progress(phase, **info):
+        if on_progress:
+            on_progress(phase, **info)
+
+    tasks, drivers = optimization_tasks_and_drivers(data)
+
+    # 1. Geocode all addresses (tasks + driver start/end points), each normalized address once
+    report_progress("geocoding", addresses=len(tasks) + 1)
+    all_addresses = vrp_addresses(tasks, drivers)
+    address_by_key = addresses_by_key(all_addresses)
+    coords_by_key = dict(zip(address_by_key, ors_map(get_coordinates, list(address_by_key.values()))))
+    for key, addr in address_by_key.items():
+        if not coords_by_key[key]:
+            logger.error(f"OPTIMIZE: Failed to geocode critical address for VRP: {addr}")
+            raise OptimizationError("Failed to geocode one or more critical addresses for VRP optimization", 400)
+
+    # Tasks at the same place share one matrix location (the depot's too) and one routing node, whose
+    # service time is the sum of its tasks'.
+    locations, location_of = vrp_locations(all_addresses, coords_by_key)
+    node_locations = [0]
+    node_task_ids_list = []
+    service_durations_seconds_list = [0]
+    node_of_location = {}
+    for task, location in zip(tasks, location_of[1:]):
+        if location not in node_of_location:
+            node_of_location[location] = len(node_locations)
+            node_locations.append(location)
+            node_task_ids_list.append([])
+            service_durations_seconds_list.append(0)
+        node = node_of_location[location]
+        node_task_ids_list[node - 1].append(task['id'])
+        service_durations_seconds_list[node] += task['service_duration_minutes'] * 60
+    location_dedup = {"tasks": len(tasks), "matrix_locations": len(locations), "nodes": len(node_locations)}
+    logger.info(f"OPTIMIZE: Location dedup: {location_dedup}")
+
+    available_drivers_for_vrp = [d for d in drivers if d.get('is_available', True)]
+    vrp_index_to_driver_id = [d['id'] for d in available_drivers_for_vrp]
+
+    # 2. Get Distance Matrix over the distinct locations, then spread it onto the routing nodes
+    report_progress("matrix", locations=len(locations))
+    matrix_results = get_distance_matrix(locations, approximate_fallback=APPROXIMATE_MATRIX_FALLBACK)
+    if not matrix_results:
+        logger.error("OPTIMIZE: Failed to get distance/duration matrix for VRP.")
+        raise OptimizationError("Failed to calculate matrix for VRP optimization")
+
+    time_matrix = matrix_results.get("durations")
+    distance_matrix = matrix_results.get("distances")
+
+    if time_matrix is None or distance_matrix is None:
+        logger.error("OPTIMIZE: Matrix results are incomplete for VRP.")
+        raise OptimizationError("Incomplete matrix data for VRP optimization")
+    node_grid = np.ix_(node_locations, node_locations)
+    time_matrix, distance_matrix = time_matrix[node_grid], distance_matrix[node_grid]
+    all_unique_coords = [locations[location] for location in node_locations]
+
+    # 3. Prepare data for OR-Tools solve_vrp
+    time_limit_override, plateau_seconds = solver_budget_options(data)
+    vrp_data = {
+        "locations_coords": all_unique_coords,
+        "num_vehicles": len(available_drivers_for_vrp),
+        "depot_index": 0,
+        "service_durations_seconds": service_durations_seconds_list,
+        "time_matrix_seconds": time_matrix,
+        "distance_matrix_meters": distance_matrix,
+        "max_daily_seconds": max(d['max_daily_hours'] * 3600 for d in available_drivers_for_vrp) if available_drivers_for_vrp else 8 * 3600,
+        "task_original_ids": [task['id'] for task in tasks],
+        "node_task_ids": node_task_ids_list,
+        "driver_original_ids": vrp_index_to_driver_id,
+        "time_limit_seconds": solver_time_limit_seconds(len(all_unique_coords), time_limit_override),
+        "plateau_seconds": plateau_seconds,
+        "location_dedup": location_dedup,
+        "approximate_pairs": matrix_results.get("approximate_pairs", 0)
+    }
+
+    previous_solution = data.get('previous_solution')
+    if previous_solution:
+        if not isinstance(previous_solution, (dict, list)):
+            raise OptimizationError("'previous_solution' must be a previous optimization result or a list of routes", 400)
+        vrp_data["initial_routes"], vrp_data["warm_start"] = warm_start_routes(previous_solution, vrp_data)
+        logger.info(f"OPTIMIZE: Warm start from previous solution: {vrp_data['warm_start']}")
+    return vrp_data
+
+# --- Asynchronous Optimization Jobs ---
+
+_solver_process_pool = None
+_solver_queue_manager = None
+_solver_pool_lock = threading.Lock()
+
+def get_solver_process_pool() -> ProcessPoolExecutor:
+    # Spawned (not forked) workers, so solver processes never inherit the web server's threads and locks.
+    global _solver_process_pool, _solver_queue_manager
+    with _solver_pool_lock:
+        if _solver_process_pool is None:
+            mp_context = multiprocessing.get_context('spawn')
+            _solver_process_pool = ProcessPoolExecutor(max_workers=SOLVER_PROCESSES, mp_context=mp_context)
+            _solver_queue_manager = mp_context.Manager()
+        return _solver_process_pool
+
+def _solve_vrp_reporting_to_queue(vrp_data: Dict, progress_queue, solver_config: Dict) -> Optional[Dict]:
+    return solve_vrp(vrp_data, on_solution=lambda event: progress_queue.put({**event, "solver_config": solver_config}),
+                     solver_config=solver_config)
+
+def solve_vrp_in_process_pool(vrp_data: Dict, on_solution=None, solver_configs: Optional[List[Dict]] = None) -> Optional[Dict]:
+    # Runs one solve per config in parallel processes over the same time budget and keeps the lowest
+    # objective. on_solution only sees solutions that improve on the best across all configs.
+    solver_configs = solver_configs or [DEFAULT_SOLVER_CONFIG]
+    pool = get_solver_process_pool()
+    progress_queue = _solver_queue_manager.Queue()
+    futures = [pool.submit(_solve_vrp_reporting_to_queue, vrp_data, progress_queue, config) for config in solver_configs]
+    best_objective = None
+
+    def forward(event):
+        nonlocal best_objective
+        if best_objective is not None and event["objective"] >= best_objective:
+            return
+        best_objective = event["objective"]
+        if on_solution:
+            on_solution(event)
+
+    while True:
+        try:
+            forward(progress_queue.get(timeout=0.2))
+        except queue.Empty:
+            if all(f.done() for f in futures):
+                break
+    while not progress_queue.empty():
+        forward(progress_queue.get())
+
+    results = []
+    for config, future in zip(solver_configs, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"VRP portfolio run {config} failed: {e}", exc_info=True)
+            results.append(None)
+    solved = [r for r in results if r and r["objective"] is not None]
+    if not solved:
+        return next((r for r in results if r), None)
+    best = min(solved, key=lambda r: r["objective"])
+    if len(solver_configs) > 1:
+        best["portfolio"] = [
+            {"solver_config": config, "objective": r["objective"] if r else None}
+            for config, r in zip(solver_configs, results)
+        ]
+        logger.info(f"VRP portfolio winner: {best['solver_config']} (objective {best['objective']}).")
+    return best
+
+def portfolio_solver_configs(payload: Dict) -> Optional[List[Dict]]:
+    # 'portfolio': true races the built-in SOLVER_PORTFOLIO; a list races the given configs.
+    portfolio = payload.get('portfolio')
+    if not portfolio:
+        return None
+    configs = SOLVER_PORTFOLIO[:max(1, SOLVER_PROCESSES)] if portfolio is True else portfolio
+    if not isinstance(configs, list) or not all(isinstance(c, dict) for c in configs):
+        raise OptimizationError("'portfolio' must be true or a list of solver configs", 400)
+    # Each config is one solver process; more than the pool holds would just queue behind the race.
+    if len(configs) > max(1, SOLVER_PROCESSES):
+        raise OptimizationError(f"'portfolio' may list at most {max(1, SOLVER_PROCESSES)} solver configs", 400)
+    try:
+        return [parse_solver_config(c) for c in configs]
+    except ValueError as e:
+        raise OptimizationError("Invalid solver config in 'portfolio'", 400, str(e))
+
+optimization_jobs = {}
+optimization_jobs_condition = threading.Condition()
+optimization_job_executor = ThreadPoolExecutor(max_workers=OPTIMIZATION_JOB_WORKERS, thread_name_prefix="optimize-job")
+
+def _record_job_event(job_id: str, event: str, **fields):
+    with optimization_jobs_condition:
+        job = optimization_jobs.get(job_id)
+        if job is None:
+            return
+        if event == "phase":
+            job["phase"] = fields["phase"]
+        elif event == "solution":
+            job["best_solution"] = fields
+        elif event in ("completed", "failed"):
+            job["status"] = event
+            job["phase"] = "done"
+        job["updated_at"] = time.time()
+        job["events"].append({"id": len(job["events"]), "event": event, "data": fields})
+        optimization_jobs_condition.notify_all()
+
+def _run_optimization_job(job_id: str, payload: Dict):
+    with optimization_jobs_condition:
+        optimization_jobs[job_id]["status"] = "running"
+    try:
+        solver_configs = portfolio_solver_configs(payload)
+        on_progress = lambda phase, **info: _record_job_event(job_id, "phase", phase=phase, **info)
+        on_solution = lambda event: _record_job_event(job_id, "solution", **event)
+        if use_decomposition(payload):
+            optimization_solution = optimize_decomposed(payload, on_progress=on_progress, on_solution=on_solution,
+                                                        solver_configs=solver_configs)
+        else:
+            vrp_data = build_vrp_instance(payload, on_progress=on_progress)
+            _record_job_event(job_id, "phase", phase="solving", locations=len(vrp_data['locations_coords']),
+                              vehicles=vrp_data['num_vehicles'], solver_runs=len(solver_configs or [DEFAULT_SOLVER_CONFIG]))
+            optimization_solution = solve_vrp_in_process_pool(vrp_data, on_solution=on_solution, solver_configs=solver_configs)
+        if not optimization_solution:
+            _record_job_event(job_id, "failed", error="No optimal solution found",
+                              details="OR-Tools could not find a feasible solution for the given constraints")
+            return
+        defer_geometry = bool(payload.get('defer_geometry', False))
+        _record_job_event(job_id, "phase", phase="geometry", deferred=defer_geometry)
+        attach_route_geometry(optimization_solution, defer_geometry=defer_geometry)
+        with optimization_jobs_condition:
+            optimization_jobs[job_id]["result"] = optimization_solution
+        _record_job_event(job_id, "completed")
+        logger.info(f"OPTIMIZE_JOB: Job {job_id} completed.")
+    except OptimizationError as e:
+        _record_job_event(job_id, "failed", **e.to_dict())
+    except Exception as e:
+        logger.error(f"OPTIMIZE_JOB: Job {job_id} failed: {e}", exc_info=True)
+        _record_job_event(job_id, "failed", error="Optimization process failed due to an unexpected error", details=str(e))
+
+def submit_optimization_job(payload: Dict) -> str:
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    with optimization_jobs_condition:
+        expired = [jid for jid, job in optimization_jobs.items()
+                   if job["status"] in ("completed", "failed") and now - job["updated_at"] > OPTIMIZATION_JOB_TTL_SECONDS]
+        for expired_job_id in expired:
+            del optimization_jobs[expired_job_id]
+        optimization_jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "phase": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "best_solution": None,
+            "result": None,
+            "events": []
+        }
+    optimization_job_executor.submit(_run_optimization_job, job_id, payload)
+    return job_id
+
+def get_optimization_job_snapshot(job_id: str) -> Optional[Dict]:
+    with optimization_jobs_condition:
+        job = optimization_jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = {k: v for k, v in job.items() if k != "events"}
+        failure = next((e["data"] for e in reversed(job["events"]) if e["event"] == "failed"), None)
+        if failure:
+            snapshot["error"] = failure
+        return snapshot
+
+# --- Geographic Decomposition ---
+
+def use_decomposition(data: Dict) -> bool:
+    # 'decompose': true/false forces it; otherwise large requests (DECOMPOSITION_AUTO_MIN_TASKS, 0 disables) decompose.
+    decompose = data.get('decompose')
+    if decompose is None:
+        return DECOMPOSITION_AUTO_MIN_TASKS > 0 and len(data.get('tasks') or []) >= DECOMPOSITION_AUTO_MIN_TASKS
+    return bool(decompose)
+
+def project_coords(coords: np.ndarray, reference_lat: float) -> np.ndarray:
+    # Equirectangular (lat, lon) -> km, plenty for clustering at country scale.
+    return np.column_stack([coords[:, 1] * 111.32 * np.cos(np.radians(reference_lat)), coords[:, 0] * 110.57])
+
+def kmeans_clusters(points: np.ndarray, k: int, iterations: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+    # Lloyd's iterations from a seeded k-means++ start, so the same request always decomposes the same way.
+    # Returns (labels, centroids); clusters that end up empty are dropped.
+    rng = np.random.default_rng(0)
+    centroids = points[[rng.integers(len(points))]]
+    for _ in range(1, k):
+        nearest = ((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        if nearest.sum() == 0:
+            break
+        centroids = np.vstack([centroids, points[rng.choice(len(points), p=nearest / nearest.sum())]])
+    labels = ((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    for _ in range(iterations):
+        updated = np.array([points[labels == c].mean(axis=0) if np.any(labels == c) else centroids[c] for c in range(len(centroids))])
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+        labels = ((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    used = np.unique(labels)
+    return np.searchsorted(used, labels), centroids[used]
+
+def allocate_drivers_to_clusters(driver_points: np.ndarray, centroids: np.ndarray, cluster_sizes: np.ndarray) -> List[List[int]]:
+    # Every cluster gets at least one driver and the rest are shared in proportion to cluster size;
+    # within those quotas drivers go to the nearest cluster, closest pairs first. Needs len(centroids) <= drivers.
+    num_drivers, num_clusters = len(driver_points), len(centroids)
+    quotas = np.maximum(1, np.floor(cluster_sizes / cluster_sizes.sum() * num_drivers)).astype(int)
+    while quotas.sum() > num_drivers:
+        quotas[np.argmax(np.where(quotas > 1, quotas, 0))] -= 1
+    while quotas.sum() < num_drivers:
+        quotas[np.argmax(cluster_sizes / quotas)] += 1
+
+    distances = ((driver_points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    assignment = [[] for _ in range(num_clusters)]
+    allocated = np.zeros(num_drivers, dtype=bool)
+    for flat_index in np.argsort(distances, axis=None):
+        driver, cluster = divmod(int(flat_index), num_clusters)
+        if allocated[driver] or len(assignment[cluster]) >= quotas[cluster]:
+            continue
+        assignment[cluster].append(driver)
+        allocated[driver] = True
+    return assignment
+
+def _geocode_or_fail(addresses: List[str]) -> List[Tuple[float, float]]:
+    coords_list = ors_map(get_coordinates, addresses)
+    for addr, coords in zip(addresses, coords_list):
+        if not coords:
+            logger.error(f"OPTIMIZE: Failed to geocode critical address for VRP: {addr}")
+            raise OptimizationError("Failed to geocode one or more critical addresses for VRP optimization", 400)
+    return coords_list
+
+def repair_cluster_boundaries(routes: List[Dict], task_coords: List[Tuple[float, float]], service_seconds: np.ndarray,
+                              task_cluster_km: np.ndarray, unassigned: List[int]) -> Tuple[List[int], List[int]]:
+    # Cross-cluster repair after the per-cluster solves: tasks a cluster had to drop are inserted into
+    # routes of the two nearest clusters, and boundary tasks (almost as close to a neighbouring cluster
+    # as to their own) move to a neighbouring route when it takes them for less than they cost where
+    # they are. Returns (repaired, moved) task indices; routes are updated in place.
+    nearest_clusters = np.argsort(task_cluster_km, axis=1)
+    task_route = {t: r for r, route in enumerate(routes) for t in route["stops"]}
+    groups = {}
+    for t in unassigned:
+        groups.setdefault(tuple(sorted(nearest_clusters[t, :2].tolist())), []).append(t)
+    for t, r in sorted(task_route.items()):
+        own = routes[r]["cluster"]
+        neighbour = int(next(c for c in nearest_clusters[t] if c != own))
+        if task_cluster_km[t, own] >= DECOMPOSITION_BOUNDARY_RATIO * task_cluster_km[t, neighbour]:
+            groups.setdefault(tuple(sorted((own, neighbour))), []).append(t)
+
+    repaired, moved = [], []
+    for clusters, candidates in groups.items():
+        group_routes = [r for r, route in enumerate(routes) if route["cluster"] in clusters]
+        if not group_routes:
+            continue
+        # Local nodes: one depot per route, then every task on those routes plus the candidates
+        node_coords = [routes[r]["depot"] for r in group_routes]
+        route_depot_node = {r: i for i, r in enumerate(group_routes)}
+        group_tasks = list(dict.fromkeys([t for r in group_routes for t in routes[r]["stops"]] + candidates))
+        task_node = {t: len(node_coords) + i for i, t in enumerate(group_tasks)}
+        node_coords += [task_coords[t] for t in group_tasks]
+
+        # Only arcs within a route and arcs to or from a candidate are ever evaluated: each route's own square
+        # (mostly pair-cache hits from its cluster solve) plus the candidates' rows and columns, rather than
+        # the full cross-cluster square. Arcs between routes are never needed and stay NaN.
+        candidate_coords = [task_coords[t] for t in candidates]
+        candidate_nodes = [task_node[t] for t in candidates]
+        route_nodes = [[route_depot_node[r]] + [task_node[t] for t in routes[r]["stops"]] for r in group_routes]
+        blocks = [(nodes, nodes) for nodes in route_nodes] + [(list(range(len(node_coords))), candidate_nodes),
+                                                               (candidate_nodes, list(range(len(node_coords))))]
+        matrices = ors_map(lambda block: build_matrix([node_coords[i] for i in block[0]], [node_coords[j] for j in block[1]],
+                                                      approximate_fallback=APPROXIMATE_MATRIX_FALLBACK), blocks)
+        if any(m is None for m in matrices):
+            logger.warning(f"DECOMPOSE: Matrix unavailable for boundary repair between clusters {clusters}, skipping.")
+            continue
+        durations = np.full((len(node_coords), len(node_coords)), np.nan)
+        for (rows, cols), matrix_results in zip(blocks, matrices):
+            durations[np.ix_(rows, cols)] = matrix_results["durations"]
+        node_service = np.concatenate([np.zeros(len(group_routes)), service_seconds[group_tasks]])
+        transit_matrix = build_transit_matrix(durations, node_service)
+        local_routes = {r: [task_node[t] for t in routes[r]["stops"]] for r in group_routes}
+        route_durations = {r: route_transit(local_routes[r], transit_matrix, route_depot_node[r], route_depot_node[r])
+                           for r in group_routes}
+
+        for t in candidates:
+            node = task_node[t]
+            current = task_route.get(t)
+            saving = None
+            if current is not None:
+                depot = route_depot_node[current]
+                remaining = [n for n in local_routes[current] if n != node]
+                saving = route_durations[current] - route_transit(remaining, transit_matrix, depot, depot)
+            best = None
+            for r in group_routes:
+                if current is not None and routes[r]["cluster"] == routes[current]["cluster"]:
+                    continue
+                depot = route_depot_node[r]
+                position, added = cheapest_insertion(local_routes[r], node, transit_matrix, depot, depot)
+                if route_durations[r] + added <= routes[r]["max_seconds"] and (best is None or added < best[2]):
+                    best = (r, position, added)
+            if best is None or (saving is not None and best[2] >= saving):
+                continue
+            r, position, added = best
+            if current is not None:
+                local_routes[current].remove(node)
+                routes[current]["stops"].remove(t)
+                route_durations[current] -= saving
+                moved.append(t)
+            else:
+                repaired.append(t)
+            local_routes[r].insert(position, node)
+            routes[r]["stops"].insert(position, t)
+            route_durations[r] += added
+            task_route[t] = r
+    return repaired, moved
+
+def path_leg_matrix(path_coords: List[Tuple[float, float]]) -> Optional[Dict]:
+    # Durations and distances of the consecutive legs of a path only. Legs come from the caches where
+    # possible; the rest are requested as one block of just the missing legs' endpoints.
+    sources, destinations = path_coords[:-1], path_coords[1:]
+    durations, distances = cached_matrix_pairs([coord_key(c) for c in sources], [coord_key(c) for c in destinations])
+    legs = np.arange(len(sources))
+    leg_durations, leg_distances = durations[legs, legs], distances[legs, legs]
+    missing = np.flatnonzero(np.isnan(leg_durations))
+    if missing.size:
+        matrix_results = build_matrix([sources[i] for i in missing], [destinations[i] for i in missing],
+                                      approximate_fallback=APPROXIMATE_MATRIX_FALLBACK)
+        if not matrix_results:
+            return None
+        leg_durations[missing] = np.diagonal(matrix_results["durations"])
+        leg_distances[missing] = np.diagonal(matrix_results["distances"])
+    return {"durations": leg_durations, "distances": leg_distances}
+
+def _decomposed_route_output(route: Dict, tasks: List[Dict], task_coords: List[Tuple[float, float]],
+                             service_seconds: np.ndarray) -> Dict:
+    path_coords = [route["depot"]] + [task_coords[t] for t in route["stops"]] + [route["depot"]]
+    leg_results = path_leg_matrix(path_coords)
+    if not leg_results:
+        raise OptimizationError("Failed to calculate matrix for VRP optimization")
+    travel_duration = float(np.nansum(leg_results["durations"]))
+    travel_distance = float(np.nansum(leg_results["distances"]))
+    service_duration = float(service_seconds[route["stops"]].sum())
+    return {
+        "driver_id": route["driver_id"],
+        "driver_name": f"נהג {route['driver_id']}",
+        "route_waypoint_coords": [list(c) for c in path_coords],
+        "assigned_task_ids_sequence": [tasks[t]['id'] for t in route["stops"]],
+        "total_distance_km": round(travel_distance / 1000, 2),
+        "total_duration_minutes": round((travel_duration + service_duration) / 60, 2)
+    }
+
+def decomposition_inputs(data: Dict) -> Tuple[List[Dict], List[Dict], int]:
+    # (tasks, available drivers, number of clusters); under 2 clusters the request is solved as one instance.
+    tasks, drivers = optimization_tasks_and_drivers(data)
+    available_drivers = [d for d in drivers if d.get('is_available', True)]
+    return tasks, available_drivers, min(len(available_drivers), -(-len(tasks) // max(1, DECOMPOSITION_TASKS_PER_CLUSTER)))
+
+def cluster_plan(task_coords: List[Tuple[float, float]], driver_coords: List[Tuple[float, float]], num_clusters: int) -> Dict:
+    # Clusters the tasks, gives each cluster its drivers and lists its matrix locations: the depot (its first
+    # driver's start), then its tasks. Deterministic, so the ASGI prefetcher fetches the same matrices.
+    reference_lat = float(np.mean([c[0] for c in task_coords]))
+    task_points = project_coords(np.array(task_coords, dtype=float), reference_lat)
+    labels, centroids = kmeans_clusters(task_points, num_clusters)
+    cluster_sizes = np.bincount(labels, minlength=len(centroids))
+    cluster_drivers = allocate_drivers_to_clusters(project_coords(np.array(driver_coords, dtype=float), reference_lat),
+                                                   centroids, cluster_sizes)
+    cluster_tasks = [np.flatnonzero(labels == c).tolist() for c in range(len(centroids))]
+    return {
+        "task_points": task_points,
+        "centroids": centroids,
+        "cluster_sizes": cluster_sizes,
+        "cluster_drivers": cluster_drivers,
+        "cluster_tasks": cluster_tasks,
+        "cluster_locations": [[driver_coords[cluster_drivers[c][0]]] + [task_coords[t] for t in cluster_tasks[c]]
+                              for c in range(len(centroids))]
+    }
+
+def optimize_decomposed(data: Dict, on_progress=None, on_solution=None, solver_configs: Optional[List[Dict]] = None) -> Optional[Dict]:
+    # Splits a large request into geographic clusters (k-means over task locations), gives each cluster
+    # its nearest drivers, solves the sub-VRPs in parallel on the solver process pool and repairs the
+    # cluster boundaries. Each cluster's depot is the start of its nearest driver. Clusters already take
+    # a solver process each, so they run the first of solver_configs rather than racing the portfolio.
+    def report_progress(phase, **info):
+        if on_progress:
+            on_progress(phase, **info)
+
+    tasks, available_drivers, num_clusters = decomposition_inputs(data)
+    if num_clusters < 2:
+        logger.info(f"DECOMPOSE: {len(tasks)} tasks / {len(available_drivers)} drivers do not split, solving as one instance.")
+        return solve_vrp_in_process_pool(build_vrp_instance(data, on_progress=on_progress), on_solution=on_solution,
+                                         solver_configs=solver_configs)
+    if data.get('previous_solution'):
+        logger.warning("DECOMPOSE: 'previous_solution' is ignored when decomposing.")
+    time_limit_override, plateau_seconds = solver_budget_options(data)
+
+    # 1. Geocode tasks and driver starts, then cluster
+    report_progress("geocoding", addresses=len(tasks) + len(available_drivers))
+    task_coords = _geocode_or_fail([t['address'] for t in tasks])
+    driver_coords = _geocode_or_fail([d['start_address'] for d in available_drivers])
+    service_seconds = np.array([t['service_duration_minutes'] * 60 for t in tasks], dtype=float)
+
+    report_progress("clustering", clusters=num_clusters)
+    plan = cluster_plan(task_coords, driver_coords, num_clusters)
+    task_points, centroids, cluster_sizes = plan["task_points"], plan["centroids"], plan["cluster_sizes"]
+    cluster_drivers, cluster_tasks = plan["cluster_drivers"], plan["cluster_tasks"]
+    logger.info(f"DECOMPOSE: {len(tasks)} tasks into {len(centroids)} clusters of sizes {cluster_sizes.tolist()}.")
+
+    # 2. Per-cluster matrices (pair-cached, fetched concurrently)
+    report_progress("matrix", clusters=len(centroids))
+
+    def build_cluster_instance(cluster: int) -> Dict:
+        locations = plan["cluster_locations"][cluster]
+        matrix_results = get_distance_matrix(locations, approximate_fallback=APPROXIMATE_MATRIX_FALLBACK)
+        if not matrix_results:
+            logger.error(f"DECOMPOSE: Failed to get distance/duration matrix for cluster {cluster}.")
+            raise OptimizationError("Failed to calculate matrix for VRP optimization")
+        return {
+            "locations_coords": locations,
+            "num_vehicles": len(cluster_drivers[cluster]),
+            "depot_index": 0,
+            "service_durations_seconds": [0] + service_seconds[cluster_tasks[cluster]].tolist(),
+            "time_matrix_seconds": matrix_results["durations"],
+            "distance_matrix_meters": matrix_results["distances"],
+            "max_daily_seconds": max(available_drivers[d]['max_daily_hours'] * 3600 for d in cluster_drivers[cluster]),
+            "task_original_ids": [tasks[t]['id'] for t in cluster_tasks[cluster]],
+            "driver_original_ids": [available_drivers[d]['id'] for d in cluster_drivers[cluster]],
+            "time_limit_seconds": solver_time_limit_seconds(len(locations), time_limit_override),
+            "plateau_seconds": plateau_seconds,
+            "approximate_pairs": matrix_results.get("approximate_pairs", 0)
+        }
+
+    instances = ors_map(build_cluster_instance, list(range(len(centroids))))
+
+    # 3. Solve the clusters in parallel
+    report_progress("solving", clusters=len(instances), locations=len(tasks) + len(instances))
+    pool = get_solver_process_pool()
+    cluster_config = solver_configs[0] if solver_configs else None
+    futures = [pool.submit(solve_vrp, instance, solver_config=cluster_config) for instance in instances]
+    routes, unassigned, cluster_results = [], [], []
+    for cluster, (instance, future) in enumerate(zip(instances, futures)):
+        try:
+            cluster_solution = future.result()
+        except Exception as e:
+            logger.error(f"DECOMPOSE: Cluster {cluster} solve failed: {e}", exc_info=True)
+            cluster_solution = None
+        solved = bool(cluster_solution and cluster_solution["objective"] is not None)
+        task_index = {tasks[t]['id']: t for t in cluster_tasks[cluster]}
+        solved_routes = {r["driver_id"]: r["assigned_task_ids_sequence"] for r in cluster_solution["drivers_assigned_routes"]} if solved else {}
+        for driver_id in instance["driver_original_ids"]:
+            routes.append({
+                "driver_id": driver_id,
+                "cluster": cluster,
+                "depot": instance["locations_coords"][0],
+                "stops": [task_index[task_id] for task_id in solved_routes.get(driver_id, [])],
+                "max_seconds": instance["max_daily_seconds"]
+            })
+        assigned = {t for r in routes if r["cluster"] == cluster for t in r["stops"]}
+        unassigned.extend(t for t in cluster_tasks[cluster] if t not in assigned)
+        cluster_results.append({
+            "task_count": len(cluster_tasks[cluster]),
+            "driver_ids": instance["driver_original_ids"],
+            "objective": cluster_solution["objective"] if solved else None,
+            "solve_time_seconds": cluster_solution.get("solve_time_seconds") if cluster_solution else None,
+            "approximate_pairs": instance["approximate_pairs"]
+        })
+        report_progress("solving", clusters=len(instances), clusters_solved=cluster + 1)
+
+    # 4. Boundary repair and merge
+    report_progress("repair", unassigned=len(unassigned))
+    task_cluster_km = np.sqrt(((task_points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+    repaired, moved = repair_cluster_boundaries(routes, task_coords, service_seconds, task_cluster_km, unassigned)
+    logger.info(f"DECOMPOSE: Repair inserted {len(repaired)} unassigned tasks and moved {len(moved)} boundary tasks.")
+
+    assigned = {t for r in routes for t in r["stops"]}
+    return {
+        "drivers_assigned_routes": ors_map(lambda r: _decomposed_route_output(r, tasks, task_coords, service_seconds), routes),
+        "unassigned_task_ids": [tasks[t]['id'] for t in range(len(tasks)) if t not in assigned],
+        "objective": None,
+        "decomposition": {
+            "clusters": cluster_results,
+            "repaired_task_ids": [tasks[t]['id'] for t in repaired],
+            "moved_task_ids": [tasks[t]['id'] for t in moved]
+        }
+    }
+
+# --- Driver Location Index ---
+
+class DriverLocationIndex:
+    # Base coordinates of all drivers in one array, so ranking them by straight-line distance is a single
+    # vectorised haversine. sync() re-geocodes only drivers that are new or whose base_address changed.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._addresses = {}
+        self._locations = {}
+        self._driver_ids = []
+        self._coords = np.empty((0, 2))
+
+    def sync(self, drivers: Dict[str, Dict]):
+        with self._lock:
+            stale = [d for d in drivers.values() if self._addresses.get(d['id']) != d.get('base_address')]
+            removed = [driver_id for driver_id in self._addresses if driver_id not in drivers]
+        if not stale and not removed:
+            return
+        located = ors_map(get_coordinates, [d['base_address'] for d in stale])
+        with self._lock:
+            for driver_info, coords in zip(stale, located):
+                if not coords:
+                    logger.warning(f"DRIVER_INDEX: Cannot geocode driver {driver_info['id']} base address {driver_info['base_address']}.")
+                    self._locations.pop(driver_info['id'], None)
+                    continue
+                self._addresses[driver_info['id']] = driver_info['base_address']
+                self._locations[driver_info['id']] = coords
+            for driver_id in removed:
+                self._addresses.pop(driver_id, None)
+                self._locations.pop(driver_id, None)
+            self._driver_ids = list(self._locations)
+            self._coords = np.array([self._locations[i] for i in self._driver_ids], dtype=float).reshape(-1, 2)
+        location_registry.register([c for c in located if c], label="driver_base")
+        logger.info(f"DRIVER_INDEX: {len(stale)} drivers (re)indexed, {len(removed)} removed, {len(self._driver_ids)} indexed.")
+
+    def locations(self, drivers: List[Dict]) -> Dict[str, Tuple[float, float]]:
+        with self._lock:
+            return {d['id']: self._locations[d['id']] for d in drivers if d['id'] in self._locations}
+
+    def nearest(self, point: Tuple[float, float], drivers: List[Dict]) -> List[Tuple[Dict, Tuple[float, float]]]:
+        # The given drivers that have indexed coordinates, nearest first, as (driver_info, base_coords).
+        with self._lock:
+            driver_ids, coords = self._driver_ids, self._coords
+        by_id = {d['id']: d for d in drivers}
+        candidate = np.array([driver_id in by_id for driver_id in driver_ids], dtype=bool)
+        if not candidate.any():
+            return []
+        distances = np.where(candidate, haversine_km(point, coords), np.inf)
+        order = np.argsort(distances, kind='stable')[:int(candidate.sum())]
+        return [(by_id[driver_ids[i]], tuple(coords[i])) for i in order]
+
+driver_location_index = DriverLocationIndex()
+
+def road_travel_to(target_coords: Tuple[float, float], source_coords: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    # (distance_km, minutes) from every source to the target, from one pair-cached sources x 1 matrix request;
+    # pairs ORS can't answer are estimated.
+    if not source_coords:
+        return []
+    matrix_results = build_matrix(source_coords, [target_coords], approximate_fallback=True)
+    matrix_results = fill_approximate_pairs(source_coords, [target_coords], matrix_results["durations"],
+                                            matrix_results["distances"], np.isnan(matrix_results["durations"]))
+    durations, distances = matrix_results["durations"][:, 0], matrix_results["distances"][:, 0]
+    return list(zip(np.round(distances / 1000, 2).tolist(), np.round(durations / 60, 2).tolist()))
+
+def ride_candidate_drivers(exclude_driver_ids=()) -> List[Dict]:
+    return [d for driver_id, d in mock_drivers_data.items() if driver_id not in exclude_driver_ids and d.get('is_available', False)]
+
+def nearest_driver_batches(point: Tuple[float, float], candidate_drivers: List[Dict]) -> List[List[Tuple[Dict, Tuple[float, float]]]]:
+    # The candidates with known bases, nearest the point in a straight line first, in batches of
+    # DRIVER_CANDIDATE_POOL (driver_info, base_coords); each batch is priced with one insertion_plan.
+    driver_location_index.sync(mock_drivers_data)
+    ranked = driver_location_index.nearest(point, candidate_drivers)
+    batch_size = max(1, DRIVER_CANDIDATE_POOL)
+    return [ranked[start:start + batch_size] for start in range(0, len(ranked), batch_size)]
+
+def evaluate_nearest_drivers(batches: List[List[Tuple[Dict, Tuple[float, float]]]], evaluate_batch, wanted: int) -> List[Dict]:
+    # evaluate_batch(candidates) -> the candidates' passing results, batch by batch until `wanted` drivers pass.
+    results = []
+    for batch in batches:
+        results += [r for r in evaluate_batch(batch) if r]
+        if len(results) >= wanted:
+            break
+    return results
+
+# --- Driver Schedule Index ---
+
+def schedule_entry_bounds(entry: Dict) -> Tuple[float, float]:
+    start = datetime.fromisoformat(entry['start_time_iso']).timestamp()
+    if entry.get('end_time_iso'):
+        return start, datetime.fromisoformat(entry['end_time_iso']).timestamp()
+    return start, start + entry.get('duration_minutes', 0) * 60
+
+class DriverDaySchedule:
+    # One driver's entries for one weekday, which spans every date falling on it. The entries list is the
+    # driver's own schedule list, kept sorted by start time, alongside parsed start times, end times, a
+    # running maximum of end times and durations, so conflict checks are a bisect and a date's workload is a
+    # bisect plus a sum over that date's entries. Intervals are half-open.
+    def __init__(self, entries: List[Dict]):
+        entries.sort(key=lambda e: schedule_entry_bounds(e)[0])
+        self.entries = entries
+        bounds = [schedule_entry_bounds(e) for e in entries]
+        self.starts = [start for start, _ in bounds]
+        self.ends = [end for _, end in bounds]
+        self.max_ends = list(itertools.accumulate(self.ends, max))
+        self.durations = [e.get('duration_minutes', 0) for e in entries]
+
+    def overlaps(self, start: float, end: float) -> bool:
+        position = bisect.bisect_left(self.starts, end)
+        return position > 0 and self.max_ends[position - 1] > start
+
+    def workload_minutes(self, day_start: float, day_end: float) -> float:
+        return sum(self.durations[bisect.bisect_left(self.starts, day_start):bisect.bisect_left(self.starts, day_end)])
+
+    def add(self, entry: Dict):
+        # The list inserts are a memmove; only the running maxima the new end raises are rewritten, which
+        # for an entry that overlaps nothing is none of them.
+        start, end = schedule_entry_bounds(entry)
+        position = bisect.bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        self.entries.insert(position, entry)
+        self.durations.insert(position, entry.get('duration_minutes', 0))
+        self.max_ends.insert(position, max(end, self.max_ends[position - 1]) if position > 0 else end)
+        raised_until = bisect.bisect_left(self.max_ends, end, position + 1)
+        self.max_ends[position + 1:raised_until] = [end] * (raised_until - position - 1)
+
+class ScheduleIndex:
+    # DriverDaySchedule per (driver, day), built on first use and rebuilt if the schedule list was replaced
+    # or changed size behind the index's back.
+    def __init__(self):
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def _day(self, driver_info: Dict, day: str, create: bool = False) -> Optional[DriverDaySchedule]:
+        entries = driver_info['schedule'].setdefault(day, []) if create else driver_info['schedule'].get(day)
+        if entries is None:
+            return None
+        key = (driver_info['id'], day)
+        day_schedule = self._days.get(key)
+        if day_schedule is None or day_schedule.entries is not entries or len(day_schedule.starts) != len(entries):
+            day_schedule = DriverDaySchedule(entries)
+            self._days[key] = day_schedule
+        return day_schedule
+
+    def workload_minutes(self, driver_info: Dict, on_date) -> float:
+        # Minutes of the entries starting on on_date, not the whole weekday.
+        day_start = datetime.combine(on_date, datetime.min.time()).timestamp()
+        day_end = datetime.combine(on_date + timedelta(days=1), datetime.min.time()).timestamp()
+        with self._lock:
+            day_schedule = self._day(driver_info, on_date.strftime('%A'))
+            return day_schedule.workload_minutes(day_start, day_end) if day_schedule else 0
+
+    def overlaps(self, driver_info: Dict, day: str, start: float, end: float) -> bool:
+        with self._lock:
+            day_schedule = self._day(driver_info, day)
+            return bool(day_schedule and day_schedule.overlaps(start, end))
+
+    def neighbours(self, driver_info: Dict, day: str, start: float, end: float) -> Optional[Tuple[Optional[Dict], Optional[Dict]]]:
+        # The entries just before and just after [start, end) (None at either end), or None if it overlaps one.
+        with self._lock:
+            day_schedule = self._day(driver_info, day)
+            if not day_schedule:
+                return None, None
+            if day_schedule.overlaps(start, end):
+                return None
+            position = bisect.bisect_left(day_schedule.starts, end)
+            return (day_schedule.entries[position - 1] if position > 0 else None,
+                    day_schedule.entries[position] if position < len(day_schedule.entries) else None)
+
+    def add(self, driver_info: Dict, day: str, entry: Dict) -> bool:
+        # Inserts the entry unless it overlaps an existing one; returns whether it was added.
+        start, end = schedule_entry_bounds(entry)
+        with self._lock:
+            day_schedule = self._day(driver_info, day, create=True)
+            if day_schedule.overlaps(start, end):
+                return False
+            day_schedule.add(entry)
+            return True
+
+schedule_index = ScheduleIndex()
+
+# --- Ride Insertion ---
+
+def _travel_leg(matrix_results: Optional[Dict], row: int, col: int, start_coords, end_coords) -> Tuple[float, float]:
+    # (seconds, meters) from a matrix cell, or the straight-line estimate where ORS had no answer.
+    if matrix_results is not None:
+        duration, distance = matrix_results["durations"][row, col], matrix_results["distances"][row, col]
+        if not (np.isnan(duration) or np.isnan(distance)):
+            return float(duration), float(distance)
+    distance_km, minutes = approximate_travel(start_coords, end_coords)
+    return minutes * 60, distance_km * 1000
+
+def insertion_gaps(candidates: List[Tuple[Dict, Tuple[float, float]]], window: Optional[Tuple[float, float]]) -> List[Optional[Tuple]]:
+    # Per candidate, the (previous_entry, next_entry, previous_coords, next_coords) gap the window falls
+    # into on its date, or None where it overlaps an entry.
+    on_date = datetime.fromtimestamp(window[0]).date() if window else datetime.now().date()
+    day = on_date.strftime('%A')
+    day_end = datetime.combine(on_date + timedelta(days=1), datetime.min.time()).timestamp()
+    slot = window or (day_end, day_end)
+
+    def same_day(entry: Optional[Dict]) -> Optional[Dict]:
+        return entry if entry and datetime.fromtimestamp(schedule_entry_bounds(entry)[0]).date() == on_date else None
+
+    gaps = []
+    for driver_info, base_coords in candidates:
+        neighbours = schedule_index.neighbours(driver_info, day, *slot)
+        if neighbours is None:
+            gaps.append(None)
+            continue
+        previous_entry, next_entry = same_day(neighbours[0]), same_day(neighbours[1])
+        previous_coords = tuple(previous_entry['destination_coords']) if previous_entry and previous_entry.get('destination_coords') else base_coords
+        next_coords = tuple(next_entry['origin_coords']) if next_entry and next_entry.get('origin_coords') else None
+        gaps.append((previous_entry, next_entry, previous_coords, next_coords))
+    return gaps
+
+def insertion_plan(candidates: List[Tuple[Dict, Tuple[float, float]]], pickup_coords: Tuple[float, float],
+                   dropoff_coords: Tuple[float, float], window: Optional[Tuple[float, float]]) -> Dict:
+    # The gap each candidate's ride would go into and the two matrix requests (sources, destinations) that
+    # price every gap at once: from where each open gap starts to the pickup and to the distinct next
+    # entries, and from the drop-off to those next entries. rank_ride_insertions sends them with
+    # build_matrix and the ASGI prefetcher with the async client, so both ask ORS the same questions.
+    gaps = insertion_gaps(candidates, window)
+    open_gaps = [g for g in gaps if g]
+    previous_list = [g[2] for g in open_gaps]
+    next_list = list({coord_key(g[3]): g[3] for g in open_gaps if g[3] is not None}.values())
+    return {
+        "gaps": gaps,
+        "next_column": {coord_key(c): i for i, c in enumerate(next_list)},
+        "to_pickup": (previous_list, [pickup_coords] + next_list) if previous_list else None,
+        "from_dropoff": ([dropoff_coords], next_list) if next_list else None
+    }
+
+def rank_ride_insertions(candidates: List[Tuple[Dict, Tuple[float, float]]], pickup_coords: Tuple[float, float],
+                         dropoff_coords: Tuple[float, float], ride_seconds: float, ride_meters: float,
+                         window: Optional[Tuple[float, float]] = None) -> List[Optional[Dict]]:
+    # Cheapest insertion of one ride into each candidate driver's day. The ride goes into the gap around its
+    # time window (or after the day's last entry when it has none), and costs the drive from wherever the
+    # driver is before it, the ride itself, and the change in the drive on to the next entry. Entries on
+    # other dates are ignored, so a driver with nothing else that day starts from base. All candidates share
+    # two pair-cached matrix requests. Returns one result per candidate, or None where the ride overlaps,
+    # cannot be reached in time, or would exceed max_daily_hours.
+    on_date = datetime.fromtimestamp(window[0]).date() if window else datetime.now().date()
+    plan = insertion_plan(candidates, pickup_coords, dropoff_coords, window)
+    next_column = plan["next_column"]
+    to_pickup = build_matrix(*plan["to_pickup"], approximate_fallback=True) if plan["to_pickup"] else None
+    from_dropoff = build_matrix(*plan["from_dropoff"], approximate_fallback=True) if plan["from_dropoff"] else None
+
+    results = []
+    row = 0
+    for (driver_info, base_coords), gap in zip(candidates, plan["gaps"]):
+        if gap is None:
+            results.append(None)
+            continue
+        previous_entry, next_entry, previous_coords, next_coords = gap
+        to_pickup_seconds, to_pickup_meters = _travel_leg(to_pickup, row, 0, previous_coords, pickup_coords)
+        onward_seconds = onward_meters = from_dropoff_seconds = 0
+        if next_coords is not None:
+            column = next_column[coord_key(next_coords)]
+            from_dropoff_seconds, from_dropoff_meters = _travel_leg(from_dropoff, 0, column, dropoff_coords, next_coords)
+            direct_seconds, direct_meters = _travel_leg(to_pickup, row, 1 + column, previous_coords, next_coords)
+            onward_seconds, onward_meters = from_dropoff_seconds - direct_seconds, from_dropoff_meters - direct_meters
+        row += 1
+
+        if window:
+            previous_end = schedule_entry_bounds(previous_entry)[1] if previous_entry else float('-inf')
+            next_start = schedule_entry_bounds(next_entry)[0] if next_entry else float('inf')
+            if window[0] - to_pickup_seconds < previous_end or window[1] + from_dropoff_seconds > next_start:
+                results.append(None)
+                continue
+        added_seconds = to_pickup_seconds + ride_seconds + onward_seconds
+        workload_minutes = schedule_index.workload_minutes(driver_info, on_date)
+        if workload_minutes + added_seconds / 60 > driver_info['max_daily_hours'] * 60:
+            results.append(None)
+            continue
+        results.append({
+            "driver_info": driver_info,
+            "base_coords": base_coords,
+            "distance_to_start_km": round(to_pickup_meters / 1000, 2),
+            "time_to_start_minutes": round(to_pickup_seconds / 60, 2),
+            "insertion": {
+                "added_minutes": round(added_seconds / 60, 2),
+                "added_km": round((to_pickup_meters + ride_meters + onward_meters) / 1000, 2),
+                "after_ride_id": previous_entry.get('ride_id') if previous_entry else None,
+                "before_ride_id": next_entry.get('ride_id') if next_entry else None,
+                "workload_minutes_after": round(workload_minutes + added_seconds / 60, 2)
+            }
+        })
+    return results
+
+# --- Bulk Ride Assignment ---
+
+def solve_pickup_delivery(data: Dict) -> Optional[Dict]:
+    # Pickup-and-delivery VRP over a day. Nodes: one start per vehicle (its base), a shared free end, then
+    # (pickup, delivery) pairs. Each pair stays on one vehicle with pickup first, and a vehicle carries one
+    # booking at a time, so the result maps onto non-overlapping schedule entries. Existing schedule entries
+    # are pairs pinned to their vehicle and start time; new rides are optional, and their delivery must
+    # fall in a window ending at the required arrival. Times are seconds from the day's midnight. Pairs with
+    # a 'delivery_soft_end' pay per second of delivery after it; dropped pairs are listed in dropped_pair_ids.
+    # vehicle_max_seconds caps each vehicle's workload, the driving it does, not the span of its day.
+    logger.info("--- Starting Pickup-and-Delivery Optimization ---")
+    num_vehicles = data['num_vehicles']
+    node_locations = np.asarray(data['node_locations'])
+    num_nodes = len(node_locations)
+    end_node = data['end_node']
+    horizon = data['horizon_seconds']
+
+    time_matrix = np.asarray(data['time_matrix_seconds'], dtype=float)
+    node_transit = build_transit_matrix(time_matrix[np.ix_(np.maximum(node_locations, 0), np.maximum(node_locations, 0))],
+                                        np.zeros(num_nodes))
+    node_transit[:, end_node] = 0
+    node_transit[end_node, :] = 0
+
+    manager = pywrapcp.RoutingIndexManager(num_nodes, num_vehicles, list(range(num_vehicles)), [end_node] * num_vehicles)
+    routing = pywrapcp.RoutingModel(manager)
+    solver = routing.solver()
+    transit_callback_index = routing.RegisterTransitMatrix(node_transit.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    routing.AddDimension(transit_callback_index, horizon, horizon, False, 'Time')
+    time_dimension = routing.GetDimensionOrDie('Time')
+    # Same transits without the waiting the Time dimension allows between rides
+    routing.AddDimensionWithVehicleCapacity(transit_callback_index, 0, [int(s) for s in data['vehicle_max_seconds']],
+                                            True, 'Workload')
+
+    occupancy = np.zeros(num_nodes, dtype=np.int64)
+    for pair in data['pairs']:
+        occupancy[pair['pickup']], occupancy[pair['delivery']] = 1, -1
+    occupancy_callback_index = routing.RegisterUnaryTransitVector(occupancy.tolist())
+    routing.AddDimensionWithVehicleCapacity(occupancy_callback_index, 0, [1] * num_vehicles, True, 'Occupancy')
+
+    for pair in data['pairs']:
+        pickup_index, delivery_index = manager.NodeToIndex(pair['pickup']), manager.NodeToIndex(pair['delivery'])
+        routing.AddPickupAndDelivery(pickup_index, delivery_index)
+        solver.Add(routing.VehicleVar(pickup_index) == routing.VehicleVar(delivery_index))
+        solver.Add(time_dimension.CumulVar(pickup_index) <= time_dimension.CumulVar(delivery_index))
+        if len(pair['allowed_vehicles']) < num_vehicles:
+            # -1 keeps optional pairs droppable
+            routing.VehicleVar(pickup_index).SetValues(list(pair['allowed_vehicles']) + [-1])
+        time_dimension.CumulVar(pickup_index).SetRange(*pair['pickup_window'])
+        time_dimension.CumulVar(delivery_index).SetRange(*pair['delivery_window'])
+        if pair.get('delivery_soft_end') is not None:
+            time_dimension.SetCumulVarSoftUpperBound(delivery_index, pair['delivery_soft_end'], 1000)
+        if pair.get('penalty'):
+            routing.AddDisjunction([pickup_index], pair['penalty'])
+            routing.AddDisjunction([delivery_index], pair['penalty'])
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
+    search_parameters.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    search_parameters.time_limit.FromMilliseconds(int(data['time_limit_seconds'] * 1000))
+    solve_started = time.monotonic()
+    solution = routing.SolveWithParameters(search_parameters)
+    solve_time_seconds = round(time.monotonic() - solve_started, 3)
+    if not solution:
+        logger.warning("No pickup-and-delivery solution found by OR-Tools.")
+        return None
+
+    pair_by_pickup = {pair['pickup']: pair for pair in data['pairs']}
+    routes = []
+    for vehicle_id in range(num_vehicles):
+        stops = []
+        index = solution.Value(routing.NextVar(routing.Start(vehicle_id)))
+        previous_node = vehicle_id
+        while not routing.IsEnd(index):
+            node = manager.IndexToNode(index)
+            pair = pair_by_pickup.get(node)
+            if pair is not None:
+                delivery_index = manager.NodeToIndex(pair['delivery'])
+                delivery_time = solution.Min(time_dimension.CumulVar(delivery_index))
+                # As late as the solution allows, so the passenger is not picked up early and kept waiting
+                pickup_time = min(solution.Max(time_dimension.CumulVar(index)),
+                                  max(solution.Min(time_dimension.CumulVar(index)), delivery_time - int(node_transit[node, pair['delivery']])))
+                stops.append({
+                    "pair_id": pair['id'],
+                    "pickup_seconds": pickup_time,
+                    "delivery_seconds": delivery_time,
+                    "deadhead_seconds": int(node_transit[previous_node, node])
+                })
+                previous_node = pair['delivery']
+            index = solution.Value(routing.NextVar(index))
+        routes.append(stops)
+    routed_pair_ids = {stop['pair_id'] for stops in routes for stop in stops}
+    dropped_pair_ids = [pair['id'] for pair in data['pairs'] if pair['id'] not in routed_pair_ids]
+    logger.info(f"Pickup-and-delivery solved in {solve_time_seconds}s, objective {solution.ObjectiveValue()}.")
+    return {"routes": routes, "dropped_pair_ids": dropped_pair_ids, "objective": solution.ObjectiveValue(),
+            "solve_time_seconds": solve_time_seconds}
+
+def assign_pending_rides(on_date, ride_ids: Optional[List[str]] = None, dry_run: bool = False,
+                         time_limit_override: Optional[float] = None) -> Dict:
+    # Assigns the day's pending rides to available drivers in one pickup-and-delivery solve, around the
+    # drivers' existing entries for that date. Raises OptimizationError on failure.
+    day = on_date.strftime('%A')
+    midnight = datetime.combine(on_date, datetime.min.time())
+    day_start = midnight.timestamp()
+    horizon = 2 * 24 * 3600
+
+    pending = [
+        ride for ride in mock_rides_data.values()
+        if ride.get('status') == 'pending' and (ride_ids is None or ride['id'] in ride_ids)
+        and ride.get('estimated_end_time_iso') and datetime.fromisoformat(ride['estimated_end_time_iso']).date() == on_date
+    ]
+    drivers = [d for d in mock_drivers_data.values() if d.get('is_available', False)]
+    if not pending:
+        return {"date": on_date.isoformat(), "assigned": [], "unassigned_ride_ids": [], "schedule_conflicts": [], "dry_run": dry_run}
+    if not drivers:
+        raise OptimizationError("No available drivers for bulk assignment", 400)
+
+    driver_location_index.sync(mock_drivers_data)
+    base_coords = driver_location_index.locations(drivers)
+    drivers = [d for d in drivers if d['id'] in base_coords]
+
+    # Locations are deduplicated, so repeated addresses share matrix rows
+    locations, location_index = [], {}
+
+    def location(coords) -> int:
+        key = coord_key(coords)
+        if key not in location_index:
+            location_index[key] = len(locations)
+            locations.append(tuple(coords))
+        return location_index[key]
+
+    node_locations = [location(base_coords[d['id']]) for d in drivers] + [-1]
+    end_node = len(drivers)
+    pairs = []
+
+    def add_pair(pair_id, origin, destination, **constraints):
+        node_locations.extend([location(origin), location(destination)])
+        pairs.append({"id": pair_id, "pickup": len(node_locations) - 2, "delivery": len(node_locations) - 1, **constraints})
+
+    # Existing entries on that date are pinned to their driver and start time. Their end is soft, since the
+    # matrix may not agree with the recorded duration, and they can be dropped at a cost no new ride outweighs,
+    # so entries that conflict with each other are reported instead of making the whole solve infeasible.
+    pinned_entries = {}
+    for vehicle_id, driver_info in enumerate(drivers):
+        for entry in driver_info['schedule'].get(day, []):
+            start, end = schedule_entry_bounds(entry)
+            if datetime.fromtimestamp(start).date() != on_date:
+                continue
+            if not entry.get('origin_coords') or not entry.get('destination_coords'):
+                logger.warning(f"BULK_ASSIGN: Entry {entry.get('ride_id')} of driver {driver_info['id']} has no coordinates, ignoring it.")
+                continue
+            pair_id = ('pinned', len(pinned_entries))
+            pinned_entries[pair_id] = (driver_info, entry)
+            offset_start, offset_end = int(start - day_start), int(end - day_start)
+            add_pair(pair_id, entry['origin_coords'], entry['destination_coords'], allowed_vehicles=[vehicle_id],
+                     pickup_window=(offset_start, offset_start), delivery_window=(offset_start, horizon),
+                     delivery_soft_end=max(offset_start, offset_end), penalty=1_000_000_000_000)
+
+    unassigned_ride_ids = []
+    for ride in pending:
+        arrival = int(datetime.fromisoformat(ride['estimated_end_time_iso']).timestamp() - day_start)
+        passengers = int(ride.get('num_passengers') or 1)
+        allowed = [v for v, d in enumerate(drivers) if d.get('vehicle_capacity', DEFAULT_VEHICLE_CAPACITY) >= passengers]
+        if not allowed:
+            unassigned_ride_ids.append(ride['id'])
+            continue
+        earliest_arrival = max(0, arrival - int(BULK_ASSIGN_EARLY_ARRIVAL_MINUTES * 60))
+        add_pair(ride['id'], ride['origin_coords'], ride['destination_coords'], allowed_vehicles=allowed,
+                 pickup_window=(0, arrival), delivery_window=(earliest_arrival, arrival), penalty=10_000_000_000)
+
+    logger.info(f"BULK_ASSIGN: {len(pending)} pending rides, {len(drivers)} drivers, {len(locations)} unique locations.")
+    matrix_results = get_distance_matrix(locations)
+    if not matrix_results:
+        raise OptimizationError("Failed to calculate matrix for bulk assignment")
+
+    # A driver whose existing entries already exceed max_daily_hours keeps them; only new rides are held to the cap
+    durations = np.nan_to_num(matrix_results["durations"])
+    vehicle_max_seconds = []
+    for vehicle_id, driver_info in enumerate(drivers):
+        path = [vehicle_id]
+        for pair in sorted((p for p in pairs if p['id'] in pinned_entries and p['allowed_vehicles'] == [vehicle_id]),
+                           key=lambda p: p['pickup_window'][0]):
+            path += [pair['pickup'], pair['delivery']]
+        pinned_seconds = sum(durations[node_locations[a], node_locations[b]] for a, b in zip(path, path[1:]))
+        vehicle_max_seconds.append(max(driver_info['max_daily_hours'] * 3600, pinned_seconds))
+
+    solution = solve_pickup_delivery({
+        "num_vehicles": len(drivers),
+        "node_locations": node_locations,
+        "end_node": end_node,
+        "pairs": pairs,
+        "time_matrix_seconds": matrix_results["durations"],
+        "vehicle_max_seconds": vehicle_max_seconds,
+        "horizon_seconds": horizon,
+        "time_limit_seconds": solver_time_limit_seconds(len(node_locations), time_limit_override)
+    })
+    if solution is None:
+        raise OptimizationError("No feasible assignment found", 500, "OR-Tools could not find a feasible solution for the given constraints")
+
+    schedule_conflicts = []
+    for pair_id in solution["dropped_pair_ids"]:
+        if pair_id in pinned_entries:
+            driver_info, entry = pinned_entries[pair_id]
+            logger.warning(f"BULK_ASSIGN: Entry {entry.get('ride_id')} of driver {driver_info['id']} conflicts with the rest of the schedule.")
+            schedule_conflicts.append({"driver_id": driver_info['id'], "ride_id": entry.get('ride_id'),
+                                       "start_time_iso": entry.get('start_time_iso'), "end_time_iso": entry.get('end_time_iso')})
+
+    rides_by_id = {ride['id']: ride for ride in pending}
+    assigned = []
+    for driver_info, stops in zip(drivers, solution["routes"]):
+        for stop in stops:
+            ride = rides_by_id.get(stop['pair_id'])
+            if ride is None:
+                continue
+            # Like /api/assign_ride, the entry starts when the driver sets off towards the pickup
+            start_time = midnight + timedelta(seconds=stop['pickup_seconds'] - stop['deadhead_seconds'])
+            delivery_time = midnight + timedelta(seconds=stop['delivery_seconds'])
+            entry = {
+                "ride_id": ride['id'],
+                "origin_address": ride['origin_address'],
+                "destination_address": ride['destination_address'],
+                "origin_coords": ride['origin_coords'],
+                "destination_coords": ride['destination_coords'],
+                "start_time_iso": start_time.isoformat(),
+                "end_time_iso": delivery_time.isoformat(),
+                "duration_minutes": round((delivery_time - start_time).total_seconds() / 60, 2)
+            }
+            # A dropped conflicting entry frees its slot in the model but not in the schedule
+            if (schedule_index.overlaps(driver_info, day, start_time.timestamp(), delivery_time.timestamp())
+                    or not dry_run and not schedule_index.add(driver_info, day, entry)):
+                logger.warning(f"BULK_ASSIGN: Ride {ride['id']} now overlaps driver {driver_info['id']}'s schedule, leaving it pending.")
+                continue
+            if not dry_run:
+                ride['assigned_driver_id'] = driver_info['id']
+                ride['assigned_driver_name'] = driver_info['name']
+                ride['status'] = "assigned"
+                ride['estimated_start_time_iso'] = entry['start_time_iso']
+            assigned.append({"ride_id": ride['id'], "driver_id": driver_info['id'], "schedule_entry": entry})
+
+    assigned_ids = {a['ride_id'] for a in assigned}
+    unassigned_ride_ids += [ride['id'] for ride in pending if ride['id'] not in assigned_ids and ride['id'] not in unassigned_ride_ids]
+    logger.info(f"BULK_ASSIGN: {len(assigned)} rides assigned, {len(unassigned_ride_ids)} left pending.")
+    return {
+        "date": on_date.isoformat(),
+        "assigned": assigned,
+        "unassigned_ride_ids": unassigned_ride_ids,
+        "schedule_conflicts": schedule_conflicts,
+        "dry_run": dry_run,
+        "objective": solution["objective"],
+        "solve_time_seconds": solution["solve_time_seconds"]
+    }
+
+# --- Ride Records ---
 
-        data = response.json()
-        if data.get('routes') and len(data['routes']) > 0:
-            route_info = data['routes'][0]
-            
-            if 'geometry' in route_info:
-                if isinstance(route_info['geometry'], str):
-                    try:
-                        polyline_leaflet_coords = polyline.decode(route_info['geometry'])
-                        logger.info("Directions Polyline SUCCESS (decoded from string).")
-                    except Exception as e:
-                        logger.error(f"Failed to decode polyline string: {e}", exc_info=True)
-                        return None
-                elif isinstance(route_info['geometry'], dict) and 'coordinates' in route_info['geometry']:
-                    polyline_ors_coords = route_info['geometry']['coordinates']
-                    polyline_leaflet_coords = [[c[1], c[0]] for c in polyline_ors_coords]
-                    logger.info("Directions Polyline SUCCESS (from GeoJSON).")
-                else:
-                    logger.warning(f"Directions Polyline FAILED: Unexpected geometry type/structure. Body: {data}")
-                    return None
-            else:
-                logger.warning(f"Directions Polyline FAILED: 'geometry' field missing in route info. Body: {data}")
-                return None
-            
-            duration_seconds = route_info.get('summary', {}).get('duration', 0)
-            distance_meters = route_info.get('summary', {}).get('distance', 0)
+def ride_time_window(required_arrival_time: str, travel_seconds: float, on_date=None) -> Tuple[datetime, datetime]:
+    # (estimated start, required arrival) for an "HH:MM" arrival on on_date (default today); ValueError if malformed.
+    hour, minute = required_arrival_time.split(':')[:2]
+    arrival = datetime.combine(on_date or datetime.now().date(), datetime.min.time()).replace(hour=int(hour), minute=int(minute))
+    return arrival - timedelta(seconds=travel_seconds), arrival
 
-            return {
-                "polyline_coords": polyline_leaflet_coords,
-                "duration_seconds": duration_seconds,
-                "distance_meters": distance_meters
-            }
+def task_time_window(data: Dict) -> Optional[Tuple[float, float]]:
+    # (start, end) timestamps from 'task_start_time_iso'/'task_end_time_iso', None without both; ValueError if malformed.
+    if not data.get('task_start_time_iso') or not data.get('task_end_time_iso'):
+        return None
+    return datetime.fromisoformat(data['task_start_time_iso']).timestamp(), datetime.fromisoformat(data['task_end_time_iso']).timestamp()
+
+def new_ride_record(ride_id: str, ride_request: Dict, origin_coords: Tuple[float, float], destination_coords: Tuple[float, float],
+                    directions_info: Dict, estimated_start_time: datetime, arrival_time: datetime) -> Dict:
+    is_recurring = ride_request.get('is_recurring', False)
+    return {
+        "id": ride_id,
+        "origin_address": ride_request['origin_address'],
+        "destination_address": ride_request['destination_address'],
+        "origin_coords": origin_coords,
+        "destination_coords": destination_coords,
+        "required_arrival_time": ride_request['required_arrival_time'],
+        "num_passengers": ride_request['num_passengers'],
+        "client_name": ride_request['client_name'],
+        "is_recurring": is_recurring,
+        "recurring_days": ride_request.get('recurring_days', []) if is_recurring else [],
+        "estimated_travel_time_seconds": directions_info['duration_seconds'],
+        "estimated_distance_meters": directions_info['distance_meters'],
+        "ride_polyline_coords": directions_info['polyline_coords'],
+        "estimated_start_time_iso": estimated_start_time.isoformat(),
+        "estimated_end_time_iso": arrival_time.isoformat(),
+        "assigned_driver_id": None,
+        "assigned_driver_name": None,
+        "status": "pending"
+    }
+
+ride_store_lock = threading.Lock()
+
+def store_new_ride(make_record) -> Dict:
+    # make_record(ride_id) -> ride; ids stay unique when imports and single requests run concurrently.
+    with ride_store_lock:
+        ride_id = f"ride_{len(mock_rides_data) + 1}"
+        ride = make_record(ride_id)
+        mock_rides_data[ride_id] = ride
+        return ride
+
+RIDE_IMPORT_REQUIRED_FIELDS = ['origin_address', 'destination_address', 'required_arrival_time', 'num_passengers', 'client_name']
+
+def _read_import_rows(stream, import_format: str):
+    # Yields (row_number, row or None, error) one line at a time; nothing is buffered beyond the current line.
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if import_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, row, None
+        return
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        yield row_number, row, None if isinstance(row, dict) else "Row must be a JSON object"
+
+def import_ride_batch(batch: List[Tuple[int, Optional[Dict], Optional[str]]], coords_by_address: Dict, directions_by_pair: Dict) -> List[Dict]:
+    # Geocodes the batch's new addresses and routes its new origin/destination pairs concurrently; both
+    # lookups are shared across the whole import, so repeated addresses and routes cost nothing.
+    valid = []
+    results = {}
+    for row_number, row, error in batch:
+        if error is None:
+            missing = [field for field in RIDE_IMPORT_REQUIRED_FIELDS if not str(row.get(field) or '').strip()]
+            if missing:
+                error = f"Missing fields: {', '.join(missing)}"
+        if error is None:
+            try:
+                row = {**row, "num_passengers": int(row['num_passengers'])}
+                on_date = datetime.fromisoformat(row['date']).date() if row.get('date') else None
+                ride_time_window(row['required_arrival_time'], 0, on_date)
+            except (TypeError, ValueError) as e:
+                error = f"Invalid value: {e}"
+        if error is not None:
+            results[row_number] = {"row": row_number, "status": "error", "error": error}
         else:
-            logger.warning(f"Directions Polyline FAILED: No routes found in response. Body: {data}")
-            return None
+            valid.append((row_number, row, on_date))
 
-    except requests.exceptions.Timeout:
-        logger.error("Directions Polyline FAILED: Request timed out.")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        logger.error(f"Directions Polyline FAILED: Connection error - {e}")
-        return None
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"Directions Polyline FAILED: HTTP Error {e.response.status_code}. Response Body: {e.response.text}")
-        if e.response.status_code == 401:
-            logger.error("Directions Polyline FAILED: Unauthorized (401). Check your Openrouteservice API key.")
-        elif e.response.status_code == 404:
-            logger.error("Directions Polyline FAILED: Route not found (404). Check if addresses are routable.")
-        return None
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during Directions Polyline call: {e}", exc_info=True)
-        return None
+    new_addresses = list(dict.fromkeys(
+        address for _, row, _ in valid for address in (row['origin_address'], row['destination_address'])
+        if address not in coords_by_address))
+    coords_by_address.update(zip(new_addresses, ors_map(get_coordinates, new_addresses)))
 
-# --- VRP Optimization Logic (Google OR-Tools) ---
+    pairs = []
+    for _, row, _ in valid:
+        origin_coords, destination_coords = coords_by_address[row['origin_address']], coords_by_address[row['destination_address']]
+        if origin_coords and destination_coords:
+            pair = (coord_key(origin_coords), coord_key(destination_coords))
+            if pair not in directions_by_pair:
+                directions_by_pair[pair] = None
+                pairs.append((pair, origin_coords, destination_coords))
+    for (pair, _, _), directions_info in zip(pairs, ors_map(lambda p: get_directions_polyline(p[1], p[2]), pairs)):
+        directions_by_pair[pair] = directions_info
 
-def solve_vrp(data: Dict) -> Optional[Dict]:
-    logger.info("--- Starting VRP Optimization ---")
-    
-    num_locations = len(data['locations_coords'])
-    num_vehicles = data['num_vehicles']
-    depot_index = data['depot_index']
+    for row_number, row, on_date in valid:
+        origin_coords, destination_coords = coords_by_address[row['origin_address']], coords_by_address[row['destination_address']]
+        if not origin_coords or not destination_coords:
+            results[row_number] = {"row": row_number, "status": "error", "error": "Origin or destination address not found"}
+            continue
+        directions_info = directions_by_pair.get((coord_key(origin_coords), coord_key(destination_coords)))
+        if not directions_info:
+            results[row_number] = {"row": row_number, "status": "error", "error": "Failed to calculate ride route"}
+            continue
+        start, arrival = ride_time_window(row['required_arrival_time'], directions_info['duration_seconds'], on_date)
+        ride = store_new_ride(lambda ride_id: new_ride_record(ride_id, row, origin_coords, destination_coords, directions_info, start, arrival))
+        results[row_number] = {"row": row_number, "status": "created", "ride_id": ride['id']}
+    return [results[row_number] for row_number, _, _ in batch]
 
-    if num_locations == 0:
-        logger.error("VRP Error: No locations provided.")
-        return None
-    if num_vehicles == 0:
-        logger.error("VRP Error: No vehicles provided.")
-        return None
-    if depot_index >= num_locations:
-        logger.error(f"VRP Error: Depot index {depot_index} out of bounds for {num_locations} locations.")
-        return None
-    
-    manager = pywrapcp.RoutingIndexManager(num_locations, num_vehicles, depot_index)
-    routing = pywrapcp.RoutingModel(manager)
+# --- Asyncio ORS Client ---
 
-    if not data['time_matrix_seconds'] or len(data['time_matrix_seconds']) != num_locations or \
-       any(len(row) != num_locations for row in data['time_matrix_seconds']):
-        logger.error("VRP Error: time_matrix_seconds is missing or malformed.")
-        return None
-    
-    def time_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        
-        if from_node < 0 or from_node >= num_locations or \
-           to_node < 0 or to_node >= num_locations:
-            logger.error(f"Time callback received out of bounds node indices: from {from_node}, to {to_node}. Matrix size: {num_locations}")
-            return 1_000_000_000
+try:
+    import httpx
+except ImportError:  # only the ASGI entry point (asgi.py) needs it
+    httpx = None
 
-        return data['time_matrix_seconds'][from_node][to_node]
+class AsyncOrsClient:
+    # Non-blocking geocode, autocomplete, matrix and directions calls for the ASGI entry point. They share
+    # the sync client's caches, token buckets, circuit breaker and request deadline, and store into the
+    # same caches, so a Flask view run afterwards finds its ORS answers cached.
+    def __init__(self):
+        self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=ORS_ASYNC_MAX_CONNECTIONS))
 
-    transit_callback_index = routing.RegisterTransitCallback(time_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    async def aclose(self):
+        await self._client.aclose()
 
-    time_dimension_name = 'Time'
-    routing.AddDimension(
-        transit_callback_index,
-        0,
-        data['max_daily_seconds'],
-        True,
-        time_dimension_name)
-    time_dimension = routing.GetDimensionOrDie(time_dimension_name)
+    async def request(self, kind: str, method: str, url: str, timeout: float, **kwargs):
+        # ors_request on the event loop.
+        call = OrsCall(kind)
+        while True:
+            while True:
+                remaining = call.quota_timeout()
+                wait_seconds = ors_rate_limiters[kind].try_acquire()
+                if not wait_seconds:
+                    break
+                if remaining is not None and wait_seconds > remaining:
+                    raise call.quota_exceeded()
+                await asyncio.sleep(wait_seconds)
+            socket_timeout = call.start(timeout)
+            error, response = None, None
+            try:
+                response = await self._client.request(method, url, timeout=socket_timeout, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                call.abandon()
+                raise
+            delay = call.retry_delay(response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(delay)
 
-    for node_index in range(num_locations):
-        if node_index != depot_index:
-            routing.AddDisjunction([manager.NodeToIndex(node_index)], 10_000_000_000)
+    async def geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        found, coords = await asyncio.to_thread(local_coordinates, address)
+        if found:
+            return coords
+        cache_key = normalize_address(address)
+        return await geocode_flight.do_async(cache_key, lambda: self._geocode(address, cache_key))
 
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
-    search_parameters.local_search_metaheuristic = (
-        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
-    search_parameters.time_limit.seconds = 5
+    async def _geocode(self, address: str, cache_key: str) -> Optional[Tuple[float, float]]:
+        try:
+            response = await self.request("geocode", "GET", ORS_GEOCODE_URL, timeout=15, params=geocode_params(address))
+            response.raise_for_status()
+            return await asyncio.to_thread(geocode_result, address, cache_key, response.json())
+        except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+            logger.error(f"ASYNC_ORS: Geocoding FAILED for '{address}': {e!r}")
+            return None
 
-    solution = routing.SolveWithParameters(search_parameters)
-    logger.info("VRP Solver completed.")
+    async def autocomplete(self, query: str) -> Dict:
+        # Raises on failure, like _ors_autocomplete_request.
+        async def fetch():
+            response = await self.request("geocode", "GET", ORS_AUTOCOMPLETE_URL, timeout=10, params=autocomplete_params(query))
+            response.raise_for_status()
+            return response.json()
+        return await autocomplete_flight.do_async(query, fetch)
 
-    output_routes = {
-        "drivers_assigned_routes": [],
-        "unassigned_task_ids": []
-    }
+    async def directions(self, coordinates: List[Tuple[float, float]]) -> Optional[Dict]:
+        key = tuple(coord_key(c) for c in coordinates)
+        cached = directions_cache.get(key)
+        if cached is not None:
+            return cached
+        return await directions_flight.do_async(key, lambda: self._directions(coordinates))
 
-    if solution:
-        logger.info("VRP Solution found. Processing routes...")
-        for vehicle_id in range(num_vehicles):
-            index = routing.Start(vehicle_id)
-            route_nodes_internal_indices = []
-            route_original_task_ids_sequence = []
-            total_travel_distance = 0
-            total_travel_duration = 0
-            total_service_duration = 0
-            
-            route_nodes_internal_indices.append(index)
+    async def _directions(self, coordinates: List[Tuple[float, float]]) -> Optional[Dict]:
+        try:
+            response = await self.request("directions", "POST", ORS_DIRECTIONS_URL, timeout=15, headers=ors_headers(),
+                                          json=directions_payload(coordinates))
+            response.raise_for_status()
+            return directions_result(coordinates, response.json())
+        except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+            logger.error(f"ASYNC_ORS: Directions FAILED: {e!r}")
+            return None
 
-            while not routing.IsEnd(index):
-                previous_index = index
-                index = solution.Value(routing.NextVar(index))
-                
-                from_node = manager.IndexToNode(previous_index)
-                to_node = manager.IndexToNode(index)
+    async def matrix(self, source_coords: List[Tuple[float, float]], destination_coords: List[Tuple[float, float]]) -> Optional[Dict]:
+        # build_matrix without its fallbacks: precomputed and cached pairs first, then every missing tile
+        # concurrently, stored in the pair cache. None if any tile failed. Cache access runs off the loop.
+        source_keys = [coord_key(c) for c in source_coords]
+        destination_keys = [coord_key(c) for c in destination_coords]
+        durations, distances = await asyncio.to_thread(cached_matrix_pairs, source_keys, destination_keys)
+        missing = np.isnan(durations)
+        if not missing.any():
+            return {"durations": durations, "distances": distances}
 
-                total_travel_distance += data['distance_matrix_meters'][from_node][to_node]
-                total_travel_duration += data['time_matrix_seconds'][from_node][to_node]
-                
-                if not routing.IsEnd(index):
-                    route_nodes_internal_indices.append(index)
-                    current_node_data_index = manager.IndexToNode(index)
+        jobs = []
+        for source_idx, destination_idx in _cover_missing_pairs(missing):
+            block_sources = [source_coords[i] for i in source_idx]
+            block_destinations = [destination_coords[j] for j in destination_idx]
+            for row, col, tile_sources, tile_destinations in matrix_tiles(block_sources, block_destinations):
+                jobs.append((source_idx[row:row + len(tile_sources)], destination_idx[col:col + len(tile_destinations)],
+                             tile_sources, tile_destinations))
+        results = await asyncio.gather(*(self._matrix_tile(job[2], job[3]) for job in jobs))
+        fetched = [(rows, cols, result) for (rows, cols, _, _), result in zip(jobs, results) if result is not None]
+        for rows, cols, result in fetched:
+            durations[np.ix_(rows, cols)] = result["durations"]
+            distances[np.ix_(rows, cols)] = result["distances"]
 
-                    if current_node_data_index != depot_index and current_node_data_index < len(data['service_durations_seconds']):
-                        total_service_duration += data['service_durations_seconds'][current_node_data_index]
-                    
-                    original_task_list_index = current_node_data_index - 1
-                    if 0 <= original_task_list_index < len(data['task_original_ids']):
-                        route_original_task_ids_sequence.append(data['task_original_ids'][original_task_list_index]) 
+        def store():
+            for rows, cols, result in fetched:
+                matrix_pair_cache.store([source_keys[i] for i in rows], [destination_keys[j] for j in cols],
+                                        result["durations"], result["distances"])
+        await asyncio.to_thread(store)
+        return {"durations": durations, "distances": distances} if len(fetched) == len(jobs) else None
 
-            route_nodes_internal_indices.append(index)
+    async def _matrix_tile(self, tile_sources: List[Tuple[float, float]], tile_destinations: List[Tuple[float, float]]) -> Optional[Dict]:
+        key = (tuple(coord_key(c) for c in tile_sources), tuple(coord_key(c) for c in tile_destinations))
 
-            total_route_duration_minutes = round((total_travel_duration + total_service_duration) / 60, 2)
-            total_route_distance_km = round(total_travel_distance / 1000, 2)
+        async def fetch():
+            try:
+                response = await self.request("matrix", "POST", ORS_MATRIX_URL, timeout=20, headers=ors_headers(),
+                                              json=matrix_payload(*matrix_tile_locations(tile_sources, tile_destinations)))
+                response.raise_for_status()
+                return matrix_result(response.json())
+            except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+                logger.error(f"ASYNC_ORS: Distance Matrix tile FAILED: {e!r}")
+                return None
+        return await matrix_flight.do_async(key, fetch)
 
-            coords_for_directions_api = [data['locations_coords'][manager.IndexToNode(node_idx)] for node_idx in route_nodes_internal_indices]
-            
-            full_route_polyline_coords = []
-            if len(coords_for_directions_api) > 1:
-                for i in range(len(coords_for_directions_api) - 1):
-                    start_segment_coords = coords_for_directions_api[i]
-                    end_segment_coords = coords_for_directions_api[i+1]
-                    segment_directions_info = get_directions_polyline(start_segment_coords, end_segment_coords)
-                    if segment_directions_info and segment_directions_info.get('polyline_coords'):
-                        full_route_polyline_coords.extend(segment_directions_info['polyline_coords'][:-1]) 
-                if full_route_polyline_coords and segment_directions_info and segment_directions_info.get('polyline_coords'):
-                    full_route_polyline_coords.append(segment_directions_info['polyline_coords'][-1]) 
-                elif not full_route_polyline_coords and len(coords_for_directions_api) > 0:
-                    full_route_polyline_coords = coords_for_directions_api
-            elif len(coords_for_directions_api) == 1:
-                full_route_polyline_coords = [coords_for_directions_api[0]]
-            
-            if not full_route_polyline_coords:
-                 full_route_polyline_coords = []
+_async_ors_client = None
 
-            output_routes["drivers_assigned_routes"].append({
-                "driver_id": data['driver_original_ids'][vehicle_id],
-                "driver_name": f"נהג {data['driver_original_ids'][vehicle_id]}",
-                "route_polyline_coords": full_route_polyline_coords,
-                "assigned_task_ids_sequence": route_original_task_ids_sequence,
-                "total_distance_km": total_route_distance_km,
-                "total_duration_minutes": total_route_duration_minutes
-            })
-        
-        all_original_task_ids = set(data['task_original_ids'])
-        assigned_task_ids_flat = set()
-        for route in output_routes["drivers_assigned_routes"]:
-            assigned_task_ids_flat.update(route["assigned_task_ids_sequence"])
-        
-        output_routes["unassigned_task_ids"] = list(all_original_task_ids - assigned_task_ids_flat)
+def get_async_ors_client() -> AsyncOrsClient:
+    global _async_ors_client
+    if _async_ors_client is None:
+        if httpx is None:
+            raise RuntimeError("The async ORS client needs httpx (pip install httpx).")
+        _async_ors_client = AsyncOrsClient()
+    return _async_ors_client
 
-    else:
-        logger.warning("No VRP solution found by OR-Tools.")
+async def close_async_ors_client():
+    global _async_ors_client
+    if _async_ors_client is not None:
+        await _async_ors_client.aclose()
+        _async_ors_client = None
 
-    logger.info("--- VRP Optimization Complete ---")
-    return output_routes
+# Prefetchers: the ORS work of an endpoint, done concurrently on the event loop before the Flask view
+# runs, so the view only computes. They plan their requests with the same functions the views use
+# (nearest_driver_batches, insertion_plan, vrp_locations, cluster_plan), so both ask ORS the same
+# questions. Best effort: whatever they miss, the view fetches itself.
+
+async def prefetch_driver_bases(data: Optional[Dict] = None):
+    client = get_async_ors_client()
+    await asyncio.gather(*(client.geocode(d['base_address']) for d in list(mock_drivers_data.values())))
+
+async def _prefetch_insertions(pickup_coords: Tuple[float, float], dropoff_coords: Tuple[float, float],
+                               window: Optional[Tuple[float, float]], candidate_drivers: List[Dict]):
+    # The first batch's insertion matrices; later batches are only priced when too few drivers pass.
+    await prefetch_driver_bases()
+    batches = await asyncio.to_thread(nearest_driver_batches, pickup_coords, candidate_drivers)
+    if not batches:
+        return
+    plan = await asyncio.to_thread(insertion_plan, batches[0], pickup_coords, dropoff_coords, window)
+    client = get_async_ors_client()
+    await asyncio.gather(*(client.matrix(*request) for request in (plan["to_pickup"], plan["from_dropoff"]) if request))
 
+async def prefetch_request_ride(data: Dict):
+    client = get_async_ors_client()
+    if not data.get('origin_address') or not data.get('destination_address'):
+        return
+    origin_coords, destination_coords = await asyncio.gather(client.geocode(data['origin_address']),
+                                                             client.geocode(data['destination_address']))
+    if not origin_coords or not destination_coords:
+        return
+    directions_info = await client.directions([origin_coords, destination_coords])
+    if not directions_info or not data.get('required_arrival_time'):
+        return
+    estimated_start_time, arrival_time = ride_time_window(data['required_arrival_time'], directions_info['duration_seconds'])
+    await _prefetch_insertions(origin_coords, destination_coords,
+                               (estimated_start_time.timestamp(), arrival_time.timestamp()), ride_candidate_drivers())
+
+async def prefetch_alternative_drivers(data: Dict):
+    task_coords = await get_async_ors_client().geocode(data['task_address']) if data.get('task_address') else None
+    if not task_coords:
+        return
+    await _prefetch_insertions(task_coords, task_coords, task_time_window(data),
+                               ride_candidate_drivers(data.get('exclude_driver_ids', [])))
+
+async def prefetch_optimization(data: Dict):
+    # Geocoding plus the matrices: the full one for a single instance, or one per cluster when decomposing.
+    client = get_async_ors_client()
+    if use_decomposition(data):
+        tasks, available_drivers, num_clusters = decomposition_inputs(data)
+        if num_clusters >= 2:
+            task_coords, driver_coords = await asyncio.gather(
+                asyncio.gather(*(client.geocode(t['address']) for t in tasks)),
+                asyncio.gather(*(client.geocode(d['start_address']) for d in available_drivers)))
+            if not all(task_coords) or not all(driver_coords):
+                return
+            plan = await asyncio.to_thread(cluster_plan, list(task_coords), list(driver_coords), num_clusters)
+            await asyncio.gather(*(client.matrix(locations, locations) for locations in plan["cluster_locations"]))
+            return
+    tasks, drivers = optimization_tasks_and_drivers(data)
+    addresses = vrp_addresses(tasks, drivers)
+    address_by_key = addresses_by_key(addresses)
+    coords = await asyncio.gather(*(client.geocode(addr) for addr in address_by_key.values()))
+    if not all(coords):
+        return
+    locations, _ = vrp_locations(addresses, dict(zip(address_by_key, coords)))
+    await client.matrix(locations, locations)
 
 # --- API Endpoints ---
 
+# Endpoints that legitimately make many ORS calls get the longer batch deadline.
+BATCH_ENDPOINTS = {'test_matrix', 'optimize_schedule', 'import_rides', 'assign_pending_rides_endpoint'}
+
+@app.before_request
+def set_ors_deadline():
+    budget = ORS_BATCH_DEADLINE_SECONDS if request.endpoint in BATCH_ENDPOINTS else ORS_REQUEST_DEADLINE_SECONDS
+    ors_deadline.set(ors_deadline_after(budget))
+
 @app.route('/api/test_matrix', methods=['POST'])
 def test_matrix():
     logger.info("Received request to /api/test_matrix")
@@ -532,8 +3540,7 @@ def test_matrix():
         all_coords = []
         failed_addresses_details = []
         
-        for i, address in enumerate(addresses):
-            coords = get_coordinates(address)
+        for i, (address, coords) in enumerate(zip(addresses, ors_map(get_coordinates, addresses))):
             if coords:
                 all_coords.append(coords)
             else:
@@ -556,8 +3563,8 @@ def test_matrix():
             
         response_data = {
             "status": "success",
-            "durations": matrix_results.get("durations"),
-            "distances": matrix_results.get("distances"),
+            "durations": matrix_to_json(matrix_results["durations"]),
+            "distances": matrix_to_json(matrix_results["distances"]),
             "coordinates": all_coords
         }
         
@@ -580,94 +3587,129 @@ def test_matrix():
 def optimize_schedule():
     logger.info("Received request to /api/optimize_schedule (General VRP)")
     try:
-        data = request.get_json()
-        tasks = data.get('tasks', [])
-        drivers = data.get('drivers', [])
-
-        if not tasks or not drivers:
-            logger.warning("OPTIMIZE: Missing tasks or drivers in request. Using mock data.")
-            tasks = [
-                {"id": "task1", "address": "רחוב דיזנגוף 100, תל אביב", "service_duration_minutes": 15},
-                {"id": "task2", "address": "רחוב אלנבי 50, תל אביב", "service_duration_minutes": 20},
-                {"id": "task3", "address": "רחוב יפו 200, ירושלים", "service_duration_minutes": 10},
-                {"id": "task4", "address": "רחוב הרצל 1, חיפה", "service_duration_minutes": 25},
-            ]
-            drivers = [
-                {"id": "driverA", "name": "נהג א'", "start_address": "רחוב דיזנגוף 100, תל אביב", "end_address": "רחוב דיזנגוף 100, תל אביב", "max_daily_hours": 8, "is_available": True, "current_work_hours_today": 0},
-                {"id": "driverB", "name": "נהג ב'", "start_address": "רחוב יפו 200, ירושלים", "end_address": "רחוב יפו 200, ירושלים", "max_daily_hours": 8, "is_available": True, "current_work_hours_today": 0},
-            ]
-            logger.info("OPTIMIZE: Using hardcoded mock data for general optimization demo.")
-
-        # 1. Geocode all addresses (tasks + driver start/end points)
-        all_unique_addresses = []
-        task_original_ids_list = []
-        service_durations_seconds_list = [0]
-        
-        depot_address = drivers[0]['start_address'] if drivers else "רחוב ראשי 1, תל אביב"
-        all_unique_addresses.append(depot_address)
-
-        for task in tasks:
-            all_unique_addresses.append(task['address'])
-            task_original_ids_list.append(task['id'])
-            service_durations_seconds_list.append(task['service_duration_minutes'] * 60)
-
-        all_unique_coords = []
-        for addr in all_unique_addresses:
-            coords = get_coordinates(addr)
-            if coords:
-                all_unique_coords.append(coords)
-            else:
-                logger.error(f"OPTIMIZE: Failed to geocode critical address for VRP: {addr}")
-                return jsonify({"error": "Failed to geocode one or more critical addresses for VRP optimization"}), 400
-
-        if len(all_unique_coords) != len(all_unique_addresses):
-            logger.error("OPTIMIZE: Mismatch in geocoded coordinates count vs. addresses. Aborting VRP.")
-            return jsonify({"error": "Failed to geocode all necessary addresses for VRP"}), 500
-
-        available_drivers_for_vrp = [d for d in drivers if d.get('is_available', True)]
-        driver_id_to_vrp_index = {d['id']: i for i, d in enumerate(available_drivers_for_vrp)}
-        vrp_index_to_driver_id = [d['id'] for d in available_drivers_for_vrp]
-
-        # 2. Get Distance Matrix
-        matrix_results = get_distance_matrix(all_unique_coords)
-        if not matrix_results:
-            logger.error("OPTIMIZE: Failed to get distance/duration matrix for VRP.")
-            return jsonify({"error": "Failed to calculate matrix for VRP optimization"}), 500
-        
-        time_matrix = matrix_results.get("durations")
-        distance_matrix = matrix_results.get("distances")
-
-        if not time_matrix or not distance_matrix:
-            logger.error("OPTIMIZE: Matrix results are incomplete for VRP.")
-            return jsonify({"error": "Incomplete matrix data for VRP optimization"}), 500
-
-        # 3. Prepare data for OR-Tools solve_vrp
-        vrp_data = {
-            "locations_coords": all_unique_coords,
-            "num_vehicles": len(available_drivers_for_vrp),
-            "depot_index": 0,
-            "service_durations_seconds": service_durations_seconds_list,
-            "time_matrix_seconds": time_matrix,
-            "distance_matrix_meters": distance_matrix,
-            "max_daily_seconds": max(d['max_daily_hours'] * 3600 for d in available_drivers_for_vrp) if available_drivers_for_vrp else 8 * 3600,
-            "task_original_ids": task_original_ids_list,
-            "driver_original_ids": vrp_index_to_driver_id
-        }
+        data = request.get_json() or {}
+        solver_configs = portfolio_solver_configs(data)
 
-        # 4. Solve VRP
-        optimization_solution = solve_vrp(vrp_data)
+        # 4. Solve VRP (in-process, raced across the solver process pool in portfolio mode, or split
+        # into geographic clusters solved in parallel)
+        if use_decomposition(data):
+            optimization_solution = optimize_decomposed(data, solver_configs=solver_configs)
+        elif solver_configs:
+            vrp_data = build_vrp_instance(data)
+            optimization_solution = solve_vrp_in_process_pool(vrp_data, solver_configs=solver_configs)
+        else:
+            optimization_solution = solve_vrp(build_vrp_instance(data))
 
         if optimization_solution:
             logger.info("OPTIMIZE: VRP solution obtained successfully.")
+            # 5. Route geometry, either now or deferred to /api/route_geometry
+            attach_route_geometry(optimization_solution, defer_geometry=bool(data.get('defer_geometry', False)))
             return jsonify(optimization_solution)
         else:
             logger.warning("OPTIMIZE: No VRP solution could be found by OR-Tools.")
             return jsonify({"error": "No optimal solution found", "details": "OR-Tools could not find a feasible solution for the given constraints"}), 500
 
+    except OptimizationError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         logger.error(f"OPTIMIZE: Unexpected error during optimization process: {e}", exc_info=True)
         return jsonify({"error": "Optimization process failed due to an unexpected error", "details": str(e)}), 500
 
+@app.route('/api/optimize_jobs', methods=['POST'])
+def create_optimization_job():
+    logger.info("Received request to /api/optimize_jobs")
+    try:
+        payload = request.get_json() or {}
+        job_id = submit_optimization_job(payload)
+        logger.info(f"OPTIMIZE_JOB: Job {job_id} submitted.")
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/optimize_jobs/{job_id}",
+            "events_url": f"/api/optimize_jobs/{job_id}/events"
+        }), 202
+    except Exception as e:
+        logger.error(f"OPTIMIZE_JOB: Failed to submit job: {e}", exc_info=True)
+        return jsonify({"error": "Failed to submit optimization job", "details": str(e)}), 500
+
+@app.route('/api/optimize_jobs/<job_id>', methods=['GET'])
+def get_optimization_job(job_id):
+    snapshot = get_optimization_job_snapshot(job_id)
+    if snapshot is None:
+        return jsonify({"error": "Optimization job not found"}), 404
+    return jsonify(snapshot)
+
+@app.route('/api/optimize_jobs/<job_id>/events', methods=['GET'])
+def stream_optimization_job_events(job_id):
+    # Server-Sent Events: replays the job's events from Last-Event-ID and then follows it until it finishes.
+    if get_optimization_job_snapshot(job_id) is None:
+        return jsonify({"error": "Optimization job not found"}), 404
+    try:
+        next_event_id = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        next_event_id = 0
+
+    def generate(next_event_id):
+        while True:
+            with optimization_jobs_condition:
+                job = optimization_jobs.get(job_id)
+                if job is None:
+                    return
+                if next_event_id >= len(job["events"]) and job["status"] not in ("completed", "failed"):
+                    optimization_jobs_condition.wait(timeout=15)
+                pending_events = job["events"][next_event_id:]
+                finished = job["status"] in ("completed", "failed")
+            if not pending_events and not finished:
+                yield ": keep-alive\n\n"
+            for event in pending_events:
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+            next_event_id += len(pending_events)
+            if finished:
+                return
+
+    return Response(stream_with_context(generate(next_event_id)), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/route_geometry', methods=['GET', 'POST'])
+def route_geometry():
+    logger.info("Received request to /api/route_geometry")
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            handles = data.get('handles', [])
+            simplify_level = data.get('simplify', 0)
+        else:
+            handles = [request.args.get('handle', '')]
+            simplify_level = request.args.get('simplify', 0)
+
+        try:
+            simplify_level = int(simplify_level)
+        except (TypeError, ValueError):
+            simplify_level = -1
+        if not 0 <= simplify_level < len(ROUTE_SIMPLIFY_TOLERANCES):
+            return jsonify({"error": f"'simplify' must be an integer between 0 and {len(ROUTE_SIMPLIFY_TOLERANCES) - 1}"}), 400
+        if not isinstance(handles, list) or not handles or not all(isinstance(h, str) and h for h in handles):
+            return jsonify({"error": "Missing geometry handle(s)"}), 400
+        if len(handles) > ROUTE_GEOMETRY_MAX_HANDLES:
+            return jsonify({"error": f"At most {ROUTE_GEOMETRY_MAX_HANDLES} geometry handles per request"}), 400
+        try:
+            waypoint_counts = [len(polyline.decode(handle)) for handle in handles]
+        except Exception:
+            return jsonify({"error": "Invalid geometry handle"}), 400
+        if max(waypoint_counts) > ROUTE_GEOMETRY_MAX_WAYPOINTS:
+            return jsonify({"error": f"At most {ROUTE_GEOMETRY_MAX_WAYPOINTS} waypoints per geometry handle"}), 400
+
+        geometries = ors_map(lambda handle: resolve_route_geometry(handle, simplify_level), handles)
+        if request.method == 'GET':
+            return jsonify({"geometry_handle": handles[0], "simplify": simplify_level, "route_polyline_coords": geometries[0]})
+        return jsonify({
+            "simplify": simplify_level,
+            "geometries": [{"geometry_handle": h, "route_polyline_coords": g} for h, g in zip(handles, geometries)]
+        })
+    except Exception as e:
+        logger.error(f"ROUTE_GEOMETRY: Unexpected error: {e}", exc_info=True)
+        return jsonify({"error": "Failed to build route geometry", "details": str(e)}), 500
+
 @app.route('/api/validate_task_reassignment', methods=['POST'])
 def validate_task_reassignment():
     logger.info("Received request to /api/validate_task_reassignment")
@@ -684,30 +3726,30 @@ def validate_task_reassignment():
             return jsonify({"is_available": False, "message": "נהג לא נמצא במערכת"}), 404
 
         is_available_mock = driver_info.get('is_available', False)
+        has_conflict = False
+        if task_start_time_iso and task_end_time_iso:
+            try:
+                task_start = datetime.fromisoformat(task_start_time_iso)
+                has_conflict = schedule_index.overlaps(driver_info, task_start.strftime('%A'), task_start.timestamp(),
+                                                       datetime.fromisoformat(task_end_time_iso).timestamp())
+            except ValueError:
+                return jsonify({"error": "Invalid task time format"}), 400
 
-        driver_start_coords = get_coordinates(driver_info['base_address'])
-        task_coords = get_coordinates(task_address)
+        driver_start_coords, task_coords = ors_map(get_coordinates, [driver_info['base_address'], task_address])
 
         distance_to_start_km = 0
         time_to_start_minutes = 0
         
         if driver_start_coords and task_coords:
-            directions_info = get_directions_polyline(driver_start_coords, task_coords)
-            if directions_info:
-                distance_to_start_km = round(directions_info['distance_meters'] / 1000, 2)
-                time_to_start_minutes = round(directions_info['duration_seconds'] / 60, 2)
-            else:
-                dist_approx = math.sqrt(
-                    ((driver_start_coords[0] - task_coords[0]) * 111.32)**2 + 
-                    ((driver_start_coords[1] - task_coords[1]) * 111.32 * math.cos(math.radians(driver_start_coords[0])))**2
-                )
-                distance_to_start_km = round(dist_approx, 2)
-                time_to_start_minutes = round(dist_approx / 0.8, 2)
+            (distance_to_start_km, time_to_start_minutes), = road_travel_to(task_coords, [driver_start_coords])
 
-        message = "נהג זמין והמסלול קצר." if is_available_mock else "נהג אינו זמין או לא עומד באילוצים (לדמו)."
+        if has_conflict:
+            message = "לנהג יש נסיעה חופפת בזמן המשימה."
+        else:
+            message = "נהג זמין והמסלול קצר." if is_available_mock else "נהג אינו זמין או לא עומד באילוצים (לדמו)."
 
         return jsonify({
-            "is_available": is_available_mock,
+            "is_available": is_available_mock and not has_conflict,
             "distance_to_start_km": distance_to_start_km,
             "time_to_start_minutes": time_to_start_minutes,
             "message": message,
@@ -724,62 +3766,42 @@ def suggest_alternative_drivers():
     try:
         data = request.get_json()
         task_id = data.get('task_id')
-        task_start_time_iso = data.get('task_start_time_iso')
-        task_end_time_iso = data.get('task_end_time_iso')
         task_address = data.get('task_address')
         exclude_driver_ids = data.get('exclude_driver_ids', [])
 
-        alternative_drivers = []
         task_coords = get_coordinates(task_address)
         if not task_coords:
             logger.warning(f"SUGGEST: Cannot geocode task address {task_address} for suggestions.")
             return jsonify({"error": "Could not geocode task address for suggestions"}), 400
 
-        current_day_of_week = datetime.now().strftime('%A') 
+        candidate_drivers = ride_candidate_drivers(exclude_driver_ids)
 
-        for driver_id, driver_info in mock_drivers_data.items():
-            if driver_id in exclude_driver_ids or not driver_info.get('is_available', False):
-                continue
-            
-            driver_start_coords = get_coordinates(driver_info['base_address'])
-            if not driver_start_coords:
-                logger.warning(f"SUGGEST: Cannot geocode driver {driver_id} base address {driver_info['base_address']}.")
-                continue
+        try:
+            task_window = task_time_window(data)
+        except ValueError:
+            return jsonify({"error": "Invalid task time format"}), 400
+        task_seconds = task_window[1] - task_window[0] if task_window else 30 * 60
 
-            directions_info = get_directions_polyline(driver_start_coords, task_coords)
-            distance_to_start_km = 0
-            time_to_start_minutes = 0
-            if directions_info:
-                distance_to_start_km = round(directions_info['distance_meters'] / 1000, 2)
-                time_to_start_minutes = round(directions_info['duration_seconds'] / 60, 2)
-            else:
-                dist_approx = math.sqrt(
-                    ((driver_start_coords[0] - task_coords[0]) * 111.32)**2 + 
-                    ((driver_start_coords[1] - task_coords[1]) * 111.32 * math.cos(math.radians(driver_start_coords[0])))**2
-                )
-                distance_to_start_km = round(dist_approx, 2)
-                time_to_start_minutes = round(dist_approx / 0.8, 2)
-            
-            task_duration_minutes_mock = 30
-            total_ride_time_for_driver = time_to_start_minutes + task_duration_minutes_mock
-            
-            current_daily_work_minutes = sum([entry.get('duration_minutes', 0) for entry in driver_info['schedule'].get(current_day_of_week, [])])
-            
-            can_fit_in_schedule = (current_daily_work_minutes + total_ride_time_for_driver) <= (driver_info['max_daily_hours'] * 60)
+        def evaluate_batch(batch):
+            # The task is a stop: pickup and drop-off at the same address
+            return [
+                {
+                    "driver_id": insertion['driver_info']['id'],
+                    "driver_name": insertion['driver_info']['name'],
+                    "is_available_for_slot": True,
+                    "distance_to_start_km": insertion['distance_to_start_km'],
+                    "time_to_start_minutes": insertion['time_to_start_minutes'],
+                    "base_address_coords": insertion['base_coords'], # ADDED: driver's base address coordinates
+                    "insertion": insertion['insertion']
+                }
+                for insertion in rank_ride_insertions(batch, task_coords, task_coords, task_seconds, 0, window=task_window)
+                if insertion
+            ]
 
-            is_available_for_slot = driver_info.get('is_available', False) and can_fit_in_schedule
-            
-            if is_available_for_slot:
-                alternative_drivers.append({
-                    "driver_id": driver_info['id'],
-                    "driver_name": driver_info['name'],
-                    "is_available_for_slot": is_available_for_slot,
-                    "distance_to_start_km": distance_to_start_km,
-                    "time_to_start_minutes": time_to_start_minutes,
-                    "base_address_coords": driver_start_coords # ADDED: driver's base address coordinates
-                })
+        # Insertion costs (one matrix request per batch) only for the drivers nearest the task in a straight line
+        alternative_drivers = evaluate_nearest_drivers(nearest_driver_batches(task_coords, candidate_drivers), evaluate_batch, 5)
         
-        alternative_drivers.sort(key=lambda x: (not x['is_available_for_slot'], x['distance_to_start_km']))
+        alternative_drivers.sort(key=lambda x: x['insertion']['added_minutes'])
 
         return jsonify({
             "alternative_drivers": alternative_drivers[:5],
@@ -798,42 +3820,13 @@ def autocomplete_address():
         if not query:
             return jsonify({"suggestions": []})
 
-        url = "https://api.openrouteservice.org/geocode/autocomplete"
-        params = {
-            "api_key": ORS_API_KEY,
-            "text": query,
-            "boundary.country": "IL",
-            "lang": "he"
-        }
-        
-        params["point.lat"] = 31.771959
-        params["point.lon"] = 35.217018
-        params["sources"] = "osm"
-
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        local_suggestions = gazetteer.autocomplete(query)
+        if local_suggestions:
+            return jsonify({"suggestions": local_suggestions})
 
-        suggestions = []
-        if data.get('features'):
-            for feature in data['features']:
-                if feature.get('properties') and feature['properties'].get('label'):
-                    full_label = feature['properties']['label']
-                    match = re.match(r'^(.*?),\s*(.*?),\s*([^,]+),\s*Israel', full_label)
-                    if match:
-                        street_address = match.group(1)
-                        city = match.group(2)
-                        suggestions.append(f"{street_address}, {city}")
-                    else:
-                        parts = full_label.split(', ')
-                        if len(parts) >= 2:
-                            suggestions.append(f"{parts[0]}, {parts[1]}")
-                        else:
-                            suggestions.append(full_label)
-        
-        suggestions = list(dict.fromkeys(suggestions))[:10]
-        
-        return jsonify({"suggestions": suggestions})
+        # Keystroke bursts from several users often ask the same prefix at once; they share one request.
+        data = autocomplete_flight.do(query, lambda: _ors_autocomplete_request(query))
+        return jsonify({"suggestions": autocomplete_suggestions(data)})
 
     except requests.exceptions.Timeout:
         logger.error("AUTOCOMPLETE: Request timed out.")
@@ -857,7 +3850,6 @@ def request_ride():
         data = request.get_json()
         logger.info(f"Received ride data: {data}")
         
-        ride_id = f"ride_{len(mock_rides_data) + 1}"
         origin_address = data.get('origin_address')
         destination_address = data.get('destination_address')
         required_arrival_time_str = data.get('required_arrival_time')
@@ -870,13 +3862,9 @@ def request_ride():
             logger.error("Missing required ride parameters.")
             return jsonify({"error": "חסרים שדות חובה בבקשת נסיעה"}), 400
         
-        logger.info(f"Geocoding origin address: {origin_address}")
-        origin_coords = get_coordinates(origin_address)
-        logger.info(f"Origin coords: {origin_coords}")
-        
-        logger.info(f"Geocoding destination address: {destination_address}")
-        destination_coords = get_coordinates(destination_address)
-        logger.info(f"Destination coords: {destination_coords}")
+        logger.info(f"Geocoding origin address: {origin_address} and destination address: {destination_address}")
+        origin_coords, destination_coords = ors_map(get_coordinates, [origin_address, destination_address])
+        logger.info(f"Origin coords: {origin_coords}, Destination coords: {destination_coords}")
 
         if not origin_coords or not destination_coords:
             logger.error(f"REQUEST_RIDE: Failed to geocode origin ({origin_address}) or destination ({destination_address}).")
@@ -893,84 +3881,32 @@ def request_ride():
         ride_polyline_coords = directions_info['polyline_coords']
 
         try:
-            arrival_time_today = datetime.now().replace(
-                hour=int(required_arrival_time_str.split(':')[0]),
-                minute=int(required_arrival_time_str.split(':')[1]),
-                second=0, microsecond=0
-            )
-            estimated_start_time = arrival_time_today - timedelta(seconds=estimated_travel_time_seconds)
+            estimated_start_time, arrival_time_today = ride_time_window(required_arrival_time_str, estimated_travel_time_seconds)
             estimated_start_time_iso = estimated_start_time.isoformat()
             estimated_end_time_iso = arrival_time_today.isoformat()
         except ValueError:
             logger.error(f"REQUEST_RIDE: Invalid time format: {required_arrival_time_str}")
             return jsonify({"error": "פורמט שעת הגעה נדרשת אינו תקין"}), 400
 
-        new_ride = {
-            "id": ride_id,
-            "origin_address": origin_address,
-            "destination_address": destination_address,
-            "origin_coords": origin_coords,
-            "destination_coords": destination_coords,
-            "required_arrival_time": required_arrival_time_str,
-            "num_passengers": num_passengers,
-            "client_name": client_name,
-            "is_recurring": is_recurring,
-            "recurring_days": recurring_days,
-            "estimated_travel_time_seconds": estimated_travel_time_seconds,
-            "estimated_distance_meters": estimated_distance_meters,
-            "ride_polyline_coords": ride_polyline_coords,
-            "estimated_start_time_iso": estimated_start_time_iso,
-            "estimated_end_time_iso": estimated_end_time_iso,
-            "assigned_driver_id": None,
-            "assigned_driver_name": None,
-            "status": "pending"
-        }
-        mock_rides_data[ride_id] = new_ride
+        new_ride = store_new_ride(lambda ride_id: new_ride_record(ride_id, data, origin_coords, destination_coords, directions_info,
+                                                                  estimated_start_time, arrival_time_today))
+        ride_id = new_ride['id']
         logger.info(f"REQUEST_RIDE: New ride {ride_id} created and stored.")
 
-        # Process suggested drivers directly within request_ride
-        suggested_drivers = []
-        current_day_of_week = datetime.now().strftime('%A')
-        
         logger.info("Starting to evaluate suggested drivers.")
-        for driver_id, driver_info in mock_drivers_data.items():
-            if not driver_info.get('is_available', False):
-                continue
+        candidate_drivers = ride_candidate_drivers()
+        ride_window = (estimated_start_time.timestamp(), arrival_time_today.timestamp())
 
-            driver_start_coords = get_coordinates(driver_info['base_address'])
-            if not driver_start_coords:
-                logger.warning(f"Cannot geocode driver {driver_id} base address {driver_info['base_address']}.")
-                continue
-
-            logger.info(f"Evaluating driver {driver_info['name']} from {driver_start_coords} to origin {origin_coords}")
-            directions_info = get_directions_polyline(driver_start_coords, origin_coords)
-            
-            distance_to_start_km = 0
-            time_to_start_minutes = 0
-            polyline_to_origin_coords = []
-            
-            if directions_info:
-                distance_to_start_km = round(directions_info['distance_meters'] / 1000, 2)
-                time_to_start_minutes = round(directions_info['duration_seconds'] / 60, 2)
-                polyline_to_origin_coords = directions_info.get('polyline_coords', [])
-                logger.info(f"Driver {driver_info['name']} to origin: {time_to_start_minutes} min, {distance_to_start_km} km.")
-            else:
-                logger.warning(f"Could not get distance/time for driver {driver_info['name']} to origin. Using approximate values.")
-                dist_approx = math.sqrt(
-                    ((driver_start_coords[0] - origin_coords[0]) * 111.32)**2 + 
-                    ((driver_start_coords[1] - origin_coords[1]) * 111.32 * math.cos(math.radians(driver_start_coords[0])))**2
-                )
-                distance_to_start_km = round(dist_approx, 2)
-                time_to_start_minutes = round(dist_approx / 0.8, 2)
-            
-            task_duration_minutes_mock = 30
-            total_ride_time_for_driver = time_to_start_minutes + task_duration_minutes_mock
-            
-            current_daily_work_minutes = sum([entry.get('duration_minutes', 0) for entry in driver_info['schedule'].get(current_day_of_week, [])])
-            can_fit_in_schedule = (current_daily_work_minutes + total_ride_time_for_driver) <= (driver_info['max_daily_hours'] * 60)
-            
-            if can_fit_in_schedule:
-                suggested_drivers.append({
+        def evaluate_batch(batch):
+            suggestions = []
+            for insertion in rank_ride_insertions(batch, origin_coords, destination_coords, estimated_travel_time_seconds,
+                                                  estimated_distance_meters, window=ride_window):
+                if not insertion:
+                    continue
+                driver_info, driver_start_coords = insertion['driver_info'], insertion['base_coords']
+                logger.info(f"Driver {driver_info['name']} to origin: {insertion['time_to_start_minutes']} min, "
+                            f"{insertion['distance_to_start_km']} km, adds {insertion['insertion']['added_minutes']} min.")
+                suggestions.append({
                     "driver_id": driver_info['id'],
                     "driver_name": driver_info['name'],
                     "address": driver_info['base_address'],
@@ -981,16 +3917,28 @@ def request_ride():
                         "type": "sedan",
                         "capacity": 4
                     },
-                    "distance_to_start_km": distance_to_start_km,
-                    "time_to_start_minutes": time_to_start_minutes,
-                    "polyline_to_origin_coords": polyline_to_origin_coords
+                    "distance_to_start_km": insertion['distance_to_start_km'],
+                    "time_to_start_minutes": insertion['time_to_start_minutes'],
+                    "insertion": insertion['insertion'],
+                    "polyline_to_origin_coords": []
                 })
+            return suggestions
+
+        # Insertion costs (one matrix request per batch) only for the drivers nearest the origin in a straight line
+        suggested_drivers = evaluate_nearest_drivers(nearest_driver_batches(origin_coords, candidate_drivers), evaluate_batch, 5)
 
         logger.info(f"Initial list of potential suggested drivers: {len(suggested_drivers)} drivers.")
         
-        # Sort by distance and limit to top 5
-        suggested_drivers.sort(key=lambda x: x['distance_to_start_km'])
+        # Rank by the time the ride adds to the driver's day and limit to top 5
+        suggested_drivers.sort(key=lambda x: x['insertion']['added_minutes'])
         suggested_drivers = suggested_drivers[:5]
+
+        # Polylines to the origin only for the returned drivers, and only when asked for
+        if data.get('include_polylines', False):
+            driver_directions = ors_map(
+                lambda d: get_directions_polyline((d['latitude'], d['longitude']), origin_coords), suggested_drivers)
+            for driver, directions_info in zip(suggested_drivers, driver_directions):
+                driver['polyline_to_origin_coords'] = directions_info.get('polyline_coords', []) if directions_info else []
         
         logger.info(f"Final suggested drivers (top 5): {[d['driver_name'] for d in suggested_drivers]}")
 
@@ -1015,6 +3963,43 @@ def request_ride():
         logger.exception("Failed to process ride request due to unexpected error.")
         return jsonify({"error": "Failed to process ride request due to unexpected error", "details": str(e)}), 500
 
+@app.route('/api/import_rides', methods=['POST'])
+def import_rides():
+    # Streams a CSV (header row) or NDJSON upload in RIDE_IMPORT_BATCH_SIZE batches and streams back one
+    # NDJSON result per row, then a summary line.
+    import_format = request.args.get('format') or ('csv' if 'csv' in (request.mimetype or '') else 'ndjson')
+    if import_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be 'csv' or 'ndjson'"}), 400
+    logger.info(f"Received request to /api/import_rides ({import_format})")
+    stream = request.stream
+
+    def generate():
+        coords_by_address, directions_by_pair = {}, {}
+        counts = {"created": 0, "error": 0}
+        batch = []
+
+        def flush():
+            # Each batch gets its own deadline; one for the whole stream would run out on long uploads
+            ors_deadline.set(ors_deadline_after(ORS_BATCH_DEADLINE_SECONDS))
+            for result in import_ride_batch(batch, coords_by_address, directions_by_pair):
+                counts[result["status"]] += 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+            batch.clear()
+
+        try:
+            for row in _read_import_rows(stream, import_format):
+                batch.append(row)
+                if len(batch) >= RIDE_IMPORT_BATCH_SIZE:
+                    yield from flush()
+            yield from flush()
+        except Exception as e:
+            logger.error(f"IMPORT_RIDES: Import aborted: {e}", exc_info=True)
+            yield json.dumps({"error": "Import aborted due to an unexpected error", "details": str(e)}, ensure_ascii=False) + "\n"
+        logger.info(f"IMPORT_RIDES: {counts['created']} rides created, {counts['error']} rows rejected.")
+        yield json.dumps({"summary": {**counts, "unique_addresses": len(coords_by_address), "unique_routes": len(directions_by_pair)}}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/assign_ride', methods=['POST'])
 def assign_ride():
     logger.info("Received request to /api/assign_ride")
@@ -1029,12 +4014,6 @@ def assign_ride():
 
         if not ride_info or not driver_info:
             return jsonify({"error": "נסיעה או נהג לא נמצאו"}), 404
-        
-        ride_info['assigned_driver_id'] = driver_id
-        ride_info['assigned_driver_name'] = driver_info['name']
-        ride_info['status'] = "assigned"
-        ride_info['estimated_start_time_iso'] = estimated_start_time_iso
-        mock_rides_data[ride_id] = ride_info
 
         assigned_day = datetime.fromisoformat(estimated_start_time_iso).strftime('%A')
         
@@ -1048,11 +4027,7 @@ def assign_ride():
             if travel_to_origin_info:
                 total_task_duration_minutes += round(travel_to_origin_info['duration_seconds'] / 60, 2)
             else:
-                 dist_approx = math.sqrt(
-                    ((driver_base_coords[0] - origin_coords[0]) * 111.32)**2 + 
-                    ((driver_base_coords[1] - origin_coords[1]) * 111.32 * math.cos(math.radians(driver_base_coords[0])))**2
-                )
-                 total_task_duration_minutes += round(dist_approx / 0.8, 2)
+                total_task_duration_minutes += approximate_travel(driver_base_coords, origin_coords)[1]
 
             total_task_duration_minutes += round(ride_info['estimated_travel_time_seconds'] / 60, 2)
         else:
@@ -1062,16 +4037,22 @@ def assign_ride():
             "ride_id": ride_id,
             "origin_address": ride_info['origin_address'],
             "destination_address": ride_info['destination_address'],
+            "origin_coords": origin_coords,
+            "destination_coords": destination_coords,
             "start_time_iso": estimated_start_time_iso,
             "end_time_iso": (datetime.fromisoformat(estimated_start_time_iso) + timedelta(minutes=total_task_duration_minutes)).isoformat(),
             "duration_minutes": total_task_duration_minutes
         }
         
-        if assigned_day not in driver_info['schedule']:
-            driver_info['schedule'][assigned_day] = []
-        driver_info['schedule'][assigned_day].append(new_schedule_entry)
-        
-        driver_info['schedule'][assigned_day].sort(key=lambda x: datetime.fromisoformat(x['start_time_iso']))
+        if not schedule_index.add(driver_info, assigned_day, new_schedule_entry):
+            logger.warning(f"ASSIGN_RIDE: Ride {ride_id} overlaps an existing entry in driver {driver_id}'s schedule.")
+            return jsonify({"error": "לנהג כבר יש נסיעה חופפת בזמן זה"}), 409
+
+        ride_info['assigned_driver_id'] = driver_id
+        ride_info['assigned_driver_name'] = driver_info['name']
+        ride_info['status'] = "assigned"
+        ride_info['estimated_start_time_iso'] = estimated_start_time_iso
+        mock_rides_data[ride_id] = ride_info
 
         mock_drivers_data[driver_id] = driver_info
         logger.info(f"ASSIGN_RIDE: Ride {ride_id} assigned to driver {driver_id}. Driver schedule updated.")
@@ -1086,16 +4067,35 @@ def assign_ride():
         logger.error(f"ASSIGN_RIDE: Unexpected error: {e}", exc_info=True)
         return jsonify({"error": "Failed to assign ride due to unexpected error", "details": str(e)}), 500
 
+@app.route('/api/assign_pending_rides', methods=['POST'])
+def assign_pending_rides_endpoint():
+    logger.info("Received request to /api/assign_pending_rides")
+    try:
+        data = request.get_json() or {}
+        try:
+            on_date = datetime.fromisoformat(data['date']).date() if data.get('date') else datetime.now().date()
+            time_limit_override = float(data['time_limit_seconds']) if data.get('time_limit_seconds') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "'date' must be YYYY-MM-DD and 'time_limit_seconds' a number"}), 400
+        result = assign_pending_rides(on_date, ride_ids=data.get('ride_ids'), dry_run=bool(data.get('dry_run', False)),
+                                      time_limit_override=time_limit_override)
+        return jsonify(result)
+    except OptimizationError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except Exception as e:
+        logger.error(f"BULK_ASSIGN: Unexpected error: {e}", exc_info=True)
+        return jsonify({"error": "Bulk assignment failed due to an unexpected error", "details": str(e)}), 500
+
 @app.route('/api/drivers_with_schedules', methods=['GET'])
 def get_all_drivers_with_schedules():
     logger.info("Received request to /api/drivers_with_schedules")
     try:
         drivers_list = []
+        drivers = list(mock_drivers_data.values())
+        # Geocode all driver base addresses concurrently
+        all_base_coords = ors_map(get_coordinates, [d['base_address'] for d in drivers])
         
-        for driver_id, driver_info in mock_drivers_data.items():
-            # Get coordinates for driver's base address
-            base_address_coords = get_coordinates(driver_info['base_address'])
-            
+        for driver_info, base_address_coords in zip(drivers, all_base_coords):
             # Create driver dictionary with all required information
             driver_dict = {
                 "id": driver_info['id'],
@@ -1119,6 +4119,28 @@ def get_all_drivers_with_schedules():
             "details": str(e)
         }), 500
 
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        "geocode": geocode_cache.stats(),
+        "matrix_pairs": matrix_pair_cache.stats(),
+        "route_legs": route_leg_cache.stats(),
+        "route_geometry": route_geometry_cache.stats(),
+        "directions": directions_cache.stats(),
+        "gazetteer": gazetteer.stats(),
+        "precomputed_matrix": precomputed_matrix.stats(),
+        "ors_client": {
+            "circuit": ors_circuit.stats(),
+            "rate_limiters": {kind: limiter.stats() for kind, limiter in ors_rate_limiters.items()}
+        },
+        "singleflight": {
+            "geocode": geocode_flight.stats(),
+            "matrix": matrix_flight.stats(),
+            "directions": directions_flight.stats(),
+            "autocomplete": autocomplete_flight.stats()
+        }
+    })
+
 # --- Main execution (for Flask development server) ---
 if __name__ == '__main__':
     logger.info("Starting Flask application in development mode.")
@@ -0,0 +1,112 @@
+# ASGI entry point, e.g.:  uvicorn asgi:application --app-dir backend
+# Needs httpx and a2wsgi on top of the Flask app's own dependencies (see requirements.txt).
+#
+# Autocomplete is answered on the event loop. For the other I/O-heavy endpoints the ORS work (geocoding,
+# directions, matrices) is prefetched concurrently on the event loop into the shared caches, and then
+# the request goes to the unchanged Flask view, which only computes. Everything else goes straight to Flask.
+# Flask views run on a pool of ASGI_FLASK_WORKERS threads, so slow views don't queue behind each other.
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import app as backend
+
+flask_application = WSGIMiddleware(backend.app, workers=backend.ASGI_FLASK_WORKERS)
+
+PREFETCHERS = {
+    ('POST', '/api/request_ride'): backend.prefetch_request_ride,
+    ('POST', '/api/suggest_alternative_drivers'): backend.prefetch_alternative_drivers,
+    ('GET', '/api/drivers_with_schedules'): backend.prefetch_driver_bases,
+    ('POST', '/api/optimize_schedule'): backend.prefetch_optimization,
+}
+BATCH_PATHS = {'/api/optimize_schedule'}
+
+async def read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            return body
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+def replay_body(body: bytes):
+    # A receive() that hands the already-read body to the WSGI adapter.
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive
+
+async def send_json(send, status: int, payload):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')]
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(payload, ensure_ascii=False).encode('utf-8')})
+
+async def autocomplete_address(scope, send):
+    query = parse_qs(scope.get('query_string', b'').decode('utf-8')).get('query', [''])[0]
+    if not query:
+        await send_json(send, 200, {"suggestions": []})
+        return
+    local_suggestions = await asyncio.to_thread(backend.gazetteer.autocomplete, query)
+    if local_suggestions:
+        await send_json(send, 200, {"suggestions": local_suggestions})
+        return
+    token = backend.ors_deadline.set(backend.ors_deadline_after(backend.ORS_REQUEST_DEADLINE_SECONDS))
+    try:
+        data = await backend.get_async_ors_client().autocomplete(query)
+        await send_json(send, 200, {"suggestions": backend.autocomplete_suggestions(data)})
+    except Exception as e:
+        backend.logger.error(f"AUTOCOMPLETE: Failed: {e!r}")
+        await send_json(send, 500, {"error": "Autocomplete failed"})
+    finally:
+        backend.ors_deadline.reset(token)
+
+async def prefetch_then_forward(scope, receive, send, prefetch):
+    body = await read_body(receive)
+    budget = backend.ORS_BATCH_DEADLINE_SECONDS if scope['path'] in BATCH_PATHS else backend.ORS_REQUEST_DEADLINE_SECONDS
+    token = backend.ors_deadline.set(backend.ors_deadline_after(budget))
+    started = time.monotonic()
+    try:
+        await prefetch(json.loads(body) if body else {})
+        backend.logger.info(f"ASGI: Prefetched {scope['path']} in {time.monotonic() - started:.2f}s.")
+    except Exception as e:
+        backend.logger.warning(f"ASGI: Prefetch for {scope['path']} failed, the view fetches what it needs: {e!r}")
+    finally:
+        backend.ors_deadline.reset(token)
+    await flask_application(scope, replay_body(body), send)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await backend.close_async_ors_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'http':
+        route = (scope['method'], scope['path'])
+        if route == ('GET', '/api/autocomplete_address'):
+            await autocomplete_address(scope, send)
+            return
+        if route in PREFETCHERS:
+            await prefetch_then_forward(scope, receive, send, PREFETCHERS[route])
+            return
+    await flask_application(scope, receive, send)
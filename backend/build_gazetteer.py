@@ -0,0 +1,181 @@
+# Builds the offline gazetteer that app.py memory-maps from GAZETTEER_DIR.
+#
+#   python build_gazetteer.py israel-and-palestine-latest.osm.pbf [output_dir]
+#
+# Reads .osm / .osm.bz2 with the standard library; .pbf needs pyosmium (pip install osmium).
+# Address points are nodes and building ways with addr:street, addr:housenumber and addr:city;
+# Hebrew/Latin names come from the name, name:he and name:en tags of the matching streets and places.
+import bz2
+import os
+import re
+import shutil
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from collections import defaultdict
+
+import numpy as np
+from dotenv import load_dotenv
+
+from address_keys import GAZETTEER_FILES, gazetteer_prefix_key, normalize_address
+
+NAME_TAGS = ("name", "name:he", "name:en")
+PLACE_TYPES = {"city", "town", "village", "suburb", "hamlet"}
+HOUSE_NUMBER_RE = re.compile(r'^\d+')
+
+def is_hebrew(name: str) -> bool:
+    return any('\u0590' <= ch <= '\u05FF' for ch in name)
+
+class AddressCollector:
+    def __init__(self):
+        self.street_names = defaultdict(set)
+        self.city_names = defaultdict(set)
+        self.points = []
+
+    def node(self, lat: float, lon: float, tags: dict):
+        if tags.get("place") in PLACE_TYPES and tags.get("name"):
+            self.city_names[tags["name"]].update(tags[t] for t in NAME_TAGS if tags.get(t))
+        self._address(lat, lon, tags)
+
+    def way(self, coords: list, tags: dict):
+        if tags.get("highway") and tags.get("name"):
+            self.street_names[tags["name"]].update(tags[t] for t in NAME_TAGS if tags.get(t))
+        if coords:
+            self._address(sum(c[0] for c in coords) / len(coords), sum(c[1] for c in coords) / len(coords), tags)
+
+    def _address(self, lat: float, lon: float, tags: dict):
+        street, house_number, city = tags.get("addr:street"), tags.get("addr:housenumber"), tags.get("addr:city")
+        if street and house_number and city:
+            self.points.append((street, house_number, city, lat, lon))
+
+def read_osm_xml(path: str, collector: AddressCollector):
+    # Nodes precede ways in OSM files, so node coordinates are collected first and indexed once.
+    node_ids, node_coords = array('q'), array('d')
+    sorted_ids = sorted_coords = None
+    with (bz2.open(path, 'rb') if path.endswith('.bz2') else open(path, 'rb')) as source:
+        for _, element in ET.iterparse(source, events=('end',)):
+            if element.tag == 'node':
+                lat, lon = float(element.get('lat')), float(element.get('lon'))
+                node_ids.append(int(element.get('id')))
+                node_coords.extend((lat, lon))
+                tags = {t.get('k'): t.get('v') for t in element.iter('tag')}
+                if tags:
+                    collector.node(lat, lon, tags)
+                element.clear()
+            elif element.tag == 'way':
+                if sorted_ids is None:
+                    ids = np.frombuffer(node_ids, dtype=np.int64)
+                    order = np.argsort(ids)
+                    sorted_ids, sorted_coords = ids[order], np.frombuffer(node_coords, dtype=float).reshape(-1, 2)[order]
+                tags = {t.get('k'): t.get('v') for t in element.iter('tag')}
+                if tags.get('name') or tags.get('addr:street'):
+                    refs = np.array([int(nd.get('ref')) for nd in element.iter('nd')], dtype=np.int64)
+                    positions = np.clip(np.searchsorted(sorted_ids, refs), 0, max(0, len(sorted_ids) - 1))
+                    found = sorted_ids[positions] == refs if len(sorted_ids) else np.zeros(len(refs), dtype=bool)
+                    collector.way([tuple(c) for c in sorted_coords[positions[found]]], tags)
+                element.clear()
+
+def read_osm_pbf(path: str, collector: AddressCollector):
+    try:
+        import osmium
+    except ImportError:
+        sys.exit("Reading .pbf extracts needs pyosmium: pip install osmium")
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            if n.tags:
+                collector.node(n.location.lat, n.location.lon, dict(n.tags))
+
+        def way(self, w):
+            tags = dict(w.tags)
+            if tags.get('name') or tags.get('addr:street'):
+                collector.way([(nd.lat, nd.lon) for nd in w.nodes if nd.location.valid()], tags)
+
+    Handler().apply_file(path, locations=True)
+
+def save_strings(output_dir: str, name: str, offsets_name: str, strings: list):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    np.save(os.path.join(output_dir, f"{name}.npy"), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(output_dir, f"{offsets_name}.npy"), offsets)
+
+def build(collector: AddressCollector, output_dir: str):
+    addresses = {}
+    streets = defaultdict(dict)
+    for street, house_number, city, lat, lon in collector.points:
+        street_names = collector.street_names.get(street) or {street}
+        city_names = collector.city_names.get(city) or {city}
+        number = HOUSE_NUMBER_RE.match(house_number)
+        if number:
+            streets[(street, city)].setdefault(int(number.group()), (lat, lon))
+        for street_name in street_names | {street}:
+            for city_name in city_names | {city}:
+                addresses.setdefault(normalize_address(f"{street_name} {house_number}, {city_name}"), (lat, lon))
+
+    # Street keys point at their numbered points; their own coordinates are the points' mean.
+    entries = {key: (coords, -1) for key, coords in addresses.items()}
+    street_offsets, numbers, number_coords = [0], [], []
+    prefixes = {}
+    for street_id, ((street, city), points) in enumerate(streets.items()):
+        ordered = sorted(points.items())
+        numbers.extend(n for n, _ in ordered)
+        number_coords.extend(c for _, c in ordered)
+        street_offsets.append(len(numbers))
+        centroid = tuple(np.mean([c for _, c in ordered], axis=0).tolist())
+        name_pairs = [(street_name, city_name)
+                      for street_name in (collector.street_names.get(street) or set()) | {street}
+                      for city_name in (collector.city_names.get(city) or set()) | {city}]
+        for street_name, city_name in name_pairs:
+            entries[normalize_address(f"{street_name}, {city_name}")] = (centroid, street_id)
+        # Suggestions keep street and city in one script where the names allow it
+        labelled_pairs = [p for p in name_pairs if is_hebrew(p[0]) == is_hebrew(p[1])] or name_pairs
+        for street_name, city_name in labelled_pairs:
+            prefix = gazetteer_prefix_key(f"{street_name} {city_name}")
+            if prefix not in prefixes or prefixes[prefix][1] < len(ordered):
+                prefixes[prefix] = (f"{street_name}\t{city_name}", len(ordered))
+
+    keys = sorted(entries, key=lambda k: k.encode('utf-8'))
+    prefix_keys = sorted(prefixes, key=lambda k: k.encode('utf-8'))
+    os.makedirs(output_dir, exist_ok=True)
+    save_strings(output_dir, "keys", "key_offsets", keys)
+    np.save(os.path.join(output_dir, "key_coords.npy"), np.array([entries[k][0] for k in keys], dtype=np.float32).reshape(-1, 2))
+    np.save(os.path.join(output_dir, "key_streets.npy"), np.array([entries[k][1] for k in keys], dtype=np.int32))
+    np.save(os.path.join(output_dir, "street_offsets.npy"), np.array(street_offsets, dtype=np.int64))
+    np.save(os.path.join(output_dir, "numbers.npy"), np.array(numbers, dtype=np.int32))
+    np.save(os.path.join(output_dir, "number_coords.npy"), np.array(number_coords, dtype=np.float32).reshape(-1, 2))
+    save_strings(output_dir, "prefixes", "prefix_offsets", prefix_keys)
+    save_strings(output_dir, "labels", "label_offsets", [prefixes[p][0] for p in prefix_keys])
+    np.save(os.path.join(output_dir, "prefix_weights.npy"), np.array([prefixes[p][1] for p in prefix_keys], dtype=np.int32))
+    print(f"Gazetteer: {len(collector.points)} address points, {len(streets)} streets, {len(keys)} keys, "
+          f"{len(prefix_keys)} autocomplete prefixes.")
+
+def default_output_dir() -> str:
+    # app.py's GAZETTEER_DIR, read from the same environment without importing the app.
+    load_dotenv()
+    cache_dir = os.getenv('BACKEND_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+    return os.getenv('GAZETTEER_DIR', os.path.join(cache_dir, 'gazetteer'))
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit("usage: python build_gazetteer.py <extract.osm|.osm.bz2|.osm.pbf> [output_dir]")
+    source, output_dir = sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else default_output_dir()
+    collector = AddressCollector()
+    (read_osm_pbf if source.endswith('.pbf') else read_osm_xml)(source, collector)
+    # Build next to the live index and swap directories, so running servers never see half a gazetteer.
+    staging_dir = output_dir.rstrip('/') + '.building'
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    build(collector, staging_dir)
+    missing = [name for name in GAZETTEER_FILES if not os.path.exists(os.path.join(staging_dir, f"{name}.npy"))]
+    if missing:
+        sys.exit(f"Gazetteer build incomplete, missing {missing}")
+    previous_dir = output_dir.rstrip('/') + '.previous'
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    if os.path.isdir(output_dir):
+        os.replace(output_dir, previous_dir)
+    os.replace(staging_dir, output_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    print(f"Gazetteer written to {output_dir}; restart the servers to load it.")
+
+if __name__ == '__main__':
+    main()
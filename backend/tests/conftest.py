@@ -0,0 +1,140 @@
+import asyncio
+import copy
+import hashlib
+import math
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+import requests
+
+# app.py is imported as a top-level module, as the servers do, with its caches in a throwaway directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BACKEND_CACHE_DIR', tempfile.mkdtemp(prefix='backend-tests-'))
+
+import app  # noqa: E402
+
+def fake_coords(text: str):
+    digest = hashlib.md5(text.encode('utf-8')).digest()
+    return round(31.5 + digest[0] / 255, 6), round(34.6 + digest[1] / 255 * 0.6, 6)
+
+def straight_line_meters(a, b) -> float:
+    # a, b as ORS [lon, lat]
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[1], a[0], b[1], b[0]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h)) * 1.3
+
+class FakeResponse:
+    def __init__(self, status_code: int, payload):
+        self.status_code = status_code
+        self.headers = {}
+        self._payload = payload
+        self.text = str(payload)[:200]
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            error = requests.exceptions.HTTPError(str(self.status_code))
+            error.response = self
+            raise error
+
+class FakeOrs:
+    # Geocodes from places, or else a hash of the text; matrices and directions from straight lines at 15 m/s.
+    # Requests from the sync session go to calls, those from the async client to async_calls.
+    def __init__(self):
+        self.calls = []
+        self.async_calls = []
+        self.places = {}
+        self.fail = None
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, endpoint: str) -> int:
+        return sum(1 for url, _ in self.calls if endpoint in url)
+
+    def request(self, method, url, params=None, json=None, timeout=None, **kwargs):
+        with self._lock:
+            self.calls.append((url, json if json is not None else params))
+        if self.delay:
+            threading.Event().wait(self.delay)
+        return self.respond(url, params, json)
+
+    async def async_request(self, method, url, params=None, json=None, timeout=None, **kwargs):
+        with self._lock:
+            self.async_calls.append((url, json if json is not None else params))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.respond(url, params, json)
+
+    def respond(self, url, params, json):
+        if self.fail and self.fail(url):
+            return FakeResponse(503, {"error": "unavailable"})
+        if 'geocode/search' in url:
+            lat, lon = self.places.get(params['text']) or fake_coords(params['text'])
+            return FakeResponse(200, {"features": [{"geometry": {"coordinates": [lon, lat]}}]})
+        if 'matrix' in url:
+            locations = json['locations']
+            sources = json.get('sources') or list(range(len(locations)))
+            destinations = json.get('destinations') or list(range(len(locations)))
+            distances = [[straight_line_meters(locations[i], locations[j]) for j in destinations] for i in sources]
+            return FakeResponse(200, {"durations": [[d / 15 for d in row] for row in distances], "distances": distances})
+        if 'directions' in url:
+            coordinates = json['coordinates']
+            points, way_points, segments = [], [], []
+            for a, b in zip(coordinates, coordinates[1:]):
+                way_points.append(len(points))
+                points += [a, [(a[0] + b[0]) / 2, (a[1] + b[1]) / 2]]
+                segments.append({"distance": straight_line_meters(a, b), "duration": straight_line_meters(a, b) / 15})
+            points.append(coordinates[-1])
+            way_points.append(len(points) - 1)
+            total = sum(s["distance"] for s in segments)
+            return FakeResponse(200, {"routes": [{
+                "geometry": {"type": "LineString", "coordinates": points}, "way_points": way_points, "segments": segments,
+                "summary": {"distance": total, "duration": total / 15}}]})
+        return FakeResponse(404, {})
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    # app with fresh caches, quotas, breaker, indexes and mock data, so tests don't see each other's state.
+    registry = app.LocationRegistry(':memory:', app.LOCATION_REGISTRY_MIN_USES, app.LOCATION_REGISTRY_MAX_LOCATIONS)
+    precomputed = app.PrecomputedMatrix(str(tmp_path / 'precomputed_matrix.npy'), registry, 3600)
+    monkeypatch.setattr(precomputed, 'request_refresh', lambda: None)
+    fresh = {
+        'geocode_cache': app.GeocodeCache(':memory:', app.GEOCODE_NEGATIVE_TTL_SECONDS),
+        'gazetteer': app.Gazetteer(str(tmp_path / 'no-gazetteer')),
+        'matrix_pair_cache': app.MatrixPairCache(app.MATRIX_PAIR_CACHE_SIZE),
+        'location_registry': registry,
+        'precomputed_matrix': precomputed,
+        'route_leg_cache': app.LruCache(app.ROUTE_LEG_CACHE_SIZE),
+        'route_geometry_cache': app.LruCache(app.ROUTE_GEOMETRY_CACHE_SIZE),
+        'directions_cache': app.LruCache(app.DIRECTIONS_CACHE_SIZE),
+        'geocode_flight': app.SingleFlight(),
+        'matrix_flight': app.SingleFlight(),
+        'directions_flight': app.SingleFlight(),
+        'autocomplete_flight': app.SingleFlight(),
+        'ors_circuit': app.CircuitBreaker(app.ORS_CIRCUIT_FAILURE_THRESHOLD, app.ORS_CIRCUIT_RESET_SECONDS),
+        'ors_rate_limiters': {kind: app.TokenBucket(10_000, 10_000) for kind in ("matrix", "geocode", "directions")},
+        'schedule_index': app.ScheduleIndex(),
+        'driver_location_index': app.DriverLocationIndex(),
+        'mock_drivers_data': copy.deepcopy(app.mock_drivers_data),
+        'mock_rides_data': {},
+    }
+    for name, value in fresh.items():
+        monkeypatch.setattr(app, name, value)
+    monkeypatch.setattr(app, 'ORS_RETRY_BASE_SECONDS', 0.01)
+    app.ors_deadline.set(None)
+    return app
+
+@pytest.fixture
+def fake_ors(backend, monkeypatch):
+    ors = FakeOrs()
+    monkeypatch.setattr(backend.ors_session, 'request', ors.request)
+    if backend.httpx is not None:
+        async_client = backend.AsyncOrsClient()
+        monkeypatch.setattr(async_client._client, 'request', ors.async_request)
+        monkeypatch.setattr(backend, 'get_async_ors_client', lambda: async_client)
+    return ors
@@ -0,0 +1,25 @@
+import asyncio
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("a2wsgi")
+
+import app
+import asgi
+
+def test_forwarded_requests_run_concurrently(monkeypatch):
+    def slow_view():
+        time.sleep(1)
+        return app.jsonify({"ok": True})
+    monkeypatch.setitem(app.app.view_functions, 'get_cache_stats', slow_view)
+
+    async def fetch_twice():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.application), base_url="http://test") as client:
+            return await asyncio.gather(client.get("/api/cache_stats"), client.get("/api/cache_stats"))
+
+    started = time.monotonic()
+    responses = asyncio.run(fetch_twice())
+    assert [r.json() for r in responses] == [{"ok": True}, {"ok": True}]
+    assert time.monotonic() - started < 1.8
@@ -0,0 +1,72 @@
+from datetime import date, datetime
+
+import app
+from conftest import fake_coords
+
+MONDAY = date(2030, 1, 7)
+
+def near(base, north_km, east_km):
+    return [round(base[0] + north_km / 110.57, 6), round(base[1] + east_km / 94.4, 6)]
+
+def add_driver(driver_id, max_daily_hours=8, schedule=None):
+    base_address = f"{driver_id} base"
+    app.mock_drivers_data[driver_id] = {"id": driver_id, "name": driver_id, "base_address": base_address,
+                                        "max_daily_hours": max_daily_hours, "is_available": True,
+                                        "schedule": schedule or {}}
+    return fake_coords(base_address)
+
+def add_ride(ride_id, origin, destination, arrival):
+    app.mock_rides_data[ride_id] = {"id": ride_id, "origin_address": ride_id + " from", "destination_address": ride_id + " to",
+                                    "origin_coords": origin, "destination_coords": destination, "num_passengers": 1,
+                                    "estimated_end_time_iso": f"{MONDAY.isoformat()}T{arrival}:00", "status": "pending"}
+
+def test_assigned_entries_are_consistent(fake_ors):
+    app.mock_drivers_data.clear()
+    base = add_driver("d1")
+    add_driver("d2")
+    for i, arrival in enumerate(["09:00", "09:10", "13:00", "16:00"]):
+        add_ride(f"r{i}", near(base, 2 + i, 1), near(base, 6 + i, -2), arrival)
+    result = app.assign_pending_rides(MONDAY, time_limit_override=1)
+    assert sorted(a["ride_id"] for a in result["assigned"]) == ["r0", "r1", "r2", "r3"]
+    for assignment in result["assigned"]:
+        entry = assignment["schedule_entry"]
+        start, end = app.schedule_entry_bounds(entry)
+        assert app.schedule_entry_bounds({k: v for k, v in entry.items() if k != "end_time_iso"}) == (start, end)
+        ride = app.mock_rides_data[assignment["ride_id"]]
+        assert end <= datetime.fromisoformat(ride["estimated_end_time_iso"]).timestamp()
+        assert ride["estimated_start_time_iso"] == entry["start_time_iso"] and ride["status"] == "assigned"
+        assert entry in app.mock_drivers_data[assignment["driver_id"]]["schedule"]["Monday"]
+    for driver_info in app.mock_drivers_data.values():
+        bounds = sorted(app.schedule_entry_bounds(e) for e in driver_info["schedule"].get("Monday", []))
+        assert all(previous_end <= next_start for (_, previous_end), (next_start, _) in zip(bounds, bounds[1:]))
+
+def test_max_daily_hours_caps_workload_not_span(fake_ors):
+    app.mock_drivers_data.clear()
+    base = add_driver("d1", max_daily_hours=1)
+    add_ride("early", near(base, 1, 0), near(base, 4, 0), "08:00")
+    add_ride("late", near(base, 0, 1), near(base, 0, 4), "17:00")
+    result = app.assign_pending_rides(MONDAY, dry_run=True, time_limit_override=1)
+    assert sorted(a["ride_id"] for a in result["assigned"]) == ["early", "late"]
+    assert sum(a["schedule_entry"]["duration_minutes"] for a in result["assigned"]) <= 60
+
+def test_rides_beyond_the_workload_cap_stay_pending(fake_ors):
+    app.mock_drivers_data.clear()
+    base = add_driver("d1", max_daily_hours=0.25)
+    add_ride("short", near(base, 1, 0), near(base, 3, 0), "08:00")
+    add_ride("long", near(base, 1, 0), near(base, 30, 0), "12:00")
+    result = app.assign_pending_rides(MONDAY, time_limit_override=1)
+    assert [a["ride_id"] for a in result["assigned"]] == ["short"]
+    assert result["unassigned_ride_ids"] == ["long"]
+    assert app.mock_rides_data["long"]["status"] == "pending"
+
+def test_existing_entries_over_the_cap_are_kept(fake_ors):
+    app.mock_drivers_data.clear()
+    base = fake_coords("d1 base")
+    entry = {"ride_id": "old", "origin_address": "a", "destination_address": "b", "origin_coords": near(base, 1, 0),
+             "destination_coords": near(base, 40, 0), "start_time_iso": f"{MONDAY.isoformat()}T07:00:00",
+             "end_time_iso": f"{MONDAY.isoformat()}T08:30:00", "duration_minutes": 90}
+    add_driver("d1", max_daily_hours=0.5, schedule={"Monday": [entry]})
+    add_ride("new", near(base, 1, 1), near(base, 3, 1), "15:00")
+    result = app.assign_pending_rides(MONDAY, time_limit_override=1)
+    assert result["schedule_conflicts"] == []
+    assert result["unassigned_ride_ids"] == ["new"]
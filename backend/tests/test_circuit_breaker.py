@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+import requests
+
+import app
+from app import CircuitBreaker
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'monotonic', lambda: now[0])
+    return now
+
+def open_breaker(clock) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.stats() == {"open": True, "consecutive_failures": 2, "rejected": 1}
+
+def test_one_probe_after_reset_and_success_closes(clock):
+    breaker = open_breaker(clock)
+    clock[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open()
+    assert breaker.allow() and breaker.allow()
+
+def test_failed_probe_reopens(clock):
+    breaker = open_breaker(clock)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.allow()
+    clock[0] += 30
+    assert breaker.allow()
+
+def test_abandoned_probe_frees_the_slot(clock):
+    breaker = open_breaker(clock)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+
+@pytest.fixture
+def half_open(clock, monkeypatch):
+    breaker = open_breaker(clock)
+    clock[0] += 30
+    monkeypatch.setattr(app, 'ors_circuit', breaker)
+    monkeypatch.setattr(app, 'ors_rate_limiters', {"geocode": app.TokenBucket(1, 10)})
+    return breaker
+
+def test_deadline_does_not_take_the_probe(half_open, clock):
+    token = app.ors_deadline.set(clock[0] - 1)
+    try:
+        with pytest.raises(app.OrsDeadlineExceeded):
+            app.ors_request("geocode", "GET", app.ORS_GEOCODE_URL, timeout=1)
+    finally:
+        app.ors_deadline.reset(token)
+    assert half_open.allow()
+
+def test_probe_interrupted_by_local_error_is_released(half_open, monkeypatch):
+    def broken_request(*args, **kwargs):
+        raise requests.exceptions.InvalidURL("bad url")
+    monkeypatch.setattr(app.ors_session, 'request', broken_request)
+    with pytest.raises(requests.exceptions.InvalidURL):
+        app.ors_request("geocode", "GET", app.ORS_GEOCODE_URL, timeout=1)
+    assert half_open.allow()
+
+def test_probe_failure_is_not_retried_through_open_circuit(half_open, monkeypatch):
+    calls = []
+
+    def failing_request(*args, **kwargs):
+        calls.append(kwargs)
+        raise requests.exceptions.ConnectionError("refused")
+    monkeypatch.setattr(app.ors_session, 'request', failing_request)
+    monkeypatch.setattr(app.time, 'sleep', lambda seconds: None)
+    with pytest.raises(app.OrsUnavailable):
+        app.ors_request("geocode", "GET", app.ORS_GEOCODE_URL, timeout=1)
+    assert len(calls) == 1
+    assert half_open.is_open()
+
+def test_retry_after_is_capped():
+    assert app.ors_retry_delay(0, "2") == 2
+    assert app.ors_retry_delay(0, "86400") == app.ORS_RETRY_AFTER_MAX_SECONDS
+
+def test_async_probe_cancelled_is_released(half_open, monkeypatch):
+    pytest.importorskip("httpx")
+
+    async def cancelled_request(*args, **kwargs):
+        raise asyncio.CancelledError()
+    client = app.AsyncOrsClient()
+    monkeypatch.setattr(client._client, 'request', cancelled_request)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(client.request("geocode", "GET", app.ORS_GEOCODE_URL, timeout=1))
+    assert half_open.allow()
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import app
+from conftest import straight_line_meters
+
+def repair_case(task_coords):
+    depots = [(32.0, 34.80), (32.0, 35.00)]
+    points = app.project_coords(np.array(task_coords), 32.0)
+    centroids = app.project_coords(np.array(depots), 32.0)
+    task_cluster_km = np.sqrt(((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+    return depots, task_cluster_km
+
+def test_repair_inserts_dropped_task_without_cached_route_arcs(fake_ors):
+    # Nothing is in the pair cache, as after eviction or an approximated cluster matrix.
+    task_coords = [(32.01, 34.80), (32.02, 34.81), (32.01, 35.00), (32.02, 35.01)]
+    depots, task_cluster_km = repair_case(task_coords)
+    routes = [{"driver_id": "a", "cluster": 0, "depot": depots[0], "stops": [0, 1], "max_seconds": 8 * 3600},
+              {"driver_id": "b", "cluster": 1, "depot": depots[1], "stops": [2], "max_seconds": 8 * 3600}]
+    repaired, moved = app.repair_cluster_boundaries(routes, task_coords, np.full(4, 600.0), task_cluster_km, [3])
+    assert repaired == [3] and moved == []
+    assert routes[1]["stops"] in ([2, 3], [3, 2])
+
+def test_repair_moves_boundary_task_to_cheaper_route(fake_ors):
+    task_coords = [(32.01, 34.80), (32.00, 34.99), (32.01, 35.00)]
+    depots, task_cluster_km = repair_case(task_coords)
+    routes = [{"driver_id": "a", "cluster": 0, "depot": depots[0], "stops": [0, 1], "max_seconds": 8 * 3600},
+              {"driver_id": "b", "cluster": 1, "depot": depots[1], "stops": [2], "max_seconds": 8 * 3600}]
+    repaired, moved = app.repair_cluster_boundaries(routes, task_coords, np.zeros(3), task_cluster_km, [])
+    assert moved == [1] and repaired == []
+    assert routes[0]["stops"] == [0] and sorted(routes[1]["stops"]) == [1, 2]
+
+def test_route_output_reads_cached_legs_only(fake_ors):
+    depot = (32.0, 34.8)
+    task_coords = [(32.0 + i / 100, 34.8 + i / 200) for i in range(1, 6)]
+    route = {"driver_id": "a", "depot": depot, "stops": [0, 2, 4]}
+    app.build_matrix([depot] + task_coords, [depot] + task_coords)
+    calls = len(fake_ors.calls)
+    tasks = [{"id": f"t{i}"} for i in range(5)]
+    output = app._decomposed_route_output(route, tasks, task_coords, np.full(5, 60.0))
+    assert len(fake_ors.calls) == calls
+    path = [depot, task_coords[0], task_coords[2], task_coords[4], depot]
+    meters = sum(straight_line_meters((a[1], a[0]), (b[1], b[0])) for a, b in zip(path, path[1:]))
+    assert output["total_distance_km"] == pytest.approx(meters / 1000, abs=0.01)
+    assert output["assigned_task_ids_sequence"] == ["t0", "t2", "t4"]
+
+def decomposition_payload(tasks_per_side: int):
+    tasks = [{"id": f"w{i}", "address": f"west {i}", "service_duration_minutes": 5} for i in range(tasks_per_side)]
+    tasks += [{"id": f"e{i}", "address": f"east {i}", "service_duration_minutes": 5} for i in range(tasks_per_side)]
+    drivers = [{"id": d, "start_address": f"{d} base", "max_daily_hours": 10, "is_available": True} for d in ("d1", "d2")]
+    return {"tasks": tasks, "drivers": drivers, "decompose": True, "time_limit_seconds": 1, "plateau_seconds": 1}
+
+def test_decomposed_solve_assigns_every_task(fake_ors, monkeypatch):
+    monkeypatch.setattr(app, 'DECOMPOSITION_TASKS_PER_CLUSTER', 4)
+    monkeypatch.setattr(app, 'get_solver_process_pool', lambda: ThreadPoolExecutor(max_workers=2))
+    solution = app.optimize_decomposed(decomposition_payload(4))
+    assert len(solution["decomposition"]["clusters"]) == 2
+    assigned = [t for r in solution["drivers_assigned_routes"] for t in r["assigned_task_ids_sequence"]]
+    assert sorted(assigned + solution["unassigned_task_ids"]) == sorted(f"{s}{i}" for s in "we" for i in range(4))
+    assert solution["unassigned_task_ids"] == []
+
+def test_single_cluster_fallback_keeps_solver_configs(fake_ors, monkeypatch):
+    seen = {}
+    monkeypatch.setattr(app, 'build_vrp_instance', lambda data, on_progress=None: {"tasks": data['tasks']})
+    monkeypatch.setattr(app, 'solve_vrp_in_process_pool',
+                        lambda vrp_data, on_solution=None, solver_configs=None: seen.setdefault("configs", solver_configs))
+    configs = [app.parse_solver_config({"first_solution_strategy": "SAVINGS"})]
+    app.optimize_decomposed(decomposition_payload(2), solver_configs=configs)
+    assert seen["configs"] == configs
@@ -0,0 +1,40 @@
+import pytest
+
+import build_gazetteer
+from app import Gazetteer
+
+OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="32.0150" lon="34.7700"><tag k="place" v="city"/><tag k="name" v="חולון"/><tag k="name:en" v="Holon"/></node>
+ <node id="2" lat="32.0100" lon="34.7750"><tag k="addr:street" v="הרצל"/><tag k="addr:housenumber" v="2"/><tag k="addr:city" v="חולון"/></node>
+ <node id="3" lat="32.0120" lon="34.7770"><tag k="addr:street" v="הרצל"/><tag k="addr:housenumber" v="10"/><tag k="addr:city" v="חולון"/></node>
+ <node id="4" lat="32.0200" lon="34.7800"/>
+ <node id="5" lat="32.0210" lon="34.7810"/>
+ <way id="100"><nd ref="4"/><nd ref="5"/><tag k="highway" v="residential"/><tag k="name" v="הרצל"/><tag k="name:en" v="Herzl"/></way>
+</osm>
+"""
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    source = tmp_path / "extract.osm"
+    source.write_text(OSM, encoding="utf-8")
+    collector = build_gazetteer.AddressCollector()
+    build_gazetteer.read_osm_xml(str(source), collector)
+    build_gazetteer.build(collector, str(tmp_path / "gazetteer"))
+    return Gazetteer(str(tmp_path / "gazetteer"))
+
+def test_known_and_interpolated_numbers(gazetteer):
+    assert gazetteer.geocode("Herzl 10, Holon") == pytest.approx((32.012, 34.777))
+    assert gazetteer.geocode("חולון, הרצל 6") == pytest.approx((32.011, 34.776))
+
+def test_house_number_is_the_first_number(gazetteer):
+    assert gazetteer.geocode("הרצל 2, חולון 5800000") == pytest.approx((32.010, 34.775))
+
+def test_numbers_outside_the_street_are_misses(gazetteer):
+    assert gazetteer.geocode("הרצל 30, חולון") is None
+    assert gazetteer.stats()["misses"] == 1
+
+def test_unreadable_gazetteer_is_disabled(gazetteer, tmp_path):
+    (tmp_path / "gazetteer" / "keys.npy").write_bytes(b"not an array")
+    assert gazetteer.geocode("הרצל 2, חולון") is None
+    assert not gazetteer.stats()["enabled"]
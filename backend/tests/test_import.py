@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+def ride_row(origin="רחוב הרצל 1, חיפה", destination="רחוב יפו 200, ירושלים", **fields):
+    return {"origin_address": origin, "destination_address": destination, "required_arrival_time": "10:00",
+            "num_passengers": 2, "client_name": "test", **fields}
+
+def ndjson(rows) -> bytes:
+    return "".join((row if isinstance(row, str) else json.dumps(row, ensure_ascii=False)) + "\n" for row in rows).encode('utf-8')
+
+def result_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+def test_ndjson_import_reports_every_row_then_a_summary(client, fake_ors, backend):
+    body = ndjson([ride_row(), "{not json", ride_row(client_name=""), ride_row(date="2030-01-21"), [1, 2]])
+    response = client.post("/api/import_rides", data=body, content_type="application/x-ndjson")
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    *results, summary = result_lines(response)
+    assert [(r["row"], r["status"]) for r in sorted(results, key=lambda r: r["row"])] == [
+        (1, "created"), (2, "error"), (3, "error"), (4, "created"), (5, "error")]
+    assert "client_name" in next(r for r in results if r["row"] == 3)["error"]
+    assert summary == {"summary": {"created": 2, "error": 3, "unique_addresses": 2, "unique_routes": 1}}
+    assert len(backend.mock_rides_data) == 2
+    # The repeated addresses and route were looked up once for the whole import
+    assert fake_ors.count('geocode') == 2 and fake_ors.count('directions') == 1
+
+def test_csv_import_shares_lookups_across_batches(client, fake_ors, backend, monkeypatch):
+    monkeypatch.setattr(backend, 'RIDE_IMPORT_BATCH_SIZE', 2)
+    header = "origin_address,destination_address,required_arrival_time,num_passengers,client_name\n"
+    rows = "".join(f"origin {i % 2},destination,0{8 + i}:00,{i + 1},client {i}\n" for i in range(5))
+    response = client.post("/api/import_rides?format=csv", data=(header + rows).encode('utf-8'), content_type="text/csv")
+    *results, summary = result_lines(response)
+    assert all(r["status"] == "created" for r in results) and len(results) == 5
+    assert summary["summary"]["unique_routes"] == 2
+    assert fake_ors.count('geocode') == 3 and fake_ors.count('directions') == 2
+    assert sorted(backend.mock_rides_data) == [f"ride_{i}" for i in range(1, 6)]
+
+class CountingStream(io.BytesIO):
+    # The furthest the app has read into the upload
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed = self.tell()
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.consumed = self.tell()
+        return count
+
+    def readline(self, size=-1):
+        line = super().readline(size)
+        self.consumed = self.tell()
+        return line
+
+def test_results_stream_before_the_upload_is_read(client, fake_ors, backend, monkeypatch):
+    monkeypatch.setattr(backend, 'RIDE_IMPORT_BATCH_SIZE', 10)
+    body = ndjson(ride_row(client_name=f"client {i}") for i in range(2000))
+    stream = CountingStream(body)
+    response = client.post("/api/import_rides", input_stream=stream, content_length=len(body),
+                           content_type="application/x-ndjson", buffered=False)
+    lines = iter(response.response)
+    assert json.loads(next(lines))["status"] == "created"
+    assert stream.consumed < len(body) / 4
+    *_, summary = lines
+    assert json.loads(summary)["summary"]["created"] == 2000
+
+def test_unknown_format_is_rejected(client):
+    response = client.post("/api/import_rides?format=xlsx", data=b"")
+    assert response.status_code == 400
@@ -0,0 +1,142 @@
+import time
+
+import numpy as np
+import pytest
+
+import app
+from app import MatrixPairCache
+
+def keys(n, offset=0):
+    return [(32.0 + (i + offset) / 1000, 34.8) for i in range(n)]
+
+def test_pair_cache_round_trip_and_misses():
+    cache = MatrixPairCache(1000)
+    sources, destinations = keys(3), keys(2, offset=10)
+    durations = np.arange(6, dtype=float).reshape(3, 2)
+    durations[1, 1] = np.nan
+    cache.store(sources, destinations, durations, durations * 10)
+    found_durations, found_distances = cache.lookup(sources + keys(1, offset=50), destinations)
+    assert found_durations[:3].tolist()[0] == [0, 1] and found_durations[2].tolist() == [4, 5]
+    assert np.isnan(found_durations[1, 1]) and np.isnan(found_durations[3]).all()
+    assert found_distances[2, 1] == 50
+    assert cache.stats()["hits"] == 5 and cache.stats()["misses"] == 3
+
+def test_pair_cache_same_location_is_zero_and_not_stored():
+    cache = MatrixPairCache(1000)
+    locations = keys(3)
+    cache.store(locations, locations, np.full((3, 3), 7.0), np.full((3, 3), 7.0))
+    durations, _ = cache.lookup(locations, locations)
+    assert np.diag(durations).tolist() == [0, 0, 0]
+    assert cache.stats()["entries"] == 6
+
+def test_pair_cache_update_keeps_other_destinations():
+    cache = MatrixPairCache(1000)
+    source, destinations = keys(1), keys(3, offset=10)
+    cache.store(source, destinations, np.array([[1.0, 2.0, 3.0]]), np.array([[1.0, 2.0, 3.0]]))
+    cache.store(source, destinations[1:2], np.array([[20.0]]), np.array([[20.0]]))
+    durations, _ = cache.lookup(source, destinations)
+    assert durations.tolist() == [[1.0, 20.0, 3.0]]
+    assert cache.stats()["entries"] == 3
+
+def test_pair_cache_evicts_least_recently_used_rows():
+    cache = MatrixPairCache(4)
+    destinations = keys(2, offset=10)
+    for source in keys(3):
+        cache.store([source], destinations, np.ones((1, 2)), np.ones((1, 2)))
+    durations, _ = cache.lookup(keys(3), destinations)
+    assert np.isnan(durations[0]).all() and not np.isnan(durations[1:]).any()
+
+def test_pair_cache_large_matrix_is_vectorised():
+    cache = MatrixPairCache(2_000_000)
+    locations = keys(1000)
+    values = np.random.rand(1000, 1000)
+    started = time.perf_counter()
+    cache.store(locations, locations, values, values)
+    durations, _ = cache.lookup(locations, locations)
+    assert time.perf_counter() - started < 2
+    off_diagonal = ~np.eye(1000, dtype=bool)
+    assert np.array_equal(durations[off_diagonal], values[off_diagonal])
+
+def test_matrix_tiles_cover_the_block_within_the_element_limit(monkeypatch):
+    monkeypatch.setattr(app, 'ORS_MATRIX_MAX_ELEMENTS', 50)
+    sources, destinations = keys(13), keys(9, offset=100)
+    tiles = app.matrix_tiles(sources, destinations)
+    covered = np.zeros((13, 9), dtype=int)
+    for row, col, tile_sources, tile_destinations in tiles:
+        assert len(tile_sources) * len(tile_destinations) <= 50
+        assert tile_sources == sources[row:row + len(tile_sources)]
+        covered[row:row + len(tile_sources), col:col + len(tile_destinations)] += 1
+    assert (covered == 1).all()
+
+def test_tiled_matrix_matches_one_request_and_is_cached(fake_ors, monkeypatch):
+    locations = keys(12)
+    whole = app.build_matrix(locations, locations)
+    backend_cache = app.matrix_pair_cache
+    monkeypatch.setattr(app, 'matrix_pair_cache', MatrixPairCache(1000))
+    monkeypatch.setattr(app, 'ORS_MATRIX_MAX_ELEMENTS', 40)
+    calls_before = fake_ors.count('matrix')
+    tiled = app.build_matrix(locations, locations)
+    assert fake_ors.count('matrix') - calls_before == len(app.matrix_tiles(locations, locations)) > 1
+    np.testing.assert_allclose(tiled["durations"], whole["durations"])
+    calls_before = fake_ors.count('matrix')
+    app.build_matrix(locations[:5], locations[3:])
+    assert fake_ors.count('matrix') == calls_before
+    assert backend_cache.stats()["entries"] == 12 * 11
+
+def test_failed_tiles_fall_back_to_estimates_only_where_missing(fake_ors, monkeypatch):
+    locations = keys(6)
+    app.build_matrix(locations[:3], locations[:3])
+    fake_ors.fail = lambda url: 'matrix' in url
+    result = app.build_matrix(locations, locations, approximate_fallback=True)
+    assert result["approximate_pairs"] == 36 - 6 - 6
+    assert not np.isnan(result["durations"]).any()
+
+def requested_pairs(fake_ors) -> int:
+    return sum(len(body.get('sources') or body['locations']) * len(body.get('destinations') or body['locations'])
+               for url, body in fake_ors.calls if 'matrix' in url)
+
+def test_precompute_refresh_fetches_only_new_locations(fake_ors):
+    registry, precomputed = app.location_registry, app.precomputed_matrix
+    registry.register(keys(3), label="driver_base")
+    assert precomputed.refresh()
+    assert np.load(precomputed.path).shape == (2, 3, 3) and requested_pairs(fake_ors) == 9
+    registry.register(keys(2, offset=10), label="driver_base")
+    assert precomputed.refresh() and precomputed.size() == 5
+    # The old 3 x 3 block is copied from the current file
+    assert requested_pairs(fake_ors) == 9 + 25 - 9
+    assert not precomputed.refresh()
+    # The precompute job bypasses the pair cache so it doesn't evict request pairs
+    assert app.matrix_pair_cache.stats()["entries"] == 0
+
+def test_precomputed_pairs_are_served_without_ors(fake_ors):
+    locations = keys(4)
+    app.location_registry.register(locations[:3])
+    app.precomputed_matrix.refresh()
+    fake_ors.calls.clear()
+    result = app.build_matrix(locations[:3], locations[:3])
+    assert fake_ors.calls == [] and app.precomputed_matrix.stats()["pair_hits"] == 9
+    np.testing.assert_array_equal(result["durations"], np.load(app.precomputed_matrix.path)[0])
+    # Only the unregistered location's row and column go to ORS, without its distance to itself
+    app.build_matrix(locations, locations)
+    assert requested_pairs(fake_ors) == 16 - 9 - 1
+
+def test_other_processes_see_the_refreshed_matrix(fake_ors, tmp_path):
+    path = str(tmp_path / 'registry.sqlite3')
+    registry = app.LocationRegistry(path, 2, 100)
+    precomputed = app.PrecomputedMatrix(str(tmp_path / 'shared.npy'), registry, 3600)
+    registry.register(keys(3))
+    assert precomputed.refresh()
+    other_registry = app.LocationRegistry(path, 2, 100)
+    other = app.PrecomputedMatrix(precomputed.path, other_registry, 3600)
+    durations, distances = np.full((3, 3), np.nan), np.full((3, 3), np.nan)
+    other.fill(keys(3), keys(3), durations, distances)
+    assert not np.isnan(durations).any() and other.stats()["locations"] == 3
+
+def test_refresh_skips_while_another_process_extends(fake_ors):
+    fcntl = pytest.importorskip("fcntl")
+    app.location_registry.register(keys(3))
+    with open(app.precomputed_matrix.path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert not app.precomputed_matrix.refresh()
+    assert fake_ors.count('matrix') == 0
+    assert app.precomputed_matrix.refresh()
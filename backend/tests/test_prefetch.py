@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("a2wsgi")
+
+import app
+import asgi
+
+def call(method, path, **kwargs):
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.application), base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+def test_request_ride_view_needs_no_ors_calls_after_prefetch(fake_ors):
+    response = call("POST", "/api/request_ride", json={
+        "origin_address": "רחוב הרצל 1, חיפה", "destination_address": "רחוב יפו 200, ירושלים",
+        "required_arrival_time": "10:00", "num_passengers": 2, "client_name": "test"})
+    assert response.status_code == 200, response.text
+    assert response.json()["suggested_drivers"]
+    assert fake_ors.async_calls and fake_ors.calls == []
+
+def test_alternative_drivers_view_needs_no_ors_calls_after_prefetch(fake_ors):
+    response = call("POST", "/api/suggest_alternative_drivers", json={
+        "task_address": "רחוב הרצל 1, חיפה", "task_start_time_iso": "2024-03-18T12:00:00",
+        "task_end_time_iso": "2024-03-18T12:30:00", "exclude_driver_ids": ["driver1"]})
+    assert response.status_code == 200, response.text
+    assert all(d["driver_id"] != "driver1" for d in response.json()["alternative_drivers"])
+    assert fake_ors.async_calls and fake_ors.calls == []
+
+def test_driver_list_view_needs_no_ors_calls_after_prefetch(fake_ors):
+    response = call("GET", "/api/drivers_with_schedules")
+    assert response.status_code == 200 and all(d["base_address_coords"] for d in response.json())
+    assert fake_ors.calls == []
+
+def optimization_payload(**options):
+    tasks = [{"id": f"w{i}", "address": f"west {i}", "service_duration_minutes": 5} for i in range(4)]
+    tasks += [{"id": f"e{i}", "address": f"east {i}", "service_duration_minutes": 5} for i in range(4)]
+    drivers = [{"id": d, "start_address": f"{d} base", "max_daily_hours": 10, "is_available": True} for d in ("dw", "de")]
+    return {"tasks": tasks, "drivers": drivers, "defer_geometry": True, "time_limit_seconds": 1, "plateau_seconds": 0.5,
+            **options}
+
+@pytest.fixture
+def two_towns(fake_ors):
+    # Far enough apart that decomposition has no boundary tasks to repair
+    for i in range(4):
+        fake_ors.places[f"west {i}"] = (32.0 + i / 200, 34.80)
+        fake_ors.places[f"east {i}"] = (32.0 + i / 200, 35.20)
+    fake_ors.places["dw base"], fake_ors.places["de base"] = (32.0, 34.79), (32.0, 35.21)
+    return fake_ors
+
+def test_optimization_view_needs_no_ors_calls_after_prefetch(two_towns):
+    response = call("POST", "/api/optimize_schedule", json=optimization_payload())
+    assert response.status_code == 200, response.text
+    assert two_towns.async_calls and two_towns.calls == []
+
+def test_decomposed_optimization_needs_no_ors_calls_after_prefetch(two_towns, monkeypatch):
+    monkeypatch.setattr(app, 'DECOMPOSITION_TASKS_PER_CLUSTER', 4)
+    monkeypatch.setattr(app, 'get_solver_process_pool', lambda: ThreadPoolExecutor(max_workers=2))
+    response = call("POST", "/api/optimize_schedule", json=optimization_payload(decompose=True))
+    assert response.status_code == 200, response.text
+    assert len(response.json()["decomposition"]["clusters"]) == 2
+    assert sum('matrix' in url for url, _ in two_towns.async_calls) == 2
+    assert two_towns.calls == []
@@ -0,0 +1,99 @@
+import itertools
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app
+from app import DriverDaySchedule, ScheduleIndex
+from conftest import fake_coords
+
+def entry(ride_id, start, minutes, coords=(32.0, 34.8)):
+    start = datetime.fromisoformat(start)
+    return {"ride_id": ride_id, "start_time_iso": start.isoformat(),
+            "end_time_iso": (start + timedelta(minutes=minutes)).isoformat(), "duration_minutes": minutes,
+            "origin_coords": list(coords), "destination_coords": list(coords)}
+
+def ts(text):
+    return datetime.fromisoformat(text).timestamp()
+
+def test_add_rejects_overlaps_and_allows_touching_entries():
+    index = ScheduleIndex()
+    driver_info = {"id": "d1", "schedule": {}}
+    assert index.add(driver_info, "Monday", entry("a", "2030-01-07T09:00", 60))
+    assert not index.add(driver_info, "Monday", entry("b", "2030-01-07T09:30", 60))
+    assert index.add(driver_info, "Monday", entry("c", "2030-01-07T10:00", 30))
+    assert index.add(driver_info, "Monday", entry("d", "2030-01-07T08:00", 60))
+    assert [e["ride_id"] for e in driver_info["schedule"]["Monday"]] == ["d", "a", "c"]
+
+def test_overlaps_sees_entries_inside_a_long_one():
+    day = DriverDaySchedule([entry("long", "2030-01-07T08:00", 240), entry("short", "2030-01-07T09:00", 15)])
+    assert day.overlaps(ts("2030-01-07T10:00"), ts("2030-01-07T10:30"))
+    assert not day.overlaps(ts("2030-01-07T12:00"), ts("2030-01-07T12:30"))
+
+def test_running_maxima_match_a_scan_after_adds():
+    rng = random.Random(7)
+    minutes = lambda: rng.randrange(0, 24 * 60, 5)
+    day = DriverDaySchedule([])
+    for i in range(200):
+        start = datetime(2030, 1, 7) + timedelta(minutes=minutes())
+        day.add(entry(str(i), start.isoformat(), rng.randrange(5, 120, 5)))
+        assert day.max_ends == list(itertools.accumulate(day.ends, max))
+    for _ in range(200):
+        start = ts("2030-01-07T00:00") + minutes() * 60
+        end = start + rng.randrange(5, 60, 5) * 60
+        assert day.overlaps(start, end) == any(s < end and e > start for s, e in zip(day.starts, day.ends))
+
+def test_workload_counts_only_the_date():
+    index = ScheduleIndex()
+    driver_info = {"id": "d1", "schedule": {"Monday": [entry("last week", "2030-01-07T09:00", 120),
+                                                       entry("this week", "2030-01-14T09:00", 45)]}}
+    assert index.workload_minutes(driver_info, date(2030, 1, 14)) == 45
+    index.add(driver_info, "Monday", entry("later", "2030-01-14T13:00", 30))
+    assert index.workload_minutes(driver_info, date(2030, 1, 14)) == 75
+    assert index.workload_minutes(driver_info, date(2030, 1, 7)) == 120
+    assert index.workload_minutes(driver_info, date(2030, 1, 8)) == 0
+
+def test_index_rebuilds_when_the_list_changes_behind_it():
+    index = ScheduleIndex()
+    driver_info = {"id": "d1", "schedule": {"Monday": [entry("a", "2030-01-07T09:00", 60)]}}
+    assert index.overlaps(driver_info, "Monday", ts("2030-01-07T09:30"), ts("2030-01-07T09:45"))
+    driver_info["schedule"]["Monday"] = [entry("b", "2030-01-07T12:00", 60)]
+    assert not index.overlaps(driver_info, "Monday", ts("2030-01-07T09:30"), ts("2030-01-07T09:45"))
+
+@pytest.fixture
+def driver(backend):
+    base = fake_coords("d1 base")
+    driver_info = {"id": "d1", "name": "d1", "base_address": "d1 base", "max_daily_hours": 8, "is_available": True,
+                   "schedule": {"Monday": [entry("previous monday", "2030-01-07T09:00", 300, coords=(31.0, 35.5)),
+                                           entry("morning", "2030-01-14T08:00", 60, coords=(base[0] + 0.05, base[1]))]}}
+    return driver_info, base
+
+def test_insertion_goes_after_the_same_day_entry(fake_ors, driver):
+    driver_info, base = driver
+    window = (ts("2030-01-14T10:00"), ts("2030-01-14T10:20"))
+    pickup, dropoff = (base[0] + 0.06, base[1]), (base[0] + 0.09, base[1])
+    [result] = app.rank_ride_insertions([(driver_info, base)], pickup, dropoff, 1200, 5000, window)
+    insertion = result["insertion"]
+    assert insertion["after_ride_id"] == "morning" and insertion["before_ride_id"] is None
+    # From the morning entry's drop-off, not from base
+    assert result["distance_to_start_km"] < 2
+    assert insertion["workload_minutes_after"] == pytest.approx(60 + insertion["added_minutes"], abs=0.01)
+
+def test_other_dates_are_ignored(fake_ors, driver):
+    driver_info, base = driver
+    driver_info["max_daily_hours"] = 2
+    window = (ts("2030-01-21T15:00"), ts("2030-01-21T15:20"))
+    pickup, dropoff = (base[0] + 0.01, base[1]), (base[0] + 0.02, base[1])
+    [result] = app.rank_ride_insertions([(driver_info, base)], pickup, dropoff, 600, 2000, window)
+    assert result["insertion"]["after_ride_id"] is None
+    assert result["insertion"]["workload_minutes_after"] == pytest.approx(result["insertion"]["added_minutes"], abs=0.01)
+
+def test_overlapping_or_over_cap_insertions_are_rejected(fake_ors, driver):
+    driver_info, base = driver
+    pickup, dropoff = (base[0] + 0.01, base[1]), (base[0] + 0.02, base[1])
+    overlapping = (ts("2030-01-14T08:30"), ts("2030-01-14T08:50"))
+    assert app.rank_ride_insertions([(driver_info, base)], pickup, dropoff, 600, 2000, overlapping) == [None]
+    driver_info["max_daily_hours"] = 1
+    later = (ts("2030-01-14T12:00"), ts("2030-01-14T12:20"))
+    assert app.rank_ride_insertions([(driver_info, base)], pickup, dropoff, 600, 2000, later) == [None]
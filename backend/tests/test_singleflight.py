@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app
+from app import SingleFlight
+
+def run_concurrently(flight, key, fn, callers=4):
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        futures = [pool.submit(flight.do, key, fn) for _ in range(callers)]
+        return [f.exception() or f.result() for f in futures]
+
+def slow(result, started=None, seconds=0.2):
+    def fn():
+        if started:
+            started.set()
+        time.sleep(seconds)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fn
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    results = run_concurrently(flight, "k", lambda: calls.append(1) or time.sleep(0.2) or "value")
+    assert results == ["value"] * 4 and len(calls) == 1
+    assert flight.stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+    assert flight.do("k", lambda: "again") == "again"
+
+def test_waiters_get_the_leaders_error():
+    flight = SingleFlight()
+    results = run_concurrently(flight, "k", slow(ValueError("boom")))
+    assert all(isinstance(r, ValueError) for r in results)
+
+def test_waiter_gives_up_at_its_own_deadline(backend):
+    flight = SingleFlight()
+    started = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, "k", slow("value", started, seconds=0.5))
+        started.wait()
+        token = app.ors_deadline.set(time.monotonic() + 0.05)
+        try:
+            waited = time.monotonic()
+            with pytest.raises(app.OrsDeadlineExceeded):
+                flight.do("k", lambda: "unused")
+            assert time.monotonic() - waited < 0.3
+        finally:
+            app.ors_deadline.reset(token)
+        assert leader.result() == "value"
+
+def test_concurrent_geocodes_of_one_address_make_one_request(fake_ors):
+    fake_ors.delay = 0.2
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(app.get_coordinates, ["רחוב הרצל 1, חיפה"] * 4))
+    assert len(set(results)) == 1 and results[0] is not None
+    assert fake_ors.count('geocode/search') == 1
+
+def test_async_waiters_share_one_task_and_respect_deadlines(backend):
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.3)
+            return "value"
+
+        async def impatient():
+            app.ors_deadline.set(time.monotonic() + 0.05)
+            return await flight.do_async("k", fetch)
+
+        leader = asyncio.ensure_future(flight.do_async("k", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do_async("k", fetch))
+        with pytest.raises(app.OrsDeadlineExceeded):
+            await asyncio.create_task(impatient())
+        assert await leader == await waiter == "value"
+        assert len(calls) == 1 and flight.stats()["in_flight"] == 0
+    asyncio.run(scenario())
+
+def test_thread_waits_for_an_async_leader(backend):
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.3)
+        return "value"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do_async("k", fetch))
+        await asyncio.sleep(0)
+        from_thread = await asyncio.to_thread(flight.do, "k", lambda: calls.append(2) or "thread")
+        return await leader, from_thread
+    assert asyncio.run(scenario()) == ("value", "value")
+    assert calls == [1]
+
+def test_coroutine_waits_for_a_thread_leader(backend):
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    async def fetch():
+        calls.append("async")
+        return "async"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, "k", slow("thread", started, seconds=0.3))
+        started.wait()
+        assert asyncio.run(flight.do_async("k", fetch)) == "thread"
+        assert leader.result() == "thread"
+    assert calls == []
+
+def test_async_leader_errors_reach_thread_waiters(backend):
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.2)
+        raise ValueError("boom")
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do_async("k", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.to_thread(flight.do, "k", lambda: "unused")
+        return await asyncio.gather(leader, waiter, return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in asyncio.run(scenario()))
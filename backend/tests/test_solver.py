@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+
+import app
+
+def vrp_instance(num_tasks: int, num_vehicles: int = 3, seed: int = 0, **options):
+    rng = np.random.default_rng(seed)
+    coords = [(32.0 + lat, 34.8 + lon) for lat, lon in rng.random((num_tasks + 1, 2)) / 10]
+    points = np.array(coords)
+    meters = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)) * 111_000
+    return {
+        "locations_coords": coords,
+        "num_vehicles": num_vehicles,
+        "depot_index": 0,
+        "service_durations_seconds": [0] + [300] * num_tasks,
+        "time_matrix_seconds": meters / 15,
+        "distance_matrix_meters": meters,
+        "max_daily_seconds": 8 * 3600,
+        "task_original_ids": [f"t{i}" for i in range(num_tasks)],
+        "driver_original_ids": [f"d{v}" for v in range(num_vehicles)],
+        **options
+    }
+
+class FakeCost:
+    def __init__(self, value):
+        self.value = value
+
+    def Value(self):
+        return self.value
+
+class FakeRouting:
+    def __init__(self):
+        self.cost = FakeCost(100)
+
+    def CostVar(self):
+        return self.cost
+
+def test_plateau_limit_fires_without_new_solutions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'monotonic', lambda: now[0])
+    routing = FakeRouting()
+    monitor = app.SolutionMonitor(routing, None, {"task_original_ids": []}, plateau_seconds=2)
+    assert not monitor.plateau_reached()
+    monitor()
+    now[0] += 1.5
+    routing.cost.value = 90
+    monitor()
+    now[0] += 1.5
+    assert not monitor.plateau_reached()
+    # No further solution callbacks at all: the limit alone ends the search
+    now[0] += 1
+    assert monitor.plateau_reached() and monitor.stopped_on_plateau
+    assert monitor.summary()["improvements"] == 2
+
+def test_solve_stops_on_plateau_before_the_time_limit():
+    started = time.monotonic()
+    solution = app.solve_vrp(vrp_instance(40, time_limit_seconds=30, plateau_seconds=0.5))
+    assert time.monotonic() - started < 10
+    assert solution["stopped_early"] and solution["objective"] is not None
+    assigned = [t for r in solution["drivers_assigned_routes"] for t in r["assigned_task_ids_sequence"]]
+    assert sorted(assigned + solution["unassigned_task_ids"]) == sorted(f"t{i}" for i in range(40))
+
+def test_no_plateau_runs_to_the_time_limit():
+    solution = app.solve_vrp(vrp_instance(10, time_limit_seconds=1, plateau_seconds=0))
+    assert not solution["stopped_early"]
+
+def previous_plan(routes):
+    return {"drivers_assigned_routes": [{"driver_id": d, "assigned_task_ids_sequence": ids} for d, ids in routes.items()]}
+
+def test_warm_start_keeps_previous_order_and_inserts_new_tasks():
+    data = vrp_instance(6, num_vehicles=2)
+    previous = previous_plan({"d0": ["t2", "gone", "t0"], "d1": ["t1", "t3"], "retired": ["t4"]})
+    routes, warm_start = app.warm_start_routes(previous, data)
+    # Nodes are task index + 1; t4 and t5 aren't in the previous routes and are inserted where cheapest
+    assert [node for node in routes[0] if node in (3, 1)] == [3, 1]
+    assert [node for node in routes[1] if node in (2, 4)] == [2, 4]
+    assert sorted(node for route in routes for node in route) == [1, 2, 3, 4, 5, 6]
+    assert warm_start["kept_task_count"] == 4
+    assert sorted(warm_start["dropped_task_ids"]) == ["gone", "t4"]
+    assert sorted(warm_start["inserted_task_ids"]) == ["t4", "t5"]
+
+def test_warm_start_leaves_out_tasks_no_route_has_room_for():
+    data = vrp_instance(3, num_vehicles=1, max_daily_seconds=1200)
+    routes, warm_start = app.warm_start_routes(previous_plan({"d0": ["t0"]}), data)
+    assert routes == [[1]] and warm_start["inserted_task_ids"] == []
+
+def test_co_located_tasks_share_one_warm_start_node():
+    data = vrp_instance(2, num_vehicles=1, task_original_ids=["a", "b", "c"], node_task_ids=[["a", "b"], ["c"]])
+    routes, warm_start = app.warm_start_routes(previous_plan({"d0": ["b", "a", "c"]}), data)
+    assert routes == [[1, 2]] and warm_start["kept_task_count"] == 3
+
+def test_solve_from_previous_solution_is_no_worse():
+    data = vrp_instance(30, time_limit_seconds=5, plateau_seconds=0.5)
+    first = app.solve_vrp(data)
+    routes, warm_start = app.warm_start_routes(first, data)
+    resolved = app.solve_vrp({**data, "initial_routes": routes, "warm_start": warm_start,
+                              "time_limit_seconds": 1, "plateau_seconds": 0.2})
+    assert resolved["warm_start"]["kept_task_count"] == 30
+    assert resolved["objective"] <= first["objective"]
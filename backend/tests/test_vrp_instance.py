@@ -0,0 +1,36 @@
+import numpy as np
+
+import app
+
+def test_dedupe_maps_nearby_points_onto_the_first_location():
+    # 0.0001 degrees of latitude is about 11 m
+    points = [(32.0, 34.8), (32.0001, 34.8), (32.01, 34.8), (32.0, 34.8), (32.0103, 34.8)]
+    locations, location_of = app.dedupe_locations(points, merge_meters=25)
+    assert locations == [(32.0, 34.8), (32.01, 34.8), (32.0103, 34.8)]
+    assert location_of == [0, 0, 1, 0, 2]
+    assert app.dedupe_locations(points, merge_meters=0)[1] == [0, 1, 2, 0, 3]
+
+def optimization_request(fake_ors):
+    fake_ors.places.update({"a": (32.0, 34.8), "b": (32.0, 34.8), "c": (32.0001, 34.8), "d": (32.05, 34.85),
+                            "base": (32.05, 34.85)})
+    tasks = [{"id": name, "address": name, "service_duration_minutes": minutes} for name, minutes in zip("abcd", (5, 10, 15, 20))]
+    drivers = [{"id": "driver", "start_address": "base", "max_daily_hours": 8, "is_available": True}]
+    return {"tasks": tasks, "drivers": drivers, "time_limit_seconds": 1, "plateau_seconds": 0.2}
+
+def test_co_located_tasks_share_a_node(fake_ors, backend):
+    vrp_data = backend.build_vrp_instance(optimization_request(fake_ors))
+    assert vrp_data["node_task_ids"] == [["a", "b", "c"], ["d"]]
+    assert vrp_data["service_durations_seconds"] == [0, 30 * 60, 20 * 60]
+    assert vrp_data["location_dedup"] == {"tasks": 4, "matrix_locations": 2, "nodes": 3}
+    # The matrix is requested over the two distinct places; the depot and task d share one of them
+    (url, body), = [call for call in fake_ors.calls if 'matrix' in call[0]]
+    assert len(body["locations"]) == 2
+    time_matrix = np.asarray(vrp_data["time_matrix_seconds"])
+    assert time_matrix.shape == (3, 3) and time_matrix[0, 2] == 0 and time_matrix[0, 1] > 0
+
+def test_solution_lists_every_task_at_a_merged_node(fake_ors, backend):
+    solution = backend.solve_vrp(backend.build_vrp_instance(optimization_request(fake_ors)))
+    sequence, = [route["assigned_task_ids_sequence"] for route in solution["drivers_assigned_routes"]]
+    assert sorted(sequence) == ["a", "b", "c", "d"]
+    assert sequence.index("d") in (0, 3)
+    assert solution["location_dedup"]["nodes"] == 3 and solution["unassigned_task_ids"] == []
@@ -124,6 +124,7 @@ const RequestRidePage: React.FC = () => {
           client_name: clientName,
           is_recurring: false,
           recurring_days: [],
+          include_polylines: true,
         }),
       });
 